@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts.models import Friendship
+from accounts.services import FriendshipService, FriendSuggestionEngine
+from users.models import Friendship as FriendEdge
+
+class Command(BaseCommand):
+    help = 'Fold legacy users.Friendship pairs into accounts.Friendship and rebuild the friend edge index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows to process per transaction',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        self.stdout.write('Linking legacy friendships...')
+        linked = 0
+        last_id = 0
+        while True:
+            edges = list(
+                FriendEdge.objects.filter(link__isnull=True, id__gt=last_id)
+                .order_by('id').values_list('id', 'user_id', 'friend_id')[:batch_size]
+            )
+            if not edges:
+                break
+            last_id = edges[-1][0]
+            pairs = {(min(u, f), max(u, f)) for _, u, f in edges if u != f}
+            self._adopt_pairs(pairs)
+            linked += len(pairs)
+
+        self.stdout.write('Rebuilding edges for accepted friendships...')
+        synced = 0
+        last_id = 0
+        while True:
+            batch = list(
+                Friendship.objects.filter(status='accepted', id__gt=last_id).order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            FriendshipService.sync_edges(batch)
+            synced += len(batch)
+
+        # Self-links and anything else that couldn't be tied to a canonical row
+        orphans, _ = FriendEdge.objects.filter(link__isnull=True).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Linked {linked} legacy pairs, synced {synced} friendships, removed {orphans} orphan edges'
+        ))
+
+    def _adopt_pairs(self, pairs):
+        """
+        Make sure every (low_id, high_id) pair has an accepted canonical row.
+        The edges themselves are linked by the accepted-row pass in handle().
+        """
+        user_ids = {uid for pair in pairs for uid in pair}
+        existing = {}
+        for friendship in Friendship.objects.filter(requester_id__in=user_ids, receiver_id__in=user_ids):
+            key = (min(friendship.requester_id, friendship.receiver_id),
+                   max(friendship.requester_id, friendship.receiver_id))
+            if key in pairs:
+                existing[key] = friendship
+
+        with transaction.atomic():
+            Friendship.objects.filter(
+                id__in=[f.id for f in existing.values() if f.status != 'accepted']
+            ).update(status='accepted')
+            Friendship.objects.bulk_create([
+                Friendship(requester_id=a, receiver_id=b, status='accepted')
+                for a, b in pairs - set(existing)
+            ])
+
+        FriendSuggestionEngine.mark_stale(user_ids)
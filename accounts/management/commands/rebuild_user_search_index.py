@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from accounts.services import UserSearchIndex
+
+class Command(BaseCommand):
+    help = 'Rebuild the user search-term index used by friend search'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of users to re-index per transaction',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding user search index...')
+        total = UserSearchIndex.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Indexed {total} users'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from accounts.services import FriendSuggestionEngine
+from accounts.models import User
+
+class Command(BaseCommand):
+    help = 'Recompute friend suggestions for users whose groups, expenses or friends changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of users to refresh per batch',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Mark every user stale first (full rebuild)',
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            FriendSuggestionEngine.mark_stale(User.objects.values_list('id', flat=True))
+
+        self.stdout.write('Refreshing friend suggestions...')
+        total = FriendSuggestionEngine.refresh_stale(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Refreshed {total} users'))
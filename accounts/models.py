@@ -7,6 +7,8 @@ class User(AbstractUser):
     profile_pic = models.ImageField(upload_to='profile_pics/', null=True, blank=True)
     default_currency = models.CharField(max_length=10, default='INR')
     timezone = models.CharField(max_length=50, default='Asia/Kolkata')
+    # Set by DeletionService.soft_delete_user; the row is removed by reap_deleted
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
 
     def __str__(self):
         return self.get_full_name() or self.username
@@ -41,4 +43,61 @@ class Friendship(models.Model):
             raise ValidationError("You cannot send a friend request to yourself.")
 
     def __str__(self):
-        return f"{self.requester} -> {self.receiver} ({self.status})"
\ No newline at end of file
+        return f"{self.requester} -> {self.receiver} ({self.status})"
+
+class UserSearchTerm(models.Model):
+    """Normalized words from a user's username, name and email, for prefix search"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='search_terms',
+        on_delete=models.CASCADE
+    )
+    term = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('term', 'user')
+
+    def __str__(self):
+        return f"{self.term} -> {self.user_id} ({self.weight})"
+
+
+class FriendSuggestion(models.Model):
+    """Precomputed top-K friend suggestions per user, refreshed by refresh_friend_suggestions"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='friend_suggestions',
+        on_delete=models.CASCADE
+    )
+    candidate = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+    score = models.PositiveIntegerField(default=0)
+    shared_groups = models.PositiveIntegerField(default=0)
+    shared_expenses = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'candidate')
+        indexes = [
+            models.Index(fields=['user', '-score']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.candidate_id} ({self.score})"
+
+
+class SuggestionRefresh(models.Model):
+    """Users whose friend suggestions are stale and waiting to be recomputed"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        related_name='+',
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    marked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"refresh suggestions for {self.user_id}"
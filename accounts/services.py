@@ -0,0 +1,367 @@
+from collections import Counter
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Q, When
+from core.pagination import paginate_keyset
+from core.search import normalize, tokenize, prefix_q, MAX_TERM_LENGTH
+from expenses.models import ExpenseParticipant
+from groups.services import Membership
+from users.models import Friendship as FriendEdge
+from .models import UserSearchTerm, Friendship, FriendSuggestion, SuggestionRefresh
+
+User = get_user_model()
+
+# Fields that feed the search index, and how strongly a match on each ranks
+SEARCH_FIELD_WEIGHTS = {
+    'username': 3,
+    'first_name': 2,
+    'last_name': 2,
+    'email': 1,
+}
+MAX_QUERY_TERMS = 4
+# Lifts an exact term match above every prefix completion, whatever the field weight
+EXACT_MATCH_BONUS = max(SEARCH_FIELD_WEIGHTS.values()) + 1
+
+
+def query_words(query):
+    """Search words of `query`; addresses are indexed whole, so they stay one word"""
+    query = (query or '').strip()
+    if '@' in query:
+        return [normalize(query)[:MAX_TERM_LENGTH]]
+    return tokenize(query)[:MAX_QUERY_TERMS]
+
+
+class UserSearchIndex:
+    """
+    Maintains and queries UserSearchTerm, the prefix index behind friend
+    search and the typeahead endpoint.
+
+    Lookups are half-open range scans on the (term, user) index, so cost
+    depends on the page size rather than on the number of users.
+    """
+
+    @staticmethod
+    def terms_for(user):
+        """{term: weight} for one user; the strongest field wins when words repeat"""
+        weighted = {}
+
+        def add(term, weight):
+            term = term[:MAX_TERM_LENGTH]
+            if term and weighted.get(term, 0) < weight:
+                weighted[term] = weight
+
+        for field, weight in SEARCH_FIELD_WEIGHTS.items():
+            value = getattr(user, field) or ''
+            if field == 'email':
+                # Index the address and its local part, not the shared domain
+                local = value.split('@', 1)[0]
+                add(normalize(value), weight)
+                for term in tokenize(local):
+                    add(term, weight)
+                continue
+            if field == 'username':
+                add(normalize(value), weight)
+            for term in tokenize(value):
+                add(term, weight)
+        return weighted
+
+    @staticmethod
+    def sync_users(users):
+        users = list(users)
+        if not users:
+            return
+        rows = [
+            UserSearchTerm(user_id=user.id, term=term, weight=weight)
+            for user in users
+            for term, weight in UserSearchIndex.terms_for(user).items()
+        ]
+        with transaction.atomic():
+            UserSearchTerm.objects.filter(user_id__in=[u.id for u in users]).delete()
+            UserSearchTerm.objects.bulk_create(rows)
+
+    @staticmethod
+    def sync_user(user):
+        UserSearchIndex.sync_users([user])
+
+    @staticmethod
+    def rebuild(batch_size=1000):
+        """Re-index every user in id order, `batch_size` at a time. Returns the count."""
+        total = 0
+        last_id = 0
+        while True:
+            batch = list(
+                User.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', *SEARCH_FIELD_WEIGHTS)[:batch_size]
+            )
+            if not batch:
+                return total
+            UserSearchIndex.sync_users(batch)
+            total += len(batch)
+            last_id = batch[-1].id
+
+    @staticmethod
+    def search(query, limit=10, exclude_ids=()):
+        """
+        Users matching every word of `query` as a prefix, best match first.
+
+        The longest word drives a range scan of the index; every other word
+        and `exclude_ids` are applied in the same query, and users are ranked
+        there before the limit is taken: an exact term match above longer
+        completions, then field weight, then username.
+        """
+        words = query_words(query)
+        if not words or limit <= 0:
+            return []
+        driver = max(words, key=len)
+
+        terms = UserSearchTerm.objects.filter(prefix_q('term', driver))
+        if exclude_ids:
+            terms = terms.exclude(user_id__in=list(exclude_ids))
+        for word in words:
+            if word != driver:
+                terms = terms.filter(user_id__in=UserSearchTerm.objects.filter(prefix_q('term', word)).values('user_id'))
+
+        ranked = list(
+            terms.values('user_id')
+            .annotate(score=Max(Case(
+                When(term=driver, then=F('weight') + EXACT_MATCH_BONUS),
+                default=F('weight'),
+                output_field=IntegerField(),
+            )))
+            .order_by('-score', 'user__username')
+            .values_list('user_id', flat=True)[:limit]
+        )
+        users = User.objects.in_bulk(ranked)
+        return [users[user_id] for user_id in ranked if user_id in users]
+
+MEMBER_PICKER_PAGE_SIZE = 20
+MAX_MEMBER_PICKER_PAGE_SIZE = 50
+
+
+class MemberPicker:
+    """
+    Candidates for member selectors: the user's friends plus everyone they
+    already share a group with. Pages are keyset-ordered by username and
+    filtered through the search index, so no selector ever loads the whole
+    user table.
+    """
+
+    @staticmethod
+    def scope_q(user):
+        friend_ids = FriendEdge.objects.filter(user=user).values('friend_id')
+        co_member_ids = Membership.objects.filter(
+            group_id__in=Membership.objects.filter(user=user).values('group_id')
+        ).values('user_id')
+        # Soft-deleted accounts keep their memberships until reap_deleted runs
+        return (
+            (Q(id__in=friend_ids) | Q(id__in=co_member_ids))
+            & ~Q(id=user.pk) & Q(is_active=True, deleted_at__isnull=True)
+        )
+
+    @staticmethod
+    def page(user, query='', cursor=None, page_size=MEMBER_PICKER_PAGE_SIZE, exclude_group=None):
+        """(users, next_cursor) for one page of candidates matching every word of `query`"""
+        users = User.objects.filter(MemberPicker.scope_q(user))
+        for word in query_words(query):
+            users = users.filter(
+                id__in=UserSearchTerm.objects.filter(prefix_q('term', word)).values('user_id')
+            )
+        if exclude_group is not None:
+            users = users.exclude(id__in=Membership.objects.filter(group_id=exclude_group.pk).values('user_id'))
+
+        users = users.only('id', 'username', 'first_name', 'last_name')
+        return paginate_keyset(users, ('username', 'id'), cursor, page_size, descending=False)
+
+    @staticmethod
+    def allowed_ids(user, ids):
+        """The subset of `ids` that `user` may add to a group, in one query"""
+        ids = {int(i) for i in ids if str(i).isdigit()}
+        if not ids:
+            return set()
+        return set(
+            User.objects.filter(MemberPicker.scope_q(user), id__in=ids).values_list('id', flat=True)
+        )
+
+
+# Suggestions kept per user, and how much each kind of shared history counts
+SUGGESTIONS_PER_USER = 20
+SHARED_GROUP_WEIGHT = 3
+SHARED_EXPENSE_WEIGHT = 1
+
+
+class FriendSuggestionEngine:
+    """
+    Ranks people a user might know by shared groups and shared expenses.
+
+    Scores are precomputed into FriendSuggestion (top SUGGESTIONS_PER_USER
+    per user). Membership, expense and friendship changes only mark the
+    affected users in SuggestionRefresh; refresh_friend_suggestions
+    recomputes those users, so reads never do the ranking work.
+    """
+
+    @staticmethod
+    def mark_stale(user_ids):
+        SuggestionRefresh.objects.bulk_create(
+            [SuggestionRefresh(user_id=uid) for uid in set(user_ids) if uid is not None],
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def mark_group_stale(group_ids):
+        """Every member of these groups may now rank the others differently"""
+        FriendSuggestionEngine.mark_stale(
+            Membership.objects.filter(group_id__in=list(group_ids)).values_list('user_id', flat=True)
+        )
+
+    @staticmethod
+    def score_candidates(user):
+        """Counter of candidate id -> (score, shared_groups, shared_expenses)"""
+        group_ids = Membership.objects.filter(user_id=user.id).values('group_id')
+        shared_groups = Counter(dict(
+            Membership.objects.filter(group_id__in=group_ids)
+            .exclude(user_id=user.id)
+            .values('user_id')
+            .annotate(n=Count('group_id'))
+            .values_list('user_id', 'n')
+        ))
+
+        expense_ids = ExpenseParticipant.objects.filter(user_id=user.id).values('expense_id')
+        shared_expenses = Counter(dict(
+            ExpenseParticipant.objects.filter(expense_id__in=expense_ids)
+            .exclude(user_id=user.id)
+            .order_by()
+            .values('user_id')
+            .annotate(n=Count('expense_id'))
+            .values_list('user_id', 'n')
+        ))
+
+        # Anyone already connected (or with a request in flight) isn't a suggestion
+        connected = set()
+        for requester_id, receiver_id in Friendship.objects.filter(
+            Q(requester_id=user.id) | Q(receiver_id=user.id)
+        ).exclude(status='rejected').values_list('requester_id', 'receiver_id'):
+            connected.update((requester_id, receiver_id))
+
+        scores = {}
+        for candidate_id in (set(shared_groups) | set(shared_expenses)) - connected:
+            groups = shared_groups[candidate_id]
+            expenses = shared_expenses[candidate_id]
+            scores[candidate_id] = (
+                groups * SHARED_GROUP_WEIGHT + expenses * SHARED_EXPENSE_WEIGHT,
+                groups,
+                expenses,
+            )
+        return scores
+
+    @staticmethod
+    def refresh_users(user_ids):
+        """Recompute and store the top-K suggestions for each user. Returns the ids refreshed."""
+        refreshed = set()
+        for user in User.objects.filter(id__in=list(user_ids)).only('id'):
+            scores = FriendSuggestionEngine.score_candidates(user)
+            top = sorted(scores.items(), key=lambda item: (-item[1][0], item[0]))[:SUGGESTIONS_PER_USER]
+            with transaction.atomic():
+                FriendSuggestion.objects.filter(user_id=user.id).delete()
+                FriendSuggestion.objects.bulk_create([
+                    FriendSuggestion(
+                        user_id=user.id,
+                        candidate_id=candidate_id,
+                        score=score,
+                        shared_groups=groups,
+                        shared_expenses=expenses,
+                    )
+                    for candidate_id, (score, groups, expenses) in top
+                ])
+                SuggestionRefresh.objects.filter(user_id=user.id).delete()
+            refreshed.add(user.id)
+        return refreshed
+
+    @staticmethod
+    def refresh_stale(batch_size=200):
+        """Work through SuggestionRefresh in batches. Returns the number of users refreshed."""
+        total = 0
+        while True:
+            batch = list(
+                SuggestionRefresh.objects.order_by('marked_at').values_list('user_id', flat=True)[:batch_size]
+            )
+            if not batch:
+                return total
+            refreshed = FriendSuggestionEngine.refresh_users(batch)
+            # Markers for users deleted since being marked
+            SuggestionRefresh.objects.filter(user_id__in=set(batch) - refreshed).delete()
+            total += len(batch)
+
+    @staticmethod
+    def for_user(user, limit=10):
+        return [
+            s.candidate for s in
+            FriendSuggestion.objects.filter(
+                user=user, candidate__is_active=True, candidate__deleted_at__isnull=True
+            )
+            .select_related('candidate')
+            .order_by('-score', 'candidate_id')[:limit]
+        ]
+
+
+class FriendshipService:
+    """
+    accounts.Friendship is the canonical record of a friendship (one row per
+    pair, with request status). users.Friendship mirrors each accepted row as
+    two directed edges so friend lists never have to OR across directions.
+    """
+
+    @staticmethod
+    def pair_q(user_a, user_b):
+        a, b = getattr(user_a, 'pk', user_a), getattr(user_b, 'pk', user_b)
+        return Q(requester_id=a, receiver_id=b) | Q(requester_id=b, receiver_id=a)
+
+    @staticmethod
+    def sync_edges(friendships):
+        """Bring the edge index in line with these canonical rows"""
+        friendships = list(friendships)
+        if not friendships:
+            return
+        accepted = [f for f in friendships if f.status == 'accepted']
+        with transaction.atomic():
+            FriendEdge.objects.filter(
+                link_id__in=[f.id for f in friendships if f.status != 'accepted']
+            ).delete()
+            FriendEdge.objects.bulk_create(
+                [
+                    FriendEdge(user_id=a, friend_id=b, link_id=f.id)
+                    for f in accepted
+                    for a, b in ((f.requester_id, f.receiver_id), (f.receiver_id, f.requester_id))
+                ],
+                update_conflicts=True,
+                unique_fields=['user', 'friend'],
+                update_fields=['link'],
+            )
+
+    @staticmethod
+    def befriend(user_a, user_b):
+        """Make the two users friends, accepting any request already between them"""
+        friendship = Friendship.objects.filter(FriendshipService.pair_q(user_a, user_b)).first()
+        if friendship is None:
+            friendship = Friendship(requester=user_a, receiver=user_b, status='accepted')
+            friendship.full_clean()
+            friendship.save()
+        elif friendship.status != 'accepted':
+            friendship.status = 'accepted'
+            friendship.save(update_fields=['status', 'updated_at'])
+        return friendship
+
+    @staticmethod
+    def unfriend(user_a, user_b):
+        # Edges cascade with the canonical row
+        Friendship.objects.filter(FriendshipService.pair_q(user_a, user_b)).delete()
+
+    @staticmethod
+    def friends(user):
+        """Accepted friends of `user`, read straight off the edge index"""
+        return User.objects.filter(friends_of__user=user)
+
+    @staticmethod
+    def are_friends(user_a, user_b):
+        return FriendEdge.objects.filter(
+            user_id=getattr(user_a, 'pk', user_a), friend_id=getattr(user_b, 'pk', user_b)
+        ).exists()
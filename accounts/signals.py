@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from expenses.models import Expense
+from groups.models import Group
+from groups.signals import members_changed
+from .models import Friendship
+from .services import UserSearchIndex, FriendSuggestionEngine, FriendshipService, SEARCH_FIELD_WEIGHTS
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, created, update_fields=None, **kwargs):
+    """Keep UserSearchTerm in step with the searchable fields"""
+    # Logins save last_login alone; don't rewrite the index for those
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELD_WEIGHTS):
+        return
+    UserSearchIndex.sync_user(instance)
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Group membership changes reshuffle suggestions for everyone in the group"""
+    if action == 'pre_clear':
+        # The rows are gone by post_clear, so note who was affected now
+        if reverse:
+            instance._suggestion_group_ids = list(instance.member_groups.values_list('id', flat=True))
+        else:
+            instance._suggestion_user_ids = list(instance.members.values_list('id', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        group_ids = pk_set if pk_set is not None else instance.__dict__.pop('_suggestion_group_ids', [])
+        user_ids = [instance.pk]
+    else:
+        group_ids = [instance.pk]
+        user_ids = pk_set if pk_set is not None else instance.__dict__.pop('_suggestion_user_ids', [])
+
+    FriendSuggestionEngine.mark_stale(user_ids)
+    FriendSuggestionEngine.mark_group_stale(group_ids)
+
+
+@receiver(members_changed, sender=Group)
+def members_bulk_changed(sender, group, added, removed, **kwargs):
+    # Removed users are no longer found through the group, so mark them directly
+    FriendSuggestionEngine.mark_stale(removed)
+    FriendSuggestionEngine.mark_group_stale([group.pk])
+
+
+@receiver(post_save, sender=Friendship)
+def friendship_saved(sender, instance, **kwargs):
+    FriendshipService.sync_edges([instance])
+    FriendSuggestionEngine.mark_stale([instance.requester_id, instance.receiver_id])
+
+
+@receiver(post_delete, sender=Friendship)
+def friendship_deleted(sender, instance, **kwargs):
+    FriendSuggestionEngine.mark_stale([instance.requester_id, instance.receiver_id])
+
+
+@receiver(pre_delete, sender=Expense)
+def expense_deleted(sender, instance, **kwargs):
+    FriendSuggestionEngine.mark_stale(instance.participants.values_list('user_id', flat=True))
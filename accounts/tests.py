@@ -1,3 +1,224 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIClient
+from core.deletion import DeletionService
+from expenses.models import Expense, ExpenseShare
+from expenses.services import ExpenseIndex
+from groups.models import Group
+from users.models import Friendship as FriendEdge
+from .models import FriendSuggestion, Friendship, SuggestionRefresh, User
+from .services import FriendSuggestionEngine, FriendshipService, MemberPicker, UserSearchIndex
 
-# Create your tests here.
+
+class UserSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sam = User.objects.create_user('sam')
+        cls.samantha = User.objects.create_user('samantha')
+        cls.bob = User.objects.create_user('bob', password='pw', first_name='Sam')
+        cls.zed = User.objects.create_user('zed', password='pw', email='sam@example.com')
+
+    def search(self, query, **kwargs):
+        return [u.username for u in UserSearchIndex.search(query, **kwargs)]
+
+    def test_exact_matches_rank_above_completions_then_by_weight(self):
+        self.assertEqual(self.search('sam'), ['sam', 'bob', 'zed', 'samantha'])
+        self.assertEqual(self.search('sam', limit=2), ['sam', 'bob'])
+
+    def test_excluded_users_do_not_use_up_the_limit(self):
+        crowd = [User.objects.create_user(f'sam{i:02}') for i in range(30)]
+        excluded = [u.id for u in crowd] + [self.sam.id, self.bob.id, self.zed.id]
+        self.assertEqual(self.search('sam', limit=1, exclude_ids=excluded), ['samantha'])
+
+    def test_every_word_is_matched_before_the_limit(self):
+        for i in range(30):
+            User.objects.create_user(f'sam{i:02}')
+        jones = User.objects.create_user('samz', password='pw', last_name='Jones')
+        self.assertEqual(self.search('sam jo', limit=1), [jones.username])
+        self.assertEqual(self.search('jo sam'), [jones.username])
+
+
+class MemberPickerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.carol = User.objects.create_user('carol')
+        cls.dave = User.objects.create_user('dave')
+        cls.frank = User.objects.create_user('frank')
+        cls.pals = [User.objects.create_user(f'pal{i}') for i in range(4)]
+        for pal in cls.pals:
+            Friendship.objects.create(requester=cls.alice, receiver=pal, status='accepted')
+        Friendship.objects.create(requester=cls.alice, receiver=cls.frank, status='pending')
+        cls.flat = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.flat.members.add(cls.alice, cls.carol)
+        cls.club = Group.objects.create(name='Club', created_by=cls.dave)
+        cls.club.members.add(cls.dave, cls.pals[0])
+
+    def setUp(self):
+        self.client.force_login(self.alice)
+
+    def picker(self, **params):
+        return self.client.get('/groups/member-picker/', params)
+
+    def test_only_friends_and_co_members_are_allowed(self):
+        ids = [self.alice.id, self.carol.id, self.dave.id, self.frank.id, self.pals[0].id, 'x']
+        self.assertEqual(MemberPicker.allowed_ids(self.alice, ids), {self.carol.id, self.pals[0].id})
+
+        usernames = [u['username'] for u in self.picker().json()['results']]
+        self.assertEqual(usernames, ['carol', 'pal0', 'pal1', 'pal2', 'pal3'])
+
+    def test_exclude_group_must_be_the_requesters(self):
+        self.assertEqual(self.picker(group=self.club.id).status_code, 404)
+        self.assertEqual(self.picker(group='abc').status_code, 400)
+        usernames = [u['username'] for u in self.picker(group=self.flat.id).json()['results']]
+        self.assertNotIn('carol', usernames)
+
+    def test_soft_deleted_users_are_left_out(self):
+        DeletionService.soft_delete_user(self.carol)
+        DeletionService.soft_delete_user(self.pals[1])
+        usernames = [u['username'] for u in self.picker().json()['results']]
+        self.assertEqual(usernames, ['pal0', 'pal2', 'pal3'])
+        self.assertEqual(MemberPicker.allowed_ids(self.alice, [self.carol.id, self.pals[0].id]), {self.pals[0].id})
+
+        FriendSuggestionEngine.refresh_users([self.pals[0].id])
+        self.assertEqual([u.username for u in FriendSuggestionEngine.for_user(self.pals[0])], ['dave'])
+        DeletionService.soft_delete_user(self.dave)
+        self.assertEqual(FriendSuggestionEngine.for_user(self.pals[0]), [])
+
+    def test_keyset_pages_cover_every_candidate_once(self):
+        seen, cursor = [], None
+        while True:
+            data = self.picker(page_size=2, q='pal', **({'cursor': cursor} if cursor else {})).json()
+            self.assertLessEqual(len(data['results']), 2)
+            seen.extend(u['username'] for u in data['results'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['pal0', 'pal1', 'pal2', 'pal3'])
+
+
+class FriendSuggestionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        cls.carol = User.objects.create_user('carol')
+        cls.dave = User.objects.create_user('dave')
+        cls.erin = User.objects.create_user('erin')
+        Friendship.objects.create(requester=cls.erin, receiver=cls.alice, status='accepted')
+        cls.flat = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.flat.members.add(cls.alice, cls.bob)
+        cls.share(cls.carol, cls.erin)
+        cls.share(cls.carol)
+        cls.share(cls.dave)
+
+    @classmethod
+    def share(cls, *users):
+        expense = Expense.objects.create(
+            description='Taxi', amount=Decimal('10.00'), paid_by=cls.alice, date=date(2024, 1, 1),
+        )
+        for user in users:
+            ExpenseShare.objects.create(expense=expense, user=user, amount=Decimal('5.00'))
+        ExpenseIndex.sync_expenses([expense])
+        return expense
+
+    def suggested(self, user):
+        return [u.username for u in FriendSuggestionEngine.for_user(user)]
+
+    def test_shared_groups_outweigh_shared_expenses(self):
+        FriendSuggestionEngine.refresh_users([self.alice.id])
+        self.assertEqual(self.suggested(self.alice), ['bob', 'carol', 'dave'])
+        self.assertEqual(
+            list(FriendSuggestion.objects.filter(user=self.alice).order_by('-score')
+                 .values_list('score', 'shared_groups', 'shared_expenses')),
+            [(3, 1, 0), (2, 0, 2), (1, 0, 1)],
+        )
+
+    def test_changes_mark_users_stale_until_refreshed(self):
+        self.assertEqual(FriendSuggestionEngine.refresh_stale(batch_size=2), 5)
+        self.assertFalse(SuggestionRefresh.objects.exists())
+
+        FriendSuggestionEngine.mark_stale([self.bob.id, self.bob.id, None])
+        self.flat.members.add(self.dave)
+        self.assertEqual(
+            set(SuggestionRefresh.objects.values_list('user_id', flat=True)),
+            {self.alice.id, self.bob.id, self.dave.id},
+        )
+        # Reads serve the stored ranking until the refresh runs
+        self.assertEqual(self.suggested(self.alice), ['bob', 'carol', 'dave'])
+
+        self.assertEqual(FriendSuggestionEngine.refresh_stale(), 3)
+        self.assertEqual(self.suggested(self.alice), ['dave', 'bob', 'carol'])
+        self.assertEqual(self.suggested(self.bob), ['alice', 'dave'])
+        self.assertFalse(SuggestionRefresh.objects.exists())
+
+    def test_indexing_an_expense_rescores_its_participants(self):
+        FriendSuggestionEngine.refresh_stale()
+        self.share(self.carol)
+        self.share(self.carol)
+        self.assertEqual(
+            set(SuggestionRefresh.objects.values_list('user_id', flat=True)), {self.alice.id, self.carol.id},
+        )
+
+        FriendSuggestionEngine.refresh_stale()
+        self.assertEqual(self.suggested(self.alice), ['carol', 'bob', 'dave'])
+        self.assertEqual(self.suggested(self.carol), ['alice', 'erin'])
+
+
+class FriendshipEdgeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        cls.carol = User.objects.create_user('carol')
+        cls.dave = User.objects.create_user('dave')
+
+    def edges(self):
+        return set(FriendEdge.objects.values_list('user__username', 'friend__username', 'link_id'))
+
+    def respond(self, friendship, verb):
+        client = APIClient()
+        client.force_authenticate(friendship.receiver)
+        return client.post(f'/api/accounts/friends/{friendship.id}/{verb}/')
+
+    def test_accepting_adds_both_edges_and_rejecting_removes_them(self):
+        request = Friendship.objects.create(requester=self.alice, receiver=self.bob)
+        self.assertEqual(self.edges(), set())
+
+        self.assertEqual(self.respond(request, 'accept').status_code, 200)
+        self.assertEqual(self.edges(), {('alice', 'bob', request.id), ('bob', 'alice', request.id)})
+        self.assertTrue(FriendshipService.are_friends(self.bob, self.alice))
+        self.assertEqual(list(FriendshipService.friends(self.alice)), [self.bob])
+
+        self.assertEqual(self.respond(request, 'reject').status_code, 200)
+        self.assertEqual(self.edges(), set())
+        self.assertFalse(FriendshipService.are_friends(self.alice, self.bob))
+
+    def test_deleting_the_friendship_removes_its_edges(self):
+        FriendshipService.befriend(self.alice, self.bob)
+        FriendshipService.befriend(self.alice, self.carol)
+        FriendshipService.unfriend(self.bob, self.alice)
+        self.assertEqual({(u, f) for u, f, _ in self.edges()}, {('alice', 'carol'), ('carol', 'alice')})
+
+    def test_migrate_friendships_folds_legacy_rows_into_one_per_pair(self):
+        pending = Friendship.objects.create(requester=self.carol, receiver=self.alice)
+        FriendEdge.objects.bulk_create([
+            FriendEdge(user=self.alice, friend=self.bob),
+            FriendEdge(user=self.bob, friend=self.alice),
+            FriendEdge(user=self.alice, friend=self.carol),
+            FriendEdge(user=self.dave, friend=self.dave),
+        ])
+
+        for _ in range(2):
+            call_command('migrate_friendships', batch_size=1, stdout=StringIO())
+            pairs = Friendship.objects.values_list('requester__username', 'receiver__username', 'status')
+            self.assertEqual(sorted(pairs), [('alice', 'bob', 'accepted'), ('carol', 'alice', 'accepted')])
+
+            bob_pair = Friendship.objects.get(requester=self.alice, receiver=self.bob)
+            self.assertEqual(self.edges(), {
+                ('alice', 'bob', bob_pair.id), ('bob', 'alice', bob_pair.id),
+                ('alice', 'carol', pending.id), ('carol', 'alice', pending.id),
+            })
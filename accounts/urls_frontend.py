@@ -7,6 +7,7 @@ urlpatterns = [
     path('register/', views.register_view, name='register'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
+    path('account/delete/', views.delete_account_view, name='delete_account'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('friends/', views.friends_list_view, name='friends_list'),
     path('friends/add/<int:user_id>/', views.add_friend_view, name='add_friend'),
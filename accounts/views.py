@@ -6,9 +6,13 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .serializers import UserSerializer, RegisterSerializer, FriendshipSerializer
 from .models import Friendship
+from .services import UserSearchIndex, FriendSuggestionEngine
 
 User = get_user_model()
 
+TYPEAHEAD_DEFAULT_LIMIT = 10
+TYPEAHEAD_MAX_LIMIT = 25
+
 class RegisterViewSet(viewsets.GenericViewSet):
     serializer_class = RegisterSerializer
     permission_classes = [permissions.AllowAny]
@@ -29,6 +33,22 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     def me(self, request):
         return Response(self.get_serializer(request.user).data)
 
+    @action(detail=False, methods=['get'])
+    def typeahead(self, request):
+        """Ranked prefix matches on username, name and email (?q=...&limit=...)."""
+        try:
+            limit = int(request.GET.get('limit', TYPEAHEAD_DEFAULT_LIMIT))
+        except ValueError:
+            limit = TYPEAHEAD_DEFAULT_LIMIT
+        limit = max(1, min(limit, TYPEAHEAD_MAX_LIMIT))
+
+        exclude = [request.user.id] if request.user.is_authenticated else []
+        users = UserSearchIndex.search(request.GET.get('q', ''), limit=limit, exclude_ids=exclude)
+        return Response([
+            {'id': u.id, 'username': u.username, 'name': u.get_full_name()}
+            for u in users
+        ])
+
 class FriendshipViewSet(viewsets.ModelViewSet):
     """Send, list, accept, reject friend requests + suggestions + search."""
     serializer_class = FriendshipSerializer
@@ -81,19 +101,8 @@ class FriendshipViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def suggestions(self, request):
-        """Suggest users who aren’t already friends with you."""
-        user = request.user
-        existing = Friendship.objects.filter(
-            Q(requester=user, status='accepted') |
-            Q(receiver=user, status='accepted')
-        )
-        friend_ids = set(
-            list(existing.values_list('requester_id', flat=True)) +
-            list(existing.values_list('receiver_id', flat=True))
-        )
-        friend_ids.add(user.id)
-
-        suggestions = User.objects.exclude(id__in=friend_ids).order_by('id')[:10]
+        """People you share groups or expenses with, best match first."""
+        suggestions = FriendSuggestionEngine.for_user(request.user, limit=10)
         return Response(UserSerializer(suggestions, many=True).data)
 
     @action(detail=False, methods=['get'])
@@ -103,10 +112,6 @@ class FriendshipViewSet(viewsets.ModelViewSet):
         if not q:
             return Response([], status=status.HTTP_200_OK)
 
-        users = User.objects.filter(
-            Q(username__icontains=q) |
-            Q(first_name__icontains=q) |
-            Q(last_name__icontains=q)
-        ).exclude(id=request.user.id).order_by('id')[:10]
+        users = UserSearchIndex.search(q, limit=10, exclude_ids=[request.user.id])
 
         return Response(UserSerializer(users, many=True).data)
\ No newline at end of file
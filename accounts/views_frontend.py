@@ -9,10 +9,14 @@ from django.contrib import messages
 from django.db.models import Q
 from django.contrib.auth import get_user_model
 from .models import Friendship
+from core.deletion import DeletionService
+from .services import UserSearchIndex, FriendshipService
 from django.shortcuts import render
 from django.contrib import messages
 from django.contrib.auth import login
 
+SEARCH_RESULTS_LIMIT = 50
+
 def index(request):
     if request.user.is_authenticated:
         return redirect('dashboard')
@@ -70,6 +74,20 @@ def logout_view(request):
     messages.success(request, 'You have been logged out successfully.')
     return redirect('login')
 
+@login_required
+def delete_account_view(request):
+    """Deactivate the account now; reap_deleted removes its data in the background"""
+    if request.method == 'POST':
+        if not request.user.check_password(request.POST.get('password', '')):
+            messages.error(request, 'Incorrect password.')
+            return redirect('accounts:delete_account')
+        DeletionService.soft_delete_user(request.user)
+        logout(request)
+        messages.success(request, 'Your account has been deleted.')
+        return redirect('login')
+
+    return render(request, 'accounts/delete_account.html')
+
 @login_required
 def dashboard(request):
     return render(request, 'expenses/dashboard.html', {'user': request.user})
@@ -85,17 +103,8 @@ User = get_user_model()
 @login_required
 def friends_list_view(request):
     """Show user's accepted friends and pending friend requests."""
-    friendships = Friendship.objects.filter(
-        Q(requester=request.user, status='accepted') |
-        Q(receiver=request.user, status='accepted')
-    ).select_related('requester', 'receiver')
-
-    friends = [
-        f.receiver if f.requester == request.user else f.requester
-        for f in friendships
-    ]
-
-    requests = Friendship.objects.filter(receiver=request.user, status='pending')
+    friends = FriendshipService.friends(request.user)
+    requests = Friendship.objects.filter(receiver=request.user, status='pending').select_related('requester')
 
     context = {
         'friends': friends,
@@ -141,9 +150,7 @@ def search_friends_view(request):
     results = []
 
     if query:
-        results = User.objects.filter(
-            Q(username__icontains=query) | Q(email__icontains=query)
-        ).exclude(id=request.user.id)
+        results = UserSearchIndex.search(query, limit=SEARCH_RESULTS_LIMIT, exclude_ids=[request.user.id])
 
     return render(request, 'accounts/friends_search.html', {
         'results': results,
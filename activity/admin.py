@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import ArchiveSegment
 
-# Register your models here.
\ No newline at end of file
+
+@admin.register(ArchiveSegment)
+class ArchiveSegmentAdmin(admin.ModelAdmin):
+    list_display = ('model_label', 'first_created_at', 'last_created_at', 'row_count', 'path')
+    list_filter = ('model_label',)
@@ -0,0 +1,155 @@
+import gzip
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from core.pagination import decode_cursor, encode_cursor
+from .models import ArchiveSegment
+
+
+class _ArchiveEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder drops microseconds; keep them so read cursors stay exact
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class HistoryArchiver:
+    """
+    Moves append-only rows (Activity, Notification) older than a horizon into
+    gzipped JSONL segment files and reads them back on demand.
+
+    Segments are partitioned by model and by the month of their oldest row,
+    and every file is recorded in ArchiveSegment so reads only open the
+    segments that overlap the requested time range.
+    """
+
+    @staticmethod
+    def archive_root():
+        return Path(getattr(settings, 'ARCHIVE_ROOT', Path(settings.BASE_DIR) / 'archive'))
+
+    @staticmethod
+    def archive(model, horizon, chunk_size=5000, delete_batch_size=1000, dry_run=False):
+        """
+        Archive rows of `model` created before `horizon`. Rows are streamed in
+        id order one chunk at a time, each chunk becomes one segment file, and
+        the archived rows are then deleted in batches of `delete_batch_size`.
+        Returns the number of rows archived.
+        """
+        label = model._meta.label
+        fields = [f.attname for f in model._meta.concrete_fields]
+        total = 0
+        last_id = 0
+
+        while True:
+            rows = list(
+                model.objects.filter(created_at__lt=horizon, id__gt=last_id)
+                .order_by('id')
+                .values(*fields)[:chunk_size]
+            )
+            if not rows:
+                return total
+
+            last_id = rows[-1]['id']
+            total += len(rows)
+            if dry_run:
+                continue
+
+            path = HistoryArchiver._write_segment(label, rows)
+            ids = [row['id'] for row in rows]
+            with transaction.atomic():
+                ArchiveSegment.objects.create(
+                    model_label=label,
+                    path=str(path.relative_to(HistoryArchiver.archive_root())),
+                    first_created_at=min(row['created_at'] for row in rows),
+                    last_created_at=max(row['created_at'] for row in rows),
+                    min_id=ids[0],
+                    max_id=ids[-1],
+                    row_count=len(rows),
+                )
+                for start in range(0, len(ids), delete_batch_size):
+                    model.objects.filter(id__in=ids[start:start + delete_batch_size]).delete()
+
+    @staticmethod
+    def _write_segment(label, rows):
+        first = rows[0]['created_at']
+        directory = HistoryArchiver.archive_root() / label.replace('.', '_').lower() / first.strftime('%Y-%m')
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{rows[0]['id']}-{rows[-1]['id']}.jsonl.gz"
+
+        tmp_path = path.with_suffix('.tmp')
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as fh:
+            for row in rows:
+                fh.write(json.dumps(row, cls=_ArchiveEncoder))
+                fh.write('\n')
+        # Only a complete file ever appears under the final name
+        os.replace(tmp_path, path)
+        return path
+
+    @staticmethod
+    def read(model_label, where, before=None, limit=50):
+        """
+        Fetch up to `limit` archived rows of `model_label` that sort after the
+        (created_at, id) key `before`, newest first, keeping only rows for
+        which `where(row)` is true. Rows are plain dicts; created_at comes
+        back as a datetime.
+        """
+        segments = ArchiveSegment.objects.filter(model_label=model_label)
+        if before is not None:
+            segments = segments.filter(first_created_at__lte=before[0])
+        segments = list(segments.order_by('-last_created_at'))
+
+        results = []
+        for i, segment in enumerate(segments):
+            for row in HistoryArchiver._read_segment(segment):
+                if before is not None and (row['created_at'], row['id']) >= tuple(before):
+                    continue
+                if where(row):
+                    results.append(row)
+
+            results.sort(key=lambda r: (r['created_at'], r['id']), reverse=True)
+            del results[limit:]
+
+            # Stop once the remaining segments only hold rows older than a full page
+            following = segments[i + 1] if i + 1 < len(segments) else None
+            if len(results) >= limit and (
+                following is None or following.last_created_at < results[-1]['created_at']
+            ):
+                break
+
+        return results
+
+    @staticmethod
+    def page(model_label, where, cursor=None, page_size=50):
+        """
+        Return (rows, next_cursor) for archived rows of `model_label`, using
+        the same opaque (created_at, id) cursors as paginate_keyset.
+        """
+        values = decode_cursor(cursor, 2)
+        before = None
+        if values is not None:
+            created_at = parse_datetime(values[0]) if isinstance(values[0], str) else None
+            if created_at is not None and isinstance(values[1], int):
+                before = (created_at, values[1])
+
+        rows = HistoryArchiver.read(model_label, where, before=before, limit=page_size + 1)
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor([rows[-1]['created_at'], rows[-1]['id']])
+        return rows, next_cursor
+
+    @staticmethod
+    def _read_segment(segment):
+        rows = []
+        with gzip.open(HistoryArchiver.archive_root() / segment.path, 'rt', encoding='utf-8') as fh:
+            for line in fh:
+                row = json.loads(line)
+                row['created_at'] = parse_datetime(row['created_at'])
+                rows.append(row)
+        return rows
@@ -0,0 +1,51 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from activity.archive import HistoryArchiver
+from activity.models import Activity
+from notifications.models import Notification
+
+
+class Command(BaseCommand):
+    help = 'Move old activity and notification rows into compressed archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--activity-days',
+            type=int,
+            default=getattr(settings, 'ACTIVITY_RETENTION_DAYS', 365),
+            help='Keep this many days of activity in the live table',
+        )
+        parser.add_argument(
+            '--notification-days',
+            type=int,
+            default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 180),
+            help='Keep this many days of notifications in the live table',
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per archive segment')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per delete statement')
+        parser.add_argument('--only', choices=['activity', 'notifications'], help='Archive one table only')
+        parser.add_argument('--dry-run', action='store_true', help='Count rows without archiving them')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        targets = [
+            ('activity', Activity, options['activity_days']),
+            ('notifications', Notification, options['notification_days']),
+        ]
+
+        for name, model, days in targets:
+            if options['only'] and options['only'] != name:
+                continue
+            horizon = now - timedelta(days=days)
+            self.stdout.write(f'Archiving {name} older than {horizon:%Y-%m-%d}...')
+            count = HistoryArchiver.archive(
+                model,
+                horizon,
+                chunk_size=options['chunk_size'],
+                delete_batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+            )
+            verb = 'Would archive' if options['dry_run'] else 'Archived'
+            self.stdout.write(self.style.SUCCESS(f'✓ {verb} {count} {name} rows'))
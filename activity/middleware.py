@@ -0,0 +1,12 @@
+from .utils import buffered_activity
+
+
+class ActivityBufferMiddleware:
+    """Writes all activity logged during a request with one bulk insert"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with buffered_activity():
+            return self.get_response(request)
@@ -8,4 +8,30 @@ class Activity(models.Model):
     target_type = models.CharField(max_length=50, blank=True, null=True)
     target_id = models.IntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    data = models.JSONField(blank=True, null=True)
\ No newline at end of file
+    data = models.JSONField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', '-created_at', '-id']),
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
+
+
+class ArchiveSegment(models.Model):
+    """One compressed JSONL file of rows moved out of a live table by archive_history"""
+    model_label = models.CharField(max_length=100)
+    path = models.CharField(max_length=500, unique=True)
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+    min_id = models.BigIntegerField()
+    max_id = models.BigIntegerField()
+    row_count = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model_label', '-last_created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.model_label} {self.min_id}-{self.max_id} ({self.row_count} rows)"
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+from django.db.models import Q
+from django.utils import timezone
+from core.pagination import decode_cursor, paginate_keyset
+from groups.models import Group
+from .archive import HistoryArchiver
+from .models import Activity
+
+# Windows tried in turn, newest first, before falling back to an unbounded scan
+FEED_WINDOWS = (timedelta(days=7), timedelta(days=30), timedelta(days=180), None)
+
+
+class ActivityFeed:
+    """Fan-out-on-read activity feed across every group a user belongs to"""
+
+    @staticmethod
+    def group_ids(user):
+        return list(
+            Group.members.through.objects.filter(user_id=user.id).values_list('group_id', flat=True)
+        )
+
+    @staticmethod
+    def base_queryset(user):
+        # Resolve memberships once so the feed query is a literal IN list the
+        # planner can drive through the (group, created_at) index
+        group_ids = ActivityFeed.group_ids(user)
+        return Activity.objects.filter(
+            Q(group_id__in=group_ids) | Q(user=user, group__isnull=True)
+        ).select_related('user', 'group')
+
+    @staticmethod
+    def page(user, cursor=None, page_size=30):
+        """
+        Return (activities, next_cursor), newest first.
+
+        Users in hundreds of busy groups would otherwise sort every row those
+        groups ever produced, so the query is first bounded to a recent time
+        window below the cursor and only widened when the window can't fill
+        a page.
+        """
+        activities = ActivityFeed.base_queryset(user)
+        values = decode_cursor(cursor, 2)
+        upper = values[0] if values else timezone.now()
+        if isinstance(upper, str):
+            upper = datetime.fromisoformat(upper)
+
+        for window in FEED_WINDOWS:
+            bounded = activities if window is None else activities.filter(created_at__gte=upper - window)
+            rows, next_cursor = paginate_keyset(bounded, ('created_at', 'id'), cursor, page_size)
+            if next_cursor or window is None:
+                return rows, next_cursor
+
+    @staticmethod
+    def archived_page(user, cursor=None, page_size=30):
+        """Read-through to archive_history segments for activity older than the live table keeps"""
+        group_ids = set(ActivityFeed.group_ids(user))
+
+        def visible(row):
+            if row['group_id'] is None:
+                return row['user_id'] == user.id
+            return row['group_id'] in group_ids
+
+        return HistoryArchiver.page('activity.Activity', visible, cursor, page_size)
@@ -1,3 +1,128 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts.models import User
+from groups.models import Group
+from notifications.models import Notification
+from .models import Activity, ArchiveSegment
+from .utils import buffered_activity, log
 
-# Create your tests here.
\ No newline at end of file
+
+class HistoryArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        cls.carol = User.objects.create_user('carol', password='pw')
+        cls.group = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.group.members.add(cls.alice, cls.bob)
+
+        old = timezone.now() - timedelta(days=400)
+        # Pairs of rows share a timestamp so paging has to break ties on id
+        for i in range(5):
+            Activity.objects.create(user=cls.alice, group=cls.group, verb=f'old {i}')
+            Notification.objects.create(
+                recipient=cls.bob, notification_type='expense_added', title=f'Old {i}', message='m',
+            )
+        Activity.objects.create(user=cls.carol, verb='private')
+        Notification.objects.create(recipient=cls.carol, notification_type='expense_added', title='Not bob', message='m')
+        for model in (Activity, Notification):
+            for i, pk in enumerate(model.objects.order_by('id').values_list('id', flat=True)):
+                model.objects.filter(pk=pk).update(created_at=old + timedelta(minutes=i // 2))
+        Activity.objects.create(user=cls.alice, group=cls.group, verb='recent')
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings_override = override_settings(ARCHIVE_ROOT=root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('archive_history', chunk_size=2, stdout=StringIO())
+        self.client.force_login(self.bob)
+
+    def _pages(self, url, params, cursor=None):
+        seen = []
+        while True:
+            data = self.client.get(url, {**params, 'cursor': cursor} if cursor else params).json()
+            seen.extend(data['results'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                return seen
+
+    def test_old_rows_leave_the_live_tables(self):
+        self.assertEqual(list(Activity.objects.values_list('verb', flat=True)), ['recent'])
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(ArchiveSegment.objects.filter(model_label='notifications.Notification').count(), 3)
+
+    def test_activity_round_trip_pages_on_created_at_and_id(self):
+        live = self.client.get('/api/activity/feed/').json()
+        self.assertEqual([a['verb'] for a in live['results']], ['recent'])
+
+        rows = self._pages('/api/activity/feed/', {'archived': 1, 'page_size': 2}, live['archive_cursor'])
+        self.assertEqual([r['verb'] for r in rows], [f'old {i}' for i in reversed(range(5))])
+        self.assertTrue(all(r['archived'] for r in rows))
+
+    def test_notification_round_trip_is_per_recipient(self):
+        with mock.patch('notifications.views.ARCHIVE_PAGE_SIZE', 2):
+            rows = self._pages('/notifications/api/archived/', {})
+        self.assertEqual([r['title'] for r in rows], [f'Old {i}' for i in reversed(range(5))])
+
+
+class ActivityBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+
+    def test_rolled_back_work_logs_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with buffered_activity() as buffer:
+                try:
+                    with transaction.atomic():
+                        log(self.alice, 'expense_added')
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                self.assertEqual(buffer.pending, [])
+        self.assertFalse(Activity.objects.exists())
+
+    def test_buffered_rows_are_flushed_in_one_insert(self):
+        with buffered_activity() as buffer:
+            with self.captureOnCommitCallbacks(execute=True):
+                log(self.alice, 'expense_added')
+                log(self.alice, 'settlement')
+            self.assertEqual(len(buffer.pending), 2)
+            self.assertFalse(Activity.objects.exists())
+            with self.assertNumQueries(1):
+                buffer.flush()
+        self.assertEqual(sorted(Activity.objects.values_list('verb', flat=True)), ['expense_added', 'settlement'])
+
+
+class ActivityRequestTests(TransactionTestCase):
+    def test_expenses_added_through_the_api_are_logged_for_the_requester(self):
+        alice = User.objects.create_user('alice')
+        bob = User.objects.create_user('bob')
+        group = Group.objects.create(name='Flat', created_by=alice)
+        group.members.add(alice, bob)
+
+        client = APIClient()
+        client.force_authenticate(bob)
+        response = client.post('/api/expenses/records/batch/', [
+            {
+                'description': f'Taxi {i}', 'amount': '10.00', 'paid_by': alice.id,
+                'group': group.id, 'split_type': 'equal', 'date': '2024-02-01',
+                'splits': [{'user': alice.id}, {'user': bob.id}],
+            }
+            for i in range(2)
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(Activity.objects.filter(verb='expense_added').values_list('user__username', flat=True)),
+            ['bob', 'bob'],
+        )
@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path('', views.activity_list, name='activity_list'),
-]
\ No newline at end of file
+    path('feed/', views.activity_feed, name='activity_feed'),
+]
@@ -1,3 +1,59 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from django.db import transaction
 from .models import Activity
-def log(user, verb, target_type=None, target_id=None, data=None):
-    Activity.objects.create(user=user, verb=verb, target_type=target_type, target_id=target_id, data=data or {})
\ No newline at end of file
+
+_current_buffer = ContextVar('activity_buffer', default=None)
+
+
+class ActivityBuffer:
+    """Holds committed Activity rows until they can be written in one INSERT"""
+
+    def __init__(self):
+        self.pending = []
+
+    def add(self, activity):
+        self.pending.append(activity)
+
+    def flush(self):
+        batch, self.pending = self.pending, []
+        if batch:
+            Activity.objects.bulk_create(batch)
+        return len(batch)
+
+
+@contextmanager
+def buffered_activity():
+    """Coalesce every log() call made inside the block into a single bulk insert"""
+    buffer = ActivityBuffer()
+    token = _current_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _current_buffer.reset(token)
+        buffer.flush()
+
+
+def log(user, verb, target_type=None, target_id=None, data=None, group=None):
+    """
+    Record an activity event.
+
+    The row is only queued once the surrounding transaction commits, so
+    events from rolled-back work are dropped. Inside buffered_activity() (set
+    up per request by ActivityBufferMiddleware) queued rows are bulk-inserted
+    together at the end; elsewhere each is written as soon as it commits.
+    """
+    activity = Activity(
+        user=user,
+        group=group,
+        verb=verb,
+        target_type=target_type,
+        target_id=target_id,
+        data=data or {},
+    )
+    buffer = _current_buffer.get()
+    if buffer is None:
+        transaction.on_commit(activity.save)
+    else:
+        transaction.on_commit(partial(buffer.add, activity))
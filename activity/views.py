@@ -1,4 +1,87 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import render
+from accounts.models import User
+from core.pagination import encode_cursor
+from groups.models import Group
+from .services import ActivityFeed
 
+FEED_PAGE_SIZE = 30
+
+
+def _serialize(activity):
+    return {
+        'id': activity.id,
+        'verb': activity.verb,
+        'user': {'id': activity.user_id, 'username': activity.user.username},
+        'group': {'id': activity.group_id, 'name': activity.group.name} if activity.group_id else None,
+        'target_type': activity.target_type,
+        'target_id': activity.target_id,
+        'data': activity.data or {},
+        'created_at': activity.created_at.isoformat(),
+    }
+
+
+def _serialize_archived(rows):
+    users = User.objects.in_bulk({r['user_id'] for r in rows})
+    groups = Group.objects.in_bulk({r['group_id'] for r in rows if r['group_id']})
+    results = []
+    for row in rows:
+        user = users.get(row['user_id'])
+        group = groups.get(row['group_id'])
+        results.append({
+            'id': row['id'],
+            'verb': row['verb'],
+            'user': {'id': row['user_id'], 'username': user.username if user else None},
+            'group': {'id': row['group_id'], 'name': group.name if group else None} if row['group_id'] else None,
+            'target_type': row['target_type'],
+            'target_id': row['target_id'],
+            'data': row['data'] or {},
+            'created_at': row['created_at'].isoformat(),
+            'archived': True,
+        })
+    return results
+
+
+@login_required
 def activity_list(request):
-    return render(request, 'activity/activity_list.html')
\ No newline at end of file
+    activities, next_cursor = ActivityFeed.page(
+        request.user, request.GET.get('cursor'), FEED_PAGE_SIZE
+    )
+    return render(request, 'activity/activity_list.html', {
+        'activities': activities,
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+def activity_feed(request):
+    """Paginated JSON feed of activity across all of the user's groups"""
+    try:
+        page_size = min(int(request.GET.get('page_size', FEED_PAGE_SIZE)), 100)
+    except ValueError:
+        page_size = FEED_PAGE_SIZE
+
+    page_size = max(page_size, 1)
+
+    if request.GET.get('archived'):
+        # ?archived=1&cursor=<archive_cursor> reads history moved out by archive_history
+        rows, next_cursor = ActivityFeed.archived_page(request.user, request.GET.get('cursor'), page_size)
+        return JsonResponse({
+            'results': _serialize_archived(rows),
+            'next_cursor': next_cursor,
+        })
+
+    activities, next_cursor = ActivityFeed.page(
+        request.user, request.GET.get('cursor'), page_size
+    )
+    data = {
+        'results': [_serialize(a) for a in activities],
+        'next_cursor': next_cursor,
+    }
+    if next_cursor is None:
+        # Live history is exhausted; older rows may have been archived
+        data['archive_cursor'] = (
+            encode_cursor([activities[-1].created_at, activities[-1].id]) if activities else None
+        )
+    return JsonResponse(data)
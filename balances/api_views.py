@@ -0,0 +1,87 @@
+from django.db.models import Q
+from rest_framework import viewsets, mixins
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from activity.utils import log
+from core.api import NewestFirstCursorPagination, SparseFieldsetsViewMixin, ConditionalListMixin, IdempotentCreateMixin
+from groups.services import GroupVersion
+from .models import Balance, Settlement
+from .serializers import BalanceSerializer, SettlementSerializer
+from .services import BalanceCalculator, GroupWriteCoordinator
+
+
+class SettlementCursorPagination(NewestFirstCursorPagination):
+    ordering = ('-settled_at', '-id')
+
+
+class SettlementViewSet(IdempotentCreateMixin, ConditionalListMixin, SparseFieldsetsViewMixin, mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """Settlements in the user's groups; POST records a payment"""
+    idempotency_scope = 'balances.settle'
+    serializer_class = SettlementSerializer
+    pagination_class = SettlementCursorPagination
+
+    def get_list_version(self):
+        # every settlement triggers a recalculation, which bumps ledger_version
+        return GroupVersion.for_user(self.request.user)
+
+    def get_queryset(self):
+        settlements = Settlement.objects.filter(
+            group__members=self.request.user
+        ).select_related('payer', 'receiver')
+
+        group_id = self.request.query_params.get('group')
+        if group_id:
+            settlements = settlements.filter(group_id=group_id)
+        return settlements
+
+    def perform_create(self, serializer):
+        settlement = GroupWriteCoordinator.submit(serializer.validated_data['group'], lambda: serializer.save(
+            created_by=self.request.user,
+            currency=serializer.validated_data.get('currency') or self.request.user.default_currency,
+        ))
+        log(self.request.user, 'settlement', 'settlement', settlement.id,
+            {'payer_id': settlement.payer_id, 'receiver_id': settlement.receiver_id,
+             'amount': str(settlement.amount), 'currency': settlement.currency}, group=settlement.group)
+
+
+class BalanceViewSet(ConditionalListMixin, SparseFieldsetsViewMixin, viewsets.ReadOnlyModelViewSet):
+    """Outstanding balances the user is part of"""
+    serializer_class = BalanceSerializer
+    pagination_class = NewestFirstCursorPagination
+
+    def get_list_version(self):
+        return GroupVersion.for_user(self.request.user)
+
+    def get_queryset(self):
+        user = self.request.user
+        balances = Balance.objects.filter(
+            Q(from_user=user) | Q(to_user=user)
+        ).select_related('from_user', 'to_user')
+
+        group_id = self.request.query_params.get('group')
+        if group_id:
+            balances = balances.filter(group_id=group_id)
+        return balances
+
+    @action(detail=False)
+    def counterparties(self, request):
+        """Net position with each other person across all groups; ?currency= picks the total currency"""
+        currency = request.query_params.get('currency')
+        if currency is not None:
+            if len(currency) != 3 or not currency.isalpha():
+                raise ValidationError({'currency': 'Use a three-letter ISO currency code.'})
+            currency = currency.upper()
+        summary = BalanceCalculator.get_counterparty_balances(request.user, currency)
+        summary['results'] = [
+            {
+                'user': entry['user_id'],
+                'username': entry['username'],
+                'net': entry['net'],
+                'status': entry['status'],
+                'by_currency': entry['by_currency'],
+                'unconverted': entry['unconverted'],
+            }
+            for entry in summary.pop('counterparties')
+        ]
+        return Response(summary)
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from groups.models import Group
 from decimal import Decimal
+from core.currency import format_money
 
 User = get_user_model()
 
@@ -11,17 +12,18 @@ class Balance(models.Model):
     from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='debts_owed')
     to_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='debts_receiving')
     amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    currency = models.CharField(max_length=3, default='INR')
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        unique_together = ('group', 'from_user', 'to_user')
+        unique_together = ('group', 'from_user', 'to_user', 'currency')
         indexes = [
             models.Index(fields=['group', 'from_user']),
             models.Index(fields=['group', 'to_user']),
         ]
     
     def __str__(self):
-        return f"{self.from_user.username} owes {self.to_user.username} ₹{self.amount} in {self.group.name}"
+        return f"{self.from_user.username} owes {self.to_user.username} {format_money(self.amount, self.currency)} in {self.group.name}"
 
 class Settlement(models.Model):
     """Records payments between users"""
@@ -29,6 +31,7 @@ class Settlement(models.Model):
     payer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payments_made')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payments_received')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default='INR')
     note = models.TextField(blank=True)
     settled_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='settlements_created')
@@ -37,4 +40,4 @@ class Settlement(models.Model):
         ordering = ['-settled_at']
     
     def __str__(self):
-        return f"{self.payer.username} paid {self.receiver.username} ₹{self.amount}"
\ No newline at end of file
+        return f"{self.payer.username} paid {self.receiver.username} {format_money(self.amount, self.currency)}"
\ No newline at end of file
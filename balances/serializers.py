@@ -0,0 +1,43 @@
+from rest_framework import serializers
+from core.api import SparseFieldsetsSerializerMixin
+from core.currency import FxRates
+from groups.services import MembershipService
+from .models import Balance, Settlement
+
+
+class BalanceSerializer(SparseFieldsetsSerializerMixin, serializers.ModelSerializer):
+    from_username = serializers.CharField(source='from_user.username', read_only=True)
+    to_username = serializers.CharField(source='to_user.username', read_only=True)
+
+    class Meta:
+        model = Balance
+        fields = ['id', 'group', 'from_user', 'from_username', 'to_user', 'to_username', 'amount', 'currency', 'updated_at']
+
+
+class SettlementSerializer(SparseFieldsetsSerializerMixin, serializers.ModelSerializer):
+    payer_username = serializers.CharField(source='payer.username', read_only=True)
+    receiver_username = serializers.CharField(source='receiver.username', read_only=True)
+
+    class Meta:
+        model = Settlement
+        fields = [
+            'id', 'group', 'payer', 'payer_username', 'receiver', 'receiver_username',
+            'amount', 'currency', 'note', 'settled_at', 'created_by',
+        ]
+        read_only_fields = ['settled_at', 'created_by']
+
+    def validate(self, attrs):
+        if attrs['payer'] == attrs['receiver']:
+            raise serializers.ValidationError('Payer and receiver cannot be the same.')
+        if attrs['amount'] <= 0:
+            raise serializers.ValidationError({'amount': 'Amount must be positive.'})
+        currency = attrs.get('currency')
+        if currency is not None:
+            if not FxRates.supported(currency):
+                raise serializers.ValidationError({'currency': 'Use a three-letter currency code that has an exchange rate.'})
+            attrs['currency'] = currency.upper()
+
+        user = self.context['request'].user
+        if not MembershipService.are_members(attrs['group'], [user, attrs['payer'], attrs['receiver']]):
+            raise serializers.ValidationError('You, the payer and the receiver must all be group members.')
+        return attrs
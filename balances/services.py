@@ -1,95 +1,128 @@
+import logging
+import threading
+import time
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Q
-from collections import defaultdict
+from django.db.models import Case, DecimalField, F, Q, Sum, When
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from decimal import Decimal
 import heapq
+from core.currency import FxRates, base_currency
+from core.profiling import profiled, section
+from groups.services import GroupVersion
 from .models import Balance, Settlement
 
+logger = logging.getLogger(__name__)
+
+# {group id: group} collected by BalanceCalculator.deferred()
+_deferred_groups = ContextVar('deferred_recalculation', default=None)
+
 class BalanceCalculator:
     """Handles all balance calculations and debt simplification"""
 
     @staticmethod
-    def recalculate_group_balances(group):
-        """Recalculate all balances for a group from scratch"""
-        from expenses.models import Expense
-
-        expenses = Expense.objects.filter(group=group).prefetch_related('shares__user')
-        net_balances = defaultdict(Decimal)
+    @contextmanager
+    def deferred():
+        """
+        Collect recalculation requests made inside the block and run each
+        group's once on the way out. Nothing runs if the block raises, since
+        its writes are being rolled back. Nested blocks defer to the outermost.
+        """
+        if _deferred_groups.get() is not None:
+            yield
+            return
+        pending = {}
+        token = _deferred_groups.set(pending)
+        try:
+            yield
+        finally:
+            _deferred_groups.reset(token)
+        for group in pending.values():
+            BalanceCalculator.recalculate_group_balances(group)
 
-        for expense in expenses:
-            paid_by = expense.paid_by
-            amount = expense.amount
-            shares = expense.shares.all()
+    @staticmethod
+    def request_recalculation(group):
+        """Recalculate now, or once at the end of an enclosing deferred() block"""
+        pending = _deferred_groups.get()
+        if pending is None:
+            BalanceCalculator.recalculate_group_balances(group)
+        else:
+            pending[group.pk] = group
 
-            if not shares or len(shares) == 0:
-                print(f"⚠️ Skipping expense '{expense.description}' — no shares found.")
-                continue
+    @staticmethod
+    @profiled('balances.recalculate')
+    def recalculate_group_balances(group):
+        """Recalculate all balances for a group from scratch, one ledger per currency"""
+        from expenses.models import Expense, ExpenseShare
+        from expenses.splits import SplitEngine
+
+        with section('balances.recalculate.load'):
+            expenses = list(Expense.objects.filter(group=group).only('id', 'paid_by_id', 'currency').order_by())
+            # The stored share amounts are the split; one query for the whole group
+            owed = SplitEngine.owed(expenses, ExpenseShare.objects.filter(expense__group=group))
+            settlements = list(Settlement.objects.filter(group=group))
+
+        with section('balances.recalculate.net'):
+            for expense in expenses:
+                if not owed[expense.pk]:
+                    logger.warning("Expense %s in group %s has no shares", expense.id, group.id)
+            net_by_currency = SplitEngine.net(expenses, owed)
+
+            for settlement in settlements:
+                net_balances = net_by_currency[settlement.currency]
+                net_balances[settlement.payer_id] += settlement.amount
+                net_balances[settlement.receiver_id] -= settlement.amount
 
-            if expense.split_type == 'equal':
-                try:
-                    per_person = amount / Decimal(len(shares))
-                except Exception as e:
-                    print(f"⚠️ Division error in expense '{expense.description}': {e}")
-                    continue
-
-                for share in shares:
-                    if share.user_id != paid_by.id:
-                        net_balances[share.user_id] -= per_person
-                        net_balances[paid_by.id] += per_person
-
-            elif expense.split_type == 'unequal':
-                for share in shares:
-                    if share.user_id != paid_by.id:
-                        net_balances[share.user_id] -= share.amount
-                        net_balances[paid_by.id] += share.amount
-
-            elif expense.split_type == 'percentage':
-                for share in shares:
-                    if share.user_id != paid_by.id and share.percentage is not None:
-                        owed = (amount * share.percentage) / 100
-                        net_balances[share.user_id] -= owed
-                        net_balances[paid_by.id] += owed
-
-        settlements = Settlement.objects.filter(group=group)
-        for settlement in settlements:
-            net_balances[settlement.payer_id] += settlement.amount
-            net_balances[settlement.receiver_id] -= settlement.amount
-
-        Balance.objects.filter(group=group).delete()
         balances_to_create = []
 
-        user_ids = list(net_balances.keys())
-
-        for i, user1_id in enumerate(user_ids):
-            for user2_id in user_ids[i + 1:]:
-                balance1 = net_balances[user1_id]
-                balance2 = net_balances[user2_id]
-
-                if balance1 < 0 and balance2 > 0:
-                    amount = min(abs(balance1), balance2)
-                    if amount > Decimal('0.01'):
-                        balances_to_create.append(Balance(
-                            group=group,
-                            from_user_id=user1_id,
-                            to_user_id=user2_id,
-                            amount=amount
-                        ))
-                elif balance2 < 0 and balance1 > 0:
-                    amount = min(abs(balance2), balance1)
-                    if amount > Decimal('0.01'):
-                        balances_to_create.append(Balance(
-                            group=group,
-                            from_user_id=user2_id,
-                            to_user_id=user1_id,
-                            amount=amount
-                        ))
-
-        if balances_to_create:
-            Balance.objects.bulk_create(balances_to_create)
+        with section('balances.recalculate.pairs'):
+            for currency, net_balances in net_by_currency.items():
+                user_ids = list(net_balances.keys())
+
+                for i, user1_id in enumerate(user_ids):
+                    for user2_id in user_ids[i + 1:]:
+                        balance1 = net_balances[user1_id]
+                        balance2 = net_balances[user2_id]
+
+                        if balance1 < 0 and balance2 > 0:
+                            amount = min(abs(balance1), balance2)
+                            if amount > Decimal('0.01'):
+                                balances_to_create.append(Balance(
+                                    group=group,
+                                    from_user_id=user1_id,
+                                    to_user_id=user2_id,
+                                    amount=amount,
+                                    currency=currency
+                                ))
+                        elif balance2 < 0 and balance1 > 0:
+                            amount = min(abs(balance2), balance1)
+                            if amount > Decimal('0.01'):
+                                balances_to_create.append(Balance(
+                                    group=group,
+                                    from_user_id=user2_id,
+                                    to_user_id=user1_id,
+                                    amount=amount,
+                                    currency=currency
+                                ))
+
+        with section('balances.recalculate.write'):
+            Balance.objects.filter(group=group).delete()
+            if balances_to_create:
+                Balance.objects.bulk_create(balances_to_create)
+
+        GroupVersion.bump_ledger([group.id])
 
     @staticmethod
-    def get_user_balances(user, group=None):
-        """Get all balances for a user"""
+    @profiled('balances.user_balances')
+    def get_user_balances(user, group=None, currency=None):
+        """
+        Get all balances for a user. Each item stays in its own currency;
+        the totals are per-currency positions converted once per currency
+        into `currency` (the user's default_currency unless given).
+        """
+        currency = currency or user.default_currency
         filters = Q(from_user=user) | Q(to_user=user)
         if group:
             filters &= Q(group=group)
@@ -98,76 +131,164 @@ class BalanceCalculator:
 
         owes = []
         owed = []
+        owes_by_currency = defaultdict(Decimal)
+        owed_by_currency = defaultdict(Decimal)
 
         for balance in balances:
             if balance.from_user == user:
-                owes.append({'user': balance.to_user, 'group': balance.group, 'amount': balance.amount})
+                owes.append({'user': balance.to_user, 'group': balance.group,
+                             'amount': balance.amount, 'currency': balance.currency})
+                owes_by_currency[balance.currency] += balance.amount
             else:
-                owed.append({'user': balance.from_user, 'group': balance.group, 'amount': balance.amount})
+                owed.append({'user': balance.from_user, 'group': balance.group,
+                             'amount': balance.amount, 'currency': balance.currency})
+                owed_by_currency[balance.currency] += balance.amount
+
+        net_by_currency = {
+            code: owed_by_currency[code] - owes_by_currency[code]
+            for code in set(owes_by_currency) | set(owed_by_currency)
+        }
+        total_owes, _ = FxRates.convert_totals(owes_by_currency, currency)
+        total_owed, _ = FxRates.convert_totals(owed_by_currency, currency)
+        _, unconverted = FxRates.convert_totals(net_by_currency, currency)
 
         return {
             'owes': owes,
             'owed': owed,
-            'total_owes': sum(item['amount'] for item in owes),
-            'total_owed': sum(item['amount'] for item in owed),
-            'net_balance': sum(item['amount'] for item in owed) - sum(item['amount'] for item in owes),
+            'currency': currency,
+            'total_owes': total_owes,
+            'total_owed': total_owed,
+            'net_balance': total_owed - total_owes,
+            'net_by_currency': net_by_currency,
+            'unconverted': unconverted,
+        }
+
+    @staticmethod
+    @profiled('balances.counterparties')
+    def get_counterparty_balances(user, currency=None):
+        """
+        Where the user stands with each other person across all groups, from
+        one aggregate over the ledger. `net` is positive when they owe the
+        user and is converted once per currency into `currency` (the user's
+        default_currency unless given); `by_currency` keeps the positions.
+        """
+        currency = currency or user.default_currency
+        user_owes = Q(from_user=user)
+        rows = (
+            Balance.objects.filter(Q(from_user=user) | Q(to_user=user))
+            .annotate(
+                counterparty=Case(When(user_owes, then=F('to_user')), default=F('from_user')),
+                counterparty_name=Case(
+                    When(user_owes, then=F('to_user__username')), default=F('from_user__username')
+                ),
+                signed=Case(
+                    When(user_owes, then=-F('amount')), default=F('amount'),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                ),
+            )
+            .values('counterparty', 'counterparty_name', 'currency')
+            .annotate(net=Sum('signed'))
+            .order_by()
+        )
+
+        by_user = {}
+        for row in rows:
+            entry = by_user.setdefault(row['counterparty'], {
+                'user_id': row['counterparty'], 'username': row['counterparty_name'], 'by_currency': {},
+            })
+            if row['net']:
+                entry['by_currency'][row['currency']] = row['net']
+
+        counterparties = []
+        for entry in by_user.values():
+            net, unconverted = FxRates.convert_totals(entry['by_currency'], currency)
+            if not (net or unconverted):
+                continue
+            entry.update(
+                net=net, amount=abs(net), unconverted=unconverted,
+                status='owes_me' if net > 0 else 'i_owe' if net < 0 else 'settled',
+            )
+            counterparties.append(entry)
+        counterparties.sort(key=lambda e: e['amount'], reverse=True)
+
+        total_owed = sum((e['net'] for e in counterparties if e['net'] > 0), Decimal('0'))
+        total_owes = sum((-e['net'] for e in counterparties if e['net'] < 0), Decimal('0'))
+        return {
+            'currency': currency,
+            'counterparties': counterparties,
+            'total_owed': total_owed,
+            'total_owes': total_owes,
+            'net_balance': total_owed - total_owes,
         }
 
     @staticmethod
+    @profiled('balances.simplify')
     def simplify_debts(group):
+        """Minimal set of transfers per currency; currencies are never netted against each other"""
         balances = Balance.objects.filter(group=group)
-        net_balances = defaultdict(Decimal)
-        
+        net_by_currency = defaultdict(lambda: defaultdict(Decimal))
+
         for balance in balances:
+            net_balances = net_by_currency[balance.currency]
             net_balances[balance.from_user_id] -= balance.amount
             net_balances[balance.to_user_id] += balance.amount
-        creditors = []  
-        debtors = []    
-
-        for user_id, amount in net_balances.items():
-            if amount > Decimal('0.01'):
-                heapq.heappush(creditors, (-amount, user_id))
-            elif amount < Decimal('-0.01'):
-                heapq.heappush(debtors, (amount, user_id))
 
         simplified_balances = []
 
-        while creditors and debtors:
-            credit_amount, creditor_id = heapq.heappop(creditors)
-            credit_amount = -credit_amount 
-        
-            debt_amount, debtor_id = heapq.heappop(debtors)
-            debt_amount = abs(debt_amount)
-
-            settlement_amount = min(credit_amount, debt_amount)
+        for currency, net_balances in net_by_currency.items():
+            creditors = []  
+            debtors = []    
 
-            simplified_balances.append(Balance(
-                group=group,
-                from_user_id=debtor_id,
-                to_user_id=creditor_id,
-                amount=settlement_amount
-            ))
+            for user_id, amount in net_balances.items():
+                if amount > Decimal('0.01'):
+                    heapq.heappush(creditors, (-amount, user_id))
+                elif amount < Decimal('-0.01'):
+                    heapq.heappush(debtors, (amount, user_id))
 
-            if credit_amount > settlement_amount:
-                heapq.heappush(creditors, (-(credit_amount - settlement_amount), creditor_id))
+            while creditors and debtors:
+                credit_amount, creditor_id = heapq.heappop(creditors)
+                credit_amount = -credit_amount 
             
-            if debt_amount > settlement_amount:
-                heapq.heappush(debtors, (-(debt_amount - settlement_amount), debtor_id))
+                debt_amount, debtor_id = heapq.heappop(debtors)
+                debt_amount = abs(debt_amount)
+
+                settlement_amount = min(credit_amount, debt_amount)
+
+                simplified_balances.append(Balance(
+                    group=group,
+                    from_user_id=debtor_id,
+                    to_user_id=creditor_id,
+                    amount=settlement_amount,
+                    currency=currency
+                ))
+
+                if credit_amount > settlement_amount:
+                    heapq.heappush(creditors, (-(credit_amount - settlement_amount), creditor_id))
+                
+                if debt_amount > settlement_amount:
+                    heapq.heappush(debtors, (-(debt_amount - settlement_amount), debtor_id))
 
         return simplified_balances
 
     @staticmethod
-    def get_group_balance_matrix(group):
-        balances = Balance.objects.filter(group=group).select_related('from_user', 'to_user')
+    @profiled('balances.matrix')
+    def get_group_balance_matrix(group, currency=None):
+        """Pairwise debts with every currency converted into `currency` (FX base by default)"""
+        currency = currency or base_currency()
+        balances = Balance.objects.filter(group=group)
         members = list(group.members.all())
         member_ids = [m.id for m in members]
 
         matrix = {m.id: {mid: Decimal('0') for mid in member_ids} for m in members}
 
-        for balance in balances:
-            matrix[balance.from_user_id][balance.to_user_id] = balance.amount
+        totals = defaultdict(lambda: defaultdict(Decimal))
+        for from_id, to_id, code, amount in balances.values_list('from_user_id', 'to_user_id', 'currency', 'amount'):
+            totals[(from_id, to_id)][code] += amount
+        for (from_id, to_id), by_currency in totals.items():
+            if from_id in matrix and to_id in matrix[from_id]:
+                matrix[from_id][to_id], _ = FxRates.convert_totals(by_currency, currency)
 
-        return {'members': members, 'matrix': matrix}
+        return {'members': members, 'matrix': matrix, 'currency': currency}
 
     @staticmethod
     def get_simplification_preview(group):
@@ -188,4 +309,107 @@ class BalanceCalculator:
             'current_balances': list(current_balances),
             'simplified_balances': simplified,
             'worth_simplifying': transactions_saved > 0
-        }
\ No newline at end of file
+        }
+
+
+class _PendingWrite:
+
+    def __init__(self, mutation):
+        self.mutation = mutation
+        self.result = None
+        self.error = None
+        self.done = False
+        self.promoted = False
+        self.ready = threading.Event()
+
+
+class GroupWriteCoordinator:
+    """
+    Group commit for writes to one group's ledger.
+
+    Concurrent callers for the same group queue their mutations. The first
+    caller becomes the leader. It applies everything queued, up to
+    GROUP_COMMIT_MAX_BATCH mutations, in one transaction, each in its own
+    savepoint, followed by a single balance recalculation. Then it hands
+    leadership to the next waiter. Each caller gets back its own mutation's
+    result or exception. A mutation runs on the leader's thread, so it
+    should only write rows. Notifications and activity belong after
+    submit() returns.
+
+    The queues are per process. Callers already inside a transaction run
+    directly, because a batch must not commit under someone else's outer
+    transaction.
+    """
+    _lock = threading.Lock()
+    _queues = {}
+    _leaders = set()
+
+    @classmethod
+    def submit(cls, group, mutation):
+        """Run `mutation()` against `group` and return its result once committed"""
+        if transaction.get_connection().in_atomic_block:
+            with BalanceCalculator.deferred():
+                result = mutation()
+                BalanceCalculator.request_recalculation(group)
+            return result
+
+        pending = _PendingWrite(mutation)
+        with cls._lock:
+            cls._queues.setdefault(group.pk, deque()).append(pending)
+            lead = group.pk not in cls._leaders
+            cls._leaders.add(group.pk)
+
+        while not pending.done:
+            if lead or pending.promoted:
+                cls._lead(group)
+            else:
+                pending.ready.wait()
+                pending.ready.clear()
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    @classmethod
+    def _lead(cls, group):
+        window = getattr(settings, 'GROUP_COMMIT_WINDOW_MS', 0)
+        if window:
+            time.sleep(window / 1000)
+        max_batch = getattr(settings, 'GROUP_COMMIT_MAX_BATCH', 50)
+        with cls._lock:
+            queue = cls._queues[group.pk]
+            batch = [queue.popleft() for _ in range(min(len(queue), max_batch))]
+
+        cls._apply(group, batch)
+
+        with cls._lock:
+            queue = cls._queues[group.pk]
+            if queue:
+                queue[0].promoted = True
+                queue[0].ready.set()
+            else:
+                del cls._queues[group.pk]
+                cls._leaders.discard(group.pk)
+
+    @staticmethod
+    def _apply(group, batch):
+        try:
+            with transaction.atomic(), BalanceCalculator.deferred():
+                for write in batch:
+                    try:
+                        with transaction.atomic():
+                            write.result = write.mutation()
+                    except Exception as exc:
+                        write.error = exc
+                if any(write.error is None for write in batch):
+                    BalanceCalculator.request_recalculation(group)
+            logger.debug("Group %s committed %d writes in one transaction", group.pk, len(batch))
+        except Exception as exc:
+            # The commit or the recalculation failed, so nothing in the batch was saved
+            for write in batch:
+                if write.error is None:
+                    write.result, write.error = None, exc
+        finally:
+            for write in batch:
+                write.done = True
+                write.ready.set()
@@ -7,4 +7,4 @@ from .services import BalanceCalculator
 def recalculate_balances_on_expense_change(sender, instance, **kwargs):
     """Automatically recalculate balances when expense is created/updated/deleted"""
     if instance.group:
-        BalanceCalculator.recalculate_group_balances(instance.group)
\ No newline at end of file
+        BalanceCalculator.request_recalculation(instance.group)
\ No newline at end of file
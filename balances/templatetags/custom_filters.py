@@ -1,4 +1,5 @@
 from django import template
+from core.currency import format_money
 
 register = template.Library()
 
@@ -7,4 +8,11 @@ def dict_get(dictionary, key):
     """Get value from dictionary by key"""
     if dictionary is None:
         return None
-    return dictionary.get(key)
\ No newline at end of file
+    return dictionary.get(key)
+
+@register.filter
+def money(amount, currency=None):
+    """{{ amount|money:currency }} -> '₹1,234.50'; currency defaults to the FX base"""
+    if amount in (None, ''):
+        amount = 0
+    return format_money(amount, currency)
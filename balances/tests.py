@@ -1,3 +1,262 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts.models import User
+from core.idempotency import Idempotency
+from core.models import IdempotencyKey
+from expenses.models import Expense, ExpenseShare
+from groups.models import Group
+from .models import Settlement
+from .services import BalanceCalculator, GroupWriteCoordinator
 
-# Create your tests here.
+
+class BalanceAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        cls.group = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.group.members.add(cls.alice, cls.bob)
+
+        expense = Expense.objects.create(
+            description='Rent', amount=Decimal('100.00'),
+            paid_by=cls.alice, group=cls.group, date=date(2024, 1, 1),
+        )
+        ExpenseShare.objects.create(expense=expense, user=cls.alice, amount=Decimal('50.00'))
+        ExpenseShare.objects.create(expense=expense, user=cls.bob, amount=Decimal('50.00'))
+        for _ in range(3):
+            Settlement.objects.create(
+                group=cls.group, payer=cls.bob, receiver=cls.alice,
+                amount=Decimal('5.00'), created_by=cls.bob,
+            )
+        BalanceCalculator.recalculate_group_balances(cls.group)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+
+    def test_settlement_list_query_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/balances/settlements/')
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_balance_list_query_count(self):
+        # ledger version lookup + the page itself
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/balances/ledger/')
+        self.assertEqual(response.data['results'][0]['amount'], '35.00')
+
+    def test_unchanged_ledger_returns_304(self):
+        etag = self.client.get('/api/balances/ledger/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/balances/ledger/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        BalanceCalculator.recalculate_group_balances(self.group)
+        response = self.client.get('/api/balances/ledger/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_settlement_recalculates(self):
+        response = self.client.post('/api/balances/settlements/', {
+            'group': self.group.id, 'payer': self.bob.id,
+            'receiver': self.alice.id, 'amount': '35.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(self.group.balances.exists())
+
+    def test_settlement_in_a_currency_without_a_rate_is_rejected(self):
+        response = self.client.post('/api/balances/settlements/', {
+            'group': self.group.id, 'payer': self.bob.id,
+            'receiver': self.alice.id, 'amount': '5.00', 'currency': 'XYZ',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('currency', response.data)
+
+        self.client.force_login(self.bob)
+        response = self.client.post(f'/api/balances/group/{self.group.id}/settle/', {
+            'payer_id': self.bob.id, 'receiver_id': self.alice.id, 'amount': '5.00', 'currency': 'XYZ',
+        }, content_type='application/json')
+        self.assertFalse(response.json()['success'])
+        self.assertFalse(Settlement.objects.filter(currency='XYZ').exists())
+
+    def test_group_page_settles_each_ledger_in_its_own_currency(self):
+        expense = Expense.objects.create(
+            description='Hotel', amount=Decimal('40.00'), currency='USD',
+            paid_by=self.alice, group=self.group, date=date(2024, 1, 3),
+        )
+        ExpenseShare.objects.create(expense=expense, user=self.bob, amount=Decimal('40.00'))
+        BalanceCalculator.recalculate_group_balances(self.group)
+
+        self.client.force_login(self.bob)
+        response = self.client.get(f'/api/balances/group/{self.group.id}/')
+        self.assertContains(response, 'data-amount="40.00"\n              data-currency="USD"')
+        self.assertContains(response, 'data-amount="35.00"\n              data-currency="INR"')
+
+    def test_simplify_failure_is_logged_not_returned(self):
+        self.client.force_login(self.bob)
+        with mock.patch.object(BalanceCalculator, 'simplify_debts', side_effect=RuntimeError('db path /srv/x')), \
+                self.assertLogs('balances.views', 'ERROR'):
+            response = self.client.post(f'/api/balances/group/{self.group.id}/simplify/')
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn('/srv/x', response.content.decode())
+
+    def test_counterparties_net_across_groups(self):
+        trip = Group.objects.create(name='Trip', created_by=self.bob)
+        trip.members.add(self.alice, self.bob)
+        expense = Expense.objects.create(
+            description='Fuel', amount=Decimal('20.00'),
+            paid_by=self.bob, group=trip, date=date(2024, 1, 2),
+        )
+        ExpenseShare.objects.create(expense=expense, user=self.alice, amount=Decimal('10.00'))
+        ExpenseShare.objects.create(expense=expense, user=self.bob, amount=Decimal('10.00'))
+        BalanceCalculator.recalculate_group_balances(trip)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/balances/ledger/counterparties/')
+        self.assertEqual(response.data['total_owes'], Decimal('25.00'))
+        [alice] = response.data['results']
+        self.assertEqual((alice['user'], alice['net'], alice['status']), (self.alice.id, Decimal('-25.00'), 'i_owe'))
+
+
+class GroupCommitTests(TransactionTestCase):
+    """Concurrent writers to one group share a transaction and a single recalculation"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.group = Group.objects.create(name='Flat', created_by=self.alice)
+        self.group.members.add(self.alice, self.bob)
+
+    def settle(self, amount):
+        return Settlement.objects.create(
+            group=self.group, payer=self.bob, receiver=self.alice, amount=Decimal(amount), created_by=self.bob,
+        )
+
+    def test_queued_writes_commit_as_one_batch(self):
+        followers = 4
+        leader_started = threading.Event()
+        results, errors = {}, {}
+
+        def first():
+            # Hold the leader's transaction open until every follower has queued
+            leader_started.set()
+            deadline = time.monotonic() + 5
+            while len(GroupWriteCoordinator._queues[self.group.pk]) < followers and time.monotonic() < deadline:
+                time.sleep(0.001)
+            return self.settle('1.00')
+
+        def fail():
+            raise ValueError('bad split')
+
+        def submit(name, mutation):
+            try:
+                results[name] = GroupWriteCoordinator.submit(self.group, mutation)
+            except ValueError as exc:
+                errors[name] = exc
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(
+            BalanceCalculator, 'recalculate_group_balances', wraps=BalanceCalculator.recalculate_group_balances,
+        ) as recalculate:
+            threads = [threading.Thread(target=submit, args=('leader', first))]
+            threads[0].start()
+            leader_started.wait(5)
+            for n in range(followers - 1):
+                threads.append(threading.Thread(target=submit, args=(n, lambda n=n: self.settle(f'{n + 2}.00'))))
+            threads.append(threading.Thread(target=submit, args=('bad', fail)))
+            for thread in threads[1:]:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+        # The leader's own batch, then one batch for all four followers
+        self.assertEqual(recalculate.call_count, 2)
+        self.assertEqual(set(errors), {'bad'})
+        self.assertEqual(
+            {name: settlement.amount for name, settlement in results.items()},
+            {'leader': Decimal('1.00'), 0: Decimal('2.00'), 1: Decimal('3.00'), 2: Decimal('4.00')},
+        )
+        self.assertEqual(Settlement.objects.filter(group=self.group).count(), 4)
+        self.assertEqual(self.group.balances.get().amount, Decimal('10.00'))
+        self.assertEqual(GroupWriteCoordinator._queues, {})
+
+    def test_api_expense_batch_is_group_committed(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        payload = [
+            {
+                'description': f'Taxi {i}', 'amount': '10.00', 'paid_by': self.bob.id,
+                'group': self.group.id, 'split_type': 'equal', 'date': '2024-02-01',
+                'splits': [{'user': self.alice.id}, {'user': self.bob.id}],
+            }
+            for i in range(3)
+        ]
+        with mock.patch.object(GroupWriteCoordinator, '_apply', wraps=GroupWriteCoordinator._apply) as apply, \
+                mock.patch.object(BalanceCalculator, 'recalculate_group_balances',
+                                  wraps=BalanceCalculator.recalculate_group_balances) as recalculate:
+            response = client.post('/api/expenses/records/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(apply.call_count, 1)
+        self.assertEqual(recalculate.call_count, 1)
+        self.assertEqual(self.group.balances.get().amount, Decimal('15.00'))
+
+
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        cls.group = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.group.members.add(cls.alice, cls.bob)
+
+    def post_settlement(self, amount, key='retry-1'):
+        return self.api.post('/api/balances/settlements/', {
+            'group': self.group.id, 'payer': self.bob.id, 'receiver': self.alice.id, 'amount': amount,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.bob)
+
+    def test_api_retry_replays_first_response(self):
+        first = self.post_settlement('10.00')
+        with mock.patch.object(BalanceCalculator, 'recalculate_group_balances') as recalculate:
+            retry = self.post_settlement('10.00')
+        recalculate.assert_not_called()
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Settlement.objects.count(), 1)
+
+    def test_key_reused_for_different_payload_is_rejected(self):
+        self.post_settlement('10.00')
+        self.assertEqual(self.post_settlement('12.00').status_code, 422)
+        self.assertEqual(self.post_settlement('12.00', key='retry-2').status_code, 201)
+        self.assertEqual(Settlement.objects.count(), 2)
+
+    def test_form_endpoint_retry_replays(self):
+        self.client.force_login(self.bob)
+        payload = {'payer_id': self.bob.id, 'receiver_id': self.alice.id, 'amount': '7.50'}
+        responses = [
+            self.client.post(
+                f'/api/balances/group/{self.group.id}/settle/', payload,
+                content_type='application/json', HTTP_IDEMPOTENCY_KEY='tap-1',
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(responses[0].json(), responses[1].json())
+        self.assertEqual(Settlement.objects.count(), 1)
+
+    def test_expired_keys_are_purged(self):
+        self.post_settlement('10.00')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(Idempotency.purge(), 1)
+        self.assertEqual(self.post_settlement('10.00').status_code, 201)
+        self.assertEqual(Settlement.objects.count(), 2)
@@ -1,8 +1,14 @@
-from django.urls import path
+from django.urls import path, include
+from rest_framework.routers import SimpleRouter
 from . import views
+from .api_views import SettlementViewSet, BalanceViewSet
 
 app_name = 'balances'
 
+router = SimpleRouter()
+router.register(r'settlements', SettlementViewSet, basename='settlement')
+router.register(r'ledger', BalanceViewSet, basename='balance')
+
 urlpatterns = [
     path('my-balances/', views.user_balances_view, name='user_balances'),
     path('group/<int:group_id>/', views.group_balances_view, name='group_balances'),
@@ -10,5 +16,6 @@ urlpatterns = [
     path('group/<int:group_id>/simplify-preview/', views.simplification_preview_view, name='simplify_preview'),
     path('group/<int:group_id>/settle/', views.record_settlement, name='record_settlement'),
     path('group/<int:group_id>/settlements/', views.settlements_history_view, name='settlements_history'),
+    path('', include(router.urls)),
 ]
 
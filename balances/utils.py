@@ -1,6 +1,8 @@
 from collections import defaultdict
 from decimal import Decimal, ROUND_HALF_UP
-from expenses.models import Expense
+from core.currency import FxRates, base_currency
+from expenses.models import ExpenseShare
+from expenses.splits import SplitEngine
 from groups.models import Group
 
 def round2(v):
@@ -9,16 +11,15 @@ def round2(v):
 def group_net_balances(group: Group):
     """
     Return dict user_id -> net balance (positive = others owe them; negative = they owe)
-    We calculate: for each expense, each participant owes their share; paid_by covered full amount.
+    from the stored expense shares, converted to the base currency.
     """
-    net = defaultdict(float)
-    for expense in group.expenses.all():
-        splits = expense.compute_splits()  
-        payer_id = str(expense.paid_by_id)
-        net[payer_id] += float(expense.amount)
-        for uid, amt in splits.items():
-            net[str(uid)] -= float(amt)
-    return {int(k): round2(v) for k,v in net.items()}
+    expenses = list(group.expenses.only('id', 'paid_by_id', 'currency').order_by())
+    by_user = defaultdict(dict)
+    owed = SplitEngine.owed(expenses, ExpenseShare.objects.filter(expense__group=group))
+    for currency, balances in SplitEngine.net(expenses, owed).items():
+        for uid, amount in balances.items():
+            by_user[uid][currency] = amount
+    return {uid: round2(FxRates.convert_totals(totals, base_currency())[0]) for uid, totals in by_user.items()}
 
 def simplify_transactions(net_balances):
     """
@@ -7,9 +7,16 @@ from django.db import transaction
 from django.contrib import messages
 from decimal import Decimal
 import json
+import logging
 from groups.models import Group
+from groups.services import MembershipService, GroupVersion
+from activity.utils import log
+from core.currency import FxRates, format_money
+from core.http import idempotent
 from .models import Balance, Settlement
-from .services import BalanceCalculator
+from .services import BalanceCalculator, GroupWriteCoordinator
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -17,14 +24,17 @@ User = get_user_model()
 def user_balances_view(request):
     """Show all balances for the logged-in user"""
     balances = BalanceCalculator.get_user_balances(request.user)
+    by_person = BalanceCalculator.get_counterparty_balances(request.user, balances['currency'])
     
     context = {
         'balances': balances,
+        'counterparties': by_person['counterparties'],
         'owes': balances['owes'],
         'owed': balances['owed'],
         'total_owes': balances['total_owes'],
         'total_owed': balances['total_owed'],
         'net_balance': balances['net_balance'],
+        'currency': balances['currency'],
     }
     
     return render(request, 'balances/user_balances.html', context)
@@ -36,11 +46,11 @@ def group_balances_view(request, group_id):
 
     group = get_object_or_404(Group, id=group_id)
 
-    if request.user not in group.members.all():
+    if not MembershipService.is_member(group, request.user):
         messages.error(request, "You are not a member of this group.")
         return redirect('dashboard')
 
-    matrix_data = BalanceCalculator.get_group_balance_matrix(group)
+    matrix_data = BalanceCalculator.get_group_balance_matrix(group, request.user.default_currency)
     user_balance = BalanceCalculator.get_user_balances(request.user, group)
     simplification_preview = BalanceCalculator.get_simplification_preview(group)
 
@@ -48,6 +58,7 @@ def group_balances_view(request, group_id):
         "group": group,
         "members": matrix_data["members"],
         "matrix": matrix_data["matrix"],
+        "currency": matrix_data["currency"],
         "user_balance": user_balance,
         "simplification_preview": simplification_preview,
     }
@@ -57,10 +68,11 @@ def group_balances_view(request, group_id):
 
 @login_required
 @require_http_methods(["POST"])
+@idempotent('balances.settle')
 def record_settlement(request, group_id):
     group = get_object_or_404(Group, id=group_id)
 
-    if request.user not in group.members.all():
+    if not MembershipService.is_member(group, request.user):
         return JsonResponse({'success': False, 'error': 'Not a group member'}, status=403)
 
     try:
@@ -71,10 +83,7 @@ def record_settlement(request, group_id):
         if payer_id == receiver_id:
             return JsonResponse({'success': False, 'error': 'Payer and receiver cannot be the same'})
         
-        payer = get_object_or_404(User, id=payer_id)
-        receiver = get_object_or_404(User, id=receiver_id)
-        
-        if payer not in group.members.all() or receiver not in group.members.all():
+        if not MembershipService.are_members(group, [payer_id, receiver_id]):
             return JsonResponse({'success': False, 'error': 'Invalid users'})
         
         amount = data.get('amount')
@@ -89,31 +98,35 @@ def record_settlement(request, group_id):
         if amount <= 0:
             return JsonResponse({'success': False, 'error': 'Amount must be positive'})
         
+        currency = str(data.get('currency') or request.user.default_currency).upper()
+        if not FxRates.supported(currency):
+            return JsonResponse({'success': False, 'error': f"{currency} isn't a currency we have an exchange rate for"})
+
         note = data.get('note', '')
         
-        with transaction.atomic():
-            settlement = Settlement.objects.create(
-                group=group,
-                payer=payer,
-                receiver=receiver,
-                amount=amount,
-                note=note,
-                created_by=request.user
-            )
-
-            BalanceCalculator.recalculate_group_balances(group)
+        settlement = GroupWriteCoordinator.submit(group, lambda: Settlement.objects.create(
+            group=group,
+            payer_id=payer_id,
+            receiver_id=receiver_id,
+            amount=amount,
+            currency=currency,
+            note=note,
+            created_by=request.user
+        ))
+
+        log(request.user, 'settlement', 'settlement', settlement.id,
+            {'payer_id': payer_id, 'receiver_id': receiver_id, 'amount': str(amount), 'currency': currency}, group=group)
         
         return JsonResponse({
             'success': True,
             'settlement_id': settlement.id,
-            'message': f'Payment of ₹{amount} recorded successfully'
+            'message': f'Payment of {format_money(amount, currency)} recorded successfully'
         })
         
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception('Failed to record settlement in group %s', group_id)
         return JsonResponse({'success': False, 'error': 'Server error occurred'}, status=500)
 
 
@@ -122,7 +135,7 @@ def record_settlement(request, group_id):
 def simplify_group_debts(request, group_id):
     group = get_object_or_404(Group, id=group_id)
     
-    if request.user not in group.members.all():
+    if not MembershipService.is_member(group, request.user):
         return JsonResponse({'success': False, 'error': 'Not a group member'}, status=403)
     
     try:
@@ -143,6 +156,8 @@ def simplify_group_debts(request, group_id):
             
             if simplified:
                 Balance.objects.bulk_create(simplified)
+
+            GroupVersion.bump_ledger([group.id])
             
             return JsonResponse({
                 'success': True,
@@ -153,16 +168,15 @@ def simplify_group_debts(request, group_id):
                 'percentage_saved': preview['percentage_saved']
             })
             
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception:
+        logger.exception('Failed to simplify debts in group %s', group_id)
+        return JsonResponse({'success': False, 'error': 'Server error occurred'}, status=500)
 
 @login_required
 def simplification_preview_view(request, group_id):
     group = get_object_or_404(Group, id=group_id)
     
-    if request.user not in group.members.all():
+    if not MembershipService.is_member(group, request.user):
         messages.error(request, "You are not a member of this group")
         return redirect('dashboard')
     
@@ -179,7 +193,7 @@ def simplification_preview_view(request, group_id):
 def settlements_history_view(request, group_id):
     group = get_object_or_404(Group, id=group_id)
     
-    if request.user not in group.members.all():
+    if not MembershipService.is_member(group, request.user):
         messages.error(request, "You are not a member of this group")
         return redirect('dashboard')
     
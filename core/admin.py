@@ -1,3 +1,13 @@
 from django.contrib import admin
+from .models import FxRate, IdempotencyKey
 
-# Register your models here.
+
+@admin.register(FxRate)
+class FxRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'rate', 'as_of', 'updated_at')
+    search_fields = ('currency',)
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key_hash', 'status_code', 'created_at')
@@ -0,0 +1,113 @@
+import json
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from .http import make_etag
+from .idempotency import MAX_KEY_LENGTH, MISMATCH, NEW, REPLAY, Idempotency
+
+
+class NewestFirstCursorPagination(CursorPagination):
+    """Opaque-cursor pagination; subclasses set `ordering` to a unique key"""
+    ordering = ('-id',)
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class SparseFieldsetsSerializerMixin:
+    """Accepts a `fields` kwarg and drops every other field from the output"""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsetsViewMixin:
+    """
+    Reads `?fields=a,b,c` and hands it to the serializer for read requests.
+
+    get_queryset implementations can call `wants_field()` to skip joins and
+    prefetches for fields the client didn't ask for.
+    """
+
+    def requested_fields(self):
+        raw = self.request.query_params.get('fields', '') if self.request else ''
+        return {f.strip() for f in raw.split(',') if f.strip()}
+
+    def wants_field(self, name):
+        requested = self.requested_fields()
+        return not requested or name in requested
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request and self.request.method == 'GET':
+            fields = self.requested_fields()
+            if fields:
+                kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+
+class ConditionalListMixin:
+    """
+    ETag support for list endpoints. Subclasses implement `get_list_version()`
+    returning a cheap value that changes whenever the list would; a matching
+    If-None-Match gets a 304 before the queryset or serializer runs.
+    """
+
+    def get_list_version(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        etag = quote_etag(make_etag(request.user.pk, request.get_full_path(), self.get_list_version()))
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class IdempotentCreateMixin:
+    """
+    `Idempotency-Key` support for create(). A retry with the same key gets
+    the first response's status and data back without creating anything (see
+    core.idempotency). Subclasses set `idempotency_scope`; other write actions
+    can go through `idempotent()` too.
+    """
+    idempotency_scope = None
+
+    def create(self, request, *args, **kwargs):
+        return self.idempotent(request, lambda: super(IdempotentCreateMixin, self).create(request, *args, **kwargs))
+
+    def idempotent(self, request, handler):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return handler()
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'detail': 'Idempotency key is too long.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = Idempotency.fingerprint(request, json.dumps(request.data, sort_keys=True, default=str).encode())
+        state, record = Idempotency.begin(request.user, self.idempotency_scope, key, fingerprint)
+        if state == REPLAY:
+            return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+        if state == MISMATCH:
+            return Response(
+                {'detail': 'Idempotency key was already used for a different request.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if state != NEW:
+            return Response({'detail': 'A request with this key is in progress.'}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            response = handler()
+        except Exception:
+            Idempotency.release(record)
+            raise
+        Idempotency.finish(record, response.status_code, json.loads(json.dumps(response.data, default=str)))
+        return response
@@ -0,0 +1,227 @@
+"""
+Benchmarks for the balance, simplification, dashboard and notification hot
+paths. Run them with `manage.py run_benchmarks`, which builds the synthetic
+data in a throwaway test database.
+"""
+import platform
+import random
+import statistics
+import time
+from dataclasses import dataclass, field, asdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+import django
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+CENT = Decimal('0.01')
+DEFAULT_SPLIT_MIX = {'equal': 0.6, 'unequal': 0.2, 'percentage': 0.2}
+
+
+@dataclass
+class GroupShape:
+    """Size and make-up of one synthetic group"""
+    members: int = 10
+    expenses: int = 200
+    settlements: int = 20
+    split_mix: dict = field(default_factory=lambda: dict(DEFAULT_SPLIT_MIX))
+    currency: str = 'INR'
+    seed: int = 1
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    runs: int
+    min_ms: float
+    median_ms: float
+    mean_ms: float
+    max_ms: float
+    queries: int
+
+
+class SyntheticData:
+    """Builds groups of a given GroupShape with bulk inserts (no per-row signals)"""
+
+    @staticmethod
+    def build_group(shape, label='bench'):
+        from accounts.models import User
+        from accounts.services import UserSearchIndex
+        from balances.models import Settlement
+        from balances.services import BalanceCalculator
+        from expenses.models import Expense, ExpenseShare
+        from expenses.services import ExpenseIndex
+        from groups.models import Group
+        from users.models import Profile
+
+        rng = random.Random(shape.seed)
+        users = User.objects.bulk_create([
+            User(username=f'{label}_{shape.seed}_{i}', email=f'{label}{i}@bench.local',
+                 default_currency=shape.currency)
+            for i in range(shape.members)
+        ])
+        # bulk_create skips the post_save hooks that normally add these
+        Profile.objects.bulk_create([Profile(user=user) for user in users])
+        UserSearchIndex.sync_users(users)
+        group = Group.objects.create(name=f'{label} group {shape.seed}', created_by=users[0])
+        group.members.add(*users)
+
+        split_types = list(shape.split_mix)
+        weights = [shape.split_mix[t] for t in split_types]
+        today = date.today()
+
+        expenses = Expense.objects.bulk_create([
+            Expense(
+                description=f'{label} expense {i}',
+                amount=Decimal(rng.randint(100, 100000)) / 100,
+                currency=shape.currency,
+                paid_by=rng.choice(users),
+                group=group,
+                split_type=rng.choices(split_types, weights)[0],
+                date=today - timedelta(days=rng.randint(0, 365)),
+            )
+            for i in range(shape.expenses)
+        ])
+
+        shares = []
+        for expense in expenses:
+            participants = rng.sample(users, rng.randint(min(2, len(users)), len(users)))
+            shares.extend(SyntheticData._shares(rng, expense, participants))
+        ExpenseShare.objects.bulk_create(shares)
+
+        Settlement.objects.bulk_create([
+            Settlement(
+                group=group,
+                payer=payer,
+                receiver=rng.choice([u for u in users if u != payer]),
+                amount=Decimal(rng.randint(100, 20000)) / 100,
+                currency=shape.currency,
+                created_by=payer,
+            )
+            for payer in (rng.choice(users) for _ in range(shape.settlements))
+        ])
+
+        ExpenseIndex.sync_expenses(expenses)
+        BalanceCalculator.recalculate_group_balances(group)
+        return group, users, expenses
+
+    @staticmethod
+    def _shares(rng, expense, participants):
+        from expenses.services import ExpenseWriter
+        from expenses.splits import SplitEngine
+
+        count = len(participants)
+        specs = [{'user': user} for user in participants]
+        if expense.split_type == 'percentage':
+            cuts = sorted(rng.sample(range(1, 100), count - 1)) if count > 1 else []
+            for spec, a, b in zip(specs, [0] + cuts, cuts + [100]):
+                spec['percentage'] = Decimal(b - a)
+        elif expense.split_type == 'unequal':
+            weights = [Decimal(rng.randint(1, 10)) for _ in participants]
+            for spec, amount in zip(specs, SplitEngine.allocate(expense.amount, weights)):
+                spec['amount'] = amount
+        elif expense.split_type == 'shares':
+            for spec in specs:
+                spec['weight'] = Decimal(rng.randint(1, 4))
+        elif expense.split_type == 'adjustment':
+            # Together at most half the amount, so nobody's share goes negative
+            cap = int(expense.amount / CENT) // (2 * count)
+            for spec in specs:
+                spec['adjustment'] = rng.randint(0, cap) * CENT
+        return ExpenseWriter.build_shares(expense, specs)
+
+
+class BenchmarkRunner:
+    """Times callables with their query counts; every run is rolled back so state stays fixed"""
+
+    def __init__(self, repeat=5, warmup=1):
+        self.repeat = repeat
+        self.warmup = warmup
+        self.results = []
+
+    def measure(self, name, func):
+        timings = []
+        queries = 0
+        for i in range(self.warmup + self.repeat):
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    func()
+                    elapsed = (time.perf_counter() - start) * 1000
+                transaction.set_rollback(True)
+            if i >= self.warmup:
+                timings.append(elapsed)
+                queries = len(captured)
+
+        result = BenchmarkResult(
+            name=name,
+            runs=len(timings),
+            min_ms=round(min(timings), 3),
+            median_ms=round(statistics.median(timings), 3),
+            mean_ms=round(statistics.fmean(timings), 3),
+            max_ms=round(max(timings), 3),
+            queries=queries,
+        )
+        self.results.append(result)
+        return result
+
+
+def run_suite(shape, repeat=5, warmup=1):
+    """Build one group of `shape`, time every hot path against it and return a JSON-ready dict"""
+    from balances.services import BalanceCalculator
+    from notifications.services import NotificationService
+
+    group, users, expenses = SyntheticData.build_group(shape)
+    viewer = users[0]
+    client = Client()
+    client.force_login(viewer)
+
+    def get(url):
+        def request():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+        return request
+
+    runner = BenchmarkRunner(repeat=repeat, warmup=warmup)
+    runner.measure('recalculate_group_balances', lambda: BalanceCalculator.recalculate_group_balances(group))
+    runner.measure('simplify_debts', lambda: BalanceCalculator.simplify_debts(group))
+    runner.measure('get_user_balances', lambda: BalanceCalculator.get_user_balances(viewer))
+    runner.measure('get_user_balances_in_group', lambda: BalanceCalculator.get_user_balances(viewer, group))
+    runner.measure('dashboard_view', get('/dashboard/'))
+    runner.measure('group_detail', get(f'/groups/{group.id}/'))
+    runner.measure('notify_expense_added', lambda: NotificationService.notify_expense_added(expenses[-1]))
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'shape': asdict(shape),
+            'repeat': repeat,
+            'warmup': warmup,
+        },
+        'results': [asdict(r) for r in runner.results],
+    }
+
+
+def compare(current, baseline):
+    """Per-benchmark median and query deltas of `current` against `baseline` (both run_suite dicts)"""
+    before = {r['name']: r for r in baseline.get('results', [])}
+    rows = []
+    for result in current['results']:
+        old = before.get(result['name'])
+        if old is None:
+            continue
+        change = ((result['median_ms'] - old['median_ms']) / old['median_ms'] * 100) if old['median_ms'] else 0.0
+        rows.append({
+            'name': result['name'],
+            'median_ms': result['median_ms'],
+            'baseline_median_ms': old['median_ms'],
+            'change_pct': round(change, 1),
+            'queries': result['queries'],
+            'baseline_queries': old['queries'],
+        })
+    return rows
@@ -0,0 +1,127 @@
+import hashlib
+import time
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+
+CENT = Decimal('0.01')
+
+CURRENCY_SYMBOLS = {
+    'INR': '₹',
+    'USD': '$',
+    'EUR': '€',
+    'GBP': '£',
+    'JPY': '¥',
+    'AUD': 'A$',
+    'CAD': 'C$',
+    'SGD': 'S$',
+    'AED': 'AED ',
+}
+
+
+def base_currency():
+    return getattr(settings, 'FX_BASE_CURRENCY', 'INR')
+
+
+def format_money(amount, currency=None):
+    """'₹1,234.50' style display string; unknown currencies fall back to their code"""
+    currency = (currency or base_currency()).upper()
+    symbol = CURRENCY_SYMBOLS.get(currency, f'{currency} ')
+    amount = Decimal(amount or 0).quantize(CENT, rounding=ROUND_HALF_UP)
+    sign = '-' if amount < 0 else ''
+    return f"{sign}{symbol}{abs(amount):,.2f}"
+
+
+class MissingRateError(LookupError):
+    pass
+
+
+class FxRates:
+    """
+    In-process cache over FxRate. The whole table is small, so it is read in
+    one query and kept for FX_RATE_CACHE_SECONDS; load_fx_rates clears it.
+
+    Conversion works on totals already grouped by currency, so converting a
+    dashboard costs one multiplication per currency rather than per row.
+    """
+
+    _rates = None
+    _loaded_at = 0.0
+
+    @classmethod
+    def rates(cls):
+        ttl = getattr(settings, 'FX_RATE_CACHE_SECONDS', 300)
+        if cls._rates is None or time.monotonic() - cls._loaded_at > ttl:
+            from .models import FxRate
+            rates = dict(FxRate.objects.values_list('currency', 'rate'))
+            rates[base_currency()] = Decimal('1')
+            cls._rates = rates
+            cls._loaded_at = time.monotonic()
+        return cls._rates
+
+    @classmethod
+    def clear(cls):
+        cls._rates = None
+
+    @classmethod
+    def version(cls):
+        """Short digest of the loaded rates, for cache validators of converted responses"""
+        digest = hashlib.sha1(repr(sorted(cls.rates().items())).encode())
+        return digest.hexdigest()[:12]
+
+    @classmethod
+    def rate(cls, from_currency, to_currency):
+        """Multiplier taking an amount in `from_currency` to `to_currency`"""
+        if from_currency == to_currency:
+            return Decimal('1')
+        rates = cls.rates()
+        try:
+            return rates[to_currency] / rates[from_currency]
+        except KeyError as exc:
+            raise MissingRateError(f'No FX rate for {exc.args[0]}') from None
+
+    @classmethod
+    def supported(cls, currency):
+        """True for a three-letter code that has a rate (the base currency always does)"""
+        return len(currency) == 3 and currency.isalpha() and currency.upper() in cls.rates()
+
+    @classmethod
+    def convert(cls, amount, from_currency, to_currency):
+        return (Decimal(amount) * cls.rate(from_currency, to_currency)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    @classmethod
+    def convert_totals(cls, totals, to_currency):
+        """
+        Collapse {currency: amount} into one amount in `to_currency`.
+        Returns (total, unconverted) where `unconverted` keeps any currencies
+        without a rate, so callers can show them separately instead of failing.
+        """
+        total = Decimal('0')
+        unconverted = {}
+        for currency, amount in totals.items():
+            if not amount:
+                continue
+            try:
+                total += Decimal(amount) * cls.rate(currency, to_currency)
+            except MissingRateError:
+                unconverted[currency] = amount
+        return total.quantize(CENT, rounding=ROUND_HALF_UP), unconverted
+
+    @classmethod
+    def fold(cls, rows, to_currency, key, amount_field='total', currency_field='currency', unconverted=None):
+        """
+        Fold aggregate rows grouped by (key..., currency) into {key: converted
+        total}. `key` is a callable on the row. Rows whose currency has no
+        rate are left out of the totals; pass a dict as `unconverted` to get
+        them back summed per currency.
+        """
+        by_key = defaultdict(lambda: defaultdict(Decimal))
+        for row in rows:
+            by_key[key(row)][row[currency_field]] += row[amount_field] or Decimal('0')
+        folded = {}
+        for k, totals in by_key.items():
+            folded[k], missing = cls.convert_totals(totals, to_currency)
+            if unconverted is not None:
+                for code, amount in missing.items():
+                    unconverted[code] = unconverted.get(code, Decimal('0')) + amount
+        return folded
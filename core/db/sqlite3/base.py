@@ -0,0 +1,41 @@
+"""
+SQLite backend for running the app with several concurrent users.
+
+Each new connection gets DEFAULT_PRAGMAS: WAL journaling so readers never
+block the writer, a busy timeout so a second writer waits for the lock
+instead of failing with "database is locked", and a larger page cache and
+memory map. Extra OPTIONS on top of the stock sqlite3 ones:
+
+    'pragmas':   {name: value} merged over DEFAULT_PRAGMAS
+    'read_only': True sets PRAGMA query_only, for the `read` alias
+
+Pair it with the stock 'transaction_mode': 'IMMEDIATE' so a transaction
+takes the write lock when it starts. A DEFERRED transaction that reads and
+then writes can't wait for the lock and fails at once.
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **kwargs.pop('pragmas', {})}
+        if kwargs.pop('read_only', False):
+            self.pragmas['query_only'] = 'ON'
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
@@ -0,0 +1,152 @@
+import logging
+from django.conf import settings
+from django.db import models, router, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Cascade chains deeper than this are treated as a modelling mistake
+MAX_CASCADE_DEPTH = 8
+
+
+class ChunkedDeleter:
+    """
+    Deletes one row and everything that cascades from it without Django's
+    Collector, which loads every dependent row into memory first.
+
+    The cascade is walked from the model graph, children first. Each child
+    table is then emptied in primary-key batches of `batch_size`, with one
+    short DELETE (or UPDATE ... = NULL for SET_NULL relations) per batch.
+    Model signals are not sent, so callers refresh any derived state
+    themselves.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or getattr(settings, 'DELETION_BATCH_SIZE', 1000)
+
+    @staticmethod
+    def plan(model, path='pk', depth=0):
+        """[(action, model, field_name, lookup)] in execution order for rows of `model` matched by `lookup`"""
+        if depth > MAX_CASCADE_DEPTH:
+            raise RuntimeError(f'Cascade from {model._meta.label} is deeper than {MAX_CASCADE_DEPTH} levels')
+
+        steps = []
+        for rel in model._meta.get_fields(include_hidden=True):
+            if not (rel.auto_created and not rel.concrete and (rel.one_to_many or rel.one_to_one)):
+                continue
+            child, field = rel.related_model, rel.field
+            child_path = f'{field.name}__{path}'
+            if rel.on_delete is models.CASCADE:
+                steps.extend(ChunkedDeleter.plan(child, child_path, depth + 1))
+                steps.append(('delete', child, None, child_path))
+            elif rel.on_delete is models.SET_NULL:
+                steps.append(('nullify', child, field.name, child_path))
+            elif rel.on_delete is models.PROTECT:
+                raise RuntimeError(f'{child._meta.label}.{field.name} protects {model._meta.label}')
+        return steps
+
+    def delete(self, obj):
+        """Delete `obj` and its dependents; returns {model label: rows affected}"""
+        model = type(obj)
+        counts = {}
+        for action, child, field_name, lookup in self.plan(model):
+            affected = self._run(action, child, field_name, {lookup: obj.pk})
+            if affected:
+                counts[child._meta.label] = counts.get(child._meta.label, 0) + affected
+
+        model._base_manager.filter(pk=obj.pk)._raw_delete(router.db_for_write(model))
+        counts[model._meta.label] = counts.get(model._meta.label, 0) + 1
+        return counts
+
+    def _run(self, action, model, field_name, filters):
+        manager = model._base_manager
+        using = router.db_for_write(model)
+        total = 0
+        while True:
+            ids = list(manager.filter(**filters).values_list('pk', flat=True)[:self.batch_size])
+            if not ids:
+                return total
+            with transaction.atomic(using=using):
+                batch = manager.filter(pk__in=ids)
+                if action == 'delete':
+                    batch._raw_delete(using)
+                else:
+                    batch.update(**{field_name: None})
+            total += len(ids)
+
+
+class DeletionService:
+    """
+    Soft deletion for groups and accounts. The row is hidden immediately; the
+    reap_deleted command removes it and its dependents later with ChunkedDeleter.
+    """
+
+    @staticmethod
+    def soft_delete_group(group):
+        """Hide `group` now. Its balances and memberships are small, so they go straight away"""
+        from balances.models import Balance
+        from groups.services import Membership, MembershipService
+
+        with transaction.atomic():
+            group.deleted_at = timezone.now()
+            group.save(update_fields=['deleted_at'])
+            Balance.objects.filter(group=group).delete()
+            member_ids = Membership.objects.filter(group_id=group.pk).values_list('user_id', flat=True)
+            MembershipService.remove_members(group, list(member_ids), check_balances=False)
+
+    @staticmethod
+    def soft_delete_user(user):
+        """Deactivate the account and take it out of search right away"""
+        from accounts.models import UserSearchTerm
+
+        with transaction.atomic():
+            user.is_active = False
+            user.deleted_at = timezone.now()
+            user.save(update_fields=['is_active', 'deleted_at'])
+            UserSearchTerm.objects.filter(user=user).delete()
+
+    @staticmethod
+    def reap_groups(limit=None, batch_size=None):
+        from groups.models import Group
+
+        deleter = ChunkedDeleter(batch_size)
+        groups = Group.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at')
+        reaped = []
+        for group in groups[:limit] if limit else groups:
+            counts = deleter.delete(group)
+            logger.info("Reaped group %s: %s", group.pk, counts)
+            reaped.append((group, counts))
+        return reaped
+
+    @staticmethod
+    def reap_users(limit=None, batch_size=None):
+        """
+        Delete soft-deleted accounts. Their expenses and settlements go with
+        them, so the ledgers of the groups they were in are recalculated.
+        """
+        from accounts.models import User
+        from accounts.services import FriendSuggestionEngine
+        from balances.services import BalanceCalculator
+        from expenses.models import Expense, ExpenseShare
+        from groups.models import Group
+        from groups.services import Membership, MembershipService, GroupVersion, GroupStatsService
+
+        deleter = ChunkedDeleter(batch_size)
+        users = User.objects.filter(deleted_at__isnull=False).order_by('deleted_at')
+        reaped = []
+        for user in users[:limit] if limit else users:
+            group_ids = set(Membership.objects.filter(user_id=user.pk).values_list('group_id', flat=True))
+            group_ids |= set(Expense.objects.filter(paid_by_id=user.pk).values_list('group_id', flat=True).distinct())
+            group_ids |= set(ExpenseShare.objects.filter(user_id=user.pk).values_list('expense__group_id', flat=True).distinct())
+
+            counts = deleter.delete(user)
+            logger.info("Reaped user %s: %s", user.pk, counts)
+
+            MembershipService.invalidate(group_ids)
+            GroupVersion.bump_membership(group_ids)
+            for group in Group.objects.filter(id__in=group_ids):
+                BalanceCalculator.recalculate_group_balances(group)
+            GroupStatsService.rebuild(group_ids)
+            FriendSuggestionEngine.mark_group_stale(group_ids)
+            reaped.append((user, counts))
+        return reaped
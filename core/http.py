@@ -0,0 +1,103 @@
+import hashlib
+from functools import wraps
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from .idempotency import MAX_KEY_LENGTH, MISMATCH, NEW, REPLAY, Idempotency
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def conditional_on(marker_func):
+    """
+    Conditional GET for polled JSON views.
+
+    `marker_func(request, *args, **kwargs)` must be cheap and return either
+    None (no validators; the view always runs) or a tuple
+    `(version, last_modified)` where `version` is any repr-able value that
+    changes whenever the response would. The marker is computed once per
+    request and shared by the ETag and Last-Modified checks, so an unchanged
+    poll gets a 304 without running the view body at all.
+    """
+    def decorator(view):
+        def marker(request, *args, **kwargs):
+            if not hasattr(request, '_version_marker'):
+                request._version_marker = marker_func(request, *args, **kwargs)
+            return request._version_marker
+
+        def etag_func(request, *args, **kwargs):
+            found = marker(request, *args, **kwargs)
+            if found is None:
+                return None
+            return make_etag(request.user.pk, request.get_full_path(), found[0])
+
+        def last_modified_func(request, *args, **kwargs):
+            found = marker(request, *args, **kwargs)
+            return found[1] if found else None
+
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def _wrapped(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # Per-user data: let the browser keep it but always revalidate
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return _wrapped
+    return decorator
+
+
+def idempotent(scope):
+    """
+    Replay the stored response for a repeated `Idempotency-Key` header or
+    `idempotency_key` form field instead of running the view again (see
+    core.idempotency). Requests without a key run as usual.
+    """
+    def decorator(view):
+        @wraps(view)
+        def _wrapped(request, *args, **kwargs):
+            if request.method != 'POST' or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            # Fingerprint first: it reads the raw body, which request.POST would otherwise consume
+            fingerprint = Idempotency.fingerprint(request)
+            key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return JsonResponse({'success': False, 'error': 'Idempotency key is too long'}, status=400)
+
+            state, record = Idempotency.begin(request.user, scope, key, fingerprint)
+            if state == REPLAY:
+                stored = record.response
+                response = HttpResponse(
+                    stored['body'], status=record.status_code, content_type=stored['content_type'],
+                )
+                if stored.get('location'):
+                    response['Location'] = stored['location']
+                response['Idempotent-Replayed'] = 'true'
+                return response
+            if state == MISMATCH:
+                return JsonResponse(
+                    {'success': False, 'error': 'Idempotency key was already used for a different request'},
+                    status=422,
+                )
+            if state != NEW:
+                return JsonResponse({'success': False, 'error': 'A request with this key is in progress'}, status=409)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                Idempotency.release(record)
+                raise
+            Idempotency.finish(record, response.status_code, {
+                'body': response.content.decode(response.charset),
+                'content_type': response.get('Content-Type'),
+                'location': response.get('Location'),
+            })
+            return response
+
+        return _wrapped
+    return decorator
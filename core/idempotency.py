@@ -0,0 +1,97 @@
+"""
+Idempotency keys for create endpoints that clients retry.
+
+A client sends the same `Idempotency-Key` header (or `idempotency_key` form
+field) with every retry of one logical request. The first request claims
+the key and runs. Its response is stored against the key. Retries within
+IDEMPOTENCY_KEY_TTL_HOURS get that response back without running the view
+again. A retry arriving while the first request still runs gets 409. Reusing
+a key with a different payload gets 422. A claim older than
+IDEMPOTENCY_LOCK_SECONDS that never finished (the worker died) is taken
+over by the next retry.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+
+FORM_CONTENT_TYPES = ('multipart/form-data', 'application/x-www-form-urlencoded')
+
+NEW, REPLAY, IN_PROGRESS, MISMATCH = 'new', 'replay', 'in_progress', 'mismatch'
+
+
+def _ttl():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+class Idempotency:
+
+    @staticmethod
+    def fingerprint(request, body=None):
+        """Identifies the payload, so a reused key with different content is caught"""
+        if body is None:
+            body = request.body
+            if request.content_type in FORM_CONTENT_TYPES:
+                # Multipart boundaries change on every submit; compare the fields instead
+                body = json.dumps(sorted(request.POST.lists())).encode()
+        digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+        digest.update(body)
+        return digest.hexdigest()
+
+    @staticmethod
+    def begin(user, scope, key, fingerprint):
+        """Claim `key` for this request. Returns (NEW | REPLAY | IN_PROGRESS | MISMATCH, record)"""
+        key_hash = hashlib.sha256(f'{user.pk}:{scope}:{key}'.encode()).hexdigest()
+        now = timezone.now()
+        IdempotencyKey.objects.filter(key_hash=key_hash, created_at__lt=now - _ttl()).delete()
+
+        try:
+            with transaction.atomic():
+                return NEW, IdempotencyKey.objects.create(key_hash=key_hash, fingerprint=fingerprint, created_at=now)
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(key_hash=key_hash).first()
+        if record is None:
+            # Purged between our insert and this read; the client can retry
+            return IN_PROGRESS, None
+        if record.fingerprint != fingerprint:
+            return MISMATCH, record
+        if record.status_code is not None:
+            return REPLAY, record
+
+        stale = now - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60))
+        taken = IdempotencyKey.objects.filter(
+            key_hash=key_hash, status_code__isnull=True, created_at__lt=stale,
+        ).update(created_at=now)
+        return (NEW, record) if taken else (IN_PROGRESS, record)
+
+    @staticmethod
+    def finish(record, status_code, response):
+        """Store the response retries will get. Server errors release the key instead"""
+        if status_code >= 500:
+            Idempotency.release(record)
+            return
+        record.status_code = status_code
+        record.response = response
+        record.save(update_fields=['status_code', 'response'])
+
+    @staticmethod
+    def release(record):
+        IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True).delete()
+
+    @staticmethod
+    def purge(batch_size=1000):
+        """Delete expired keys in batches; returns the number removed"""
+        cutoff = timezone.now() - _ttl()
+        removed = 0
+        while True:
+            ids = list(IdempotencyKey.objects.filter(created_at__lt=cutoff).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return removed
+            removed += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
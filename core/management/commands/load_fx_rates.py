@@ -0,0 +1,67 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from core.currency import FxRates, base_currency
+from core.models import FxRate
+
+class Command(BaseCommand):
+    help = 'Load FX rates from a local JSON or CSV file into the FxRate table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            help='JSON {"base": ..., "as_of": ..., "rates": {...}} or CSV with currency,rate columns '
+                 '(defaults to settings.FX_RATES_FILE)',
+        )
+        parser.add_argument('--base', help='Base currency of a CSV file (defaults to FX_BASE_CURRENCY)')
+        parser.add_argument('--as-of', help='Date the rates apply to (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'] or getattr(settings, 'FX_RATES_FILE', ''))
+        if not path.is_file():
+            raise CommandError(f'Rates file not found: {path}')
+
+        base, as_of, raw = self._read(path, options)
+        try:
+            rates = {code.strip().upper(): Decimal(str(value)) for code, value in raw.items()}
+        except InvalidOperation:
+            raise CommandError('Rates must be numeric')
+        if any(rate <= 0 for rate in rates.values()):
+            raise CommandError('Rates must be positive')
+
+        # Store everything relative to our base currency
+        target = base_currency()
+        rates[base] = Decimal('1')
+        if target not in rates:
+            raise CommandError(f'File has no rate for the base currency {target}')
+        pivot = rates[target]
+        rows = [
+            FxRate(currency=code, rate=(rate / pivot).quantize(Decimal('1e-10')), as_of=as_of)
+            for code, rate in rates.items() if code != target
+        ]
+
+        FxRate.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['currency'],
+            update_fields=['rate', 'as_of', 'updated_at'],
+        )
+        FxRates.clear()
+        self.stdout.write(self.style.SUCCESS(f'✓ Loaded {len(rows)} rates against {target}'))
+
+    def _read(self, path, options):
+        as_of = parse_date(options['as_of']) if options['as_of'] else None
+        if path.suffix.lower() == '.json':
+            with path.open() as fh:
+                data = json.load(fh)
+            base = (options['base'] or data.get('base') or base_currency()).upper()
+            return base, as_of or parse_date(data.get('as_of') or ''), data.get('rates', {})
+
+        with path.open(newline='') as fh:
+            raw = {row['currency']: row['rate'] for row in csv.DictReader(fh)}
+        return (options['base'] or base_currency()).upper(), as_of, raw
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core.idempotency import Idempotency
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per DELETE')
+
+    def handle(self, *args, **options):
+        removed = Idempotency.purge(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Purged {removed} expired idempotency keys'))
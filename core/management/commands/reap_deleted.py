@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from core.deletion import DeletionService
+
+class Command(BaseCommand):
+    help = 'Permanently delete soft-deleted groups and accounts in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=['groups', 'users'], help='Reap one kind only')
+        parser.add_argument('--limit', type=int, help='Maximum groups/accounts to reap of each kind this run')
+        parser.add_argument('--batch-size', type=int, help='Rows per DELETE (default: DELETION_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        only = options.get('only')
+        kwargs = {'limit': options.get('limit'), 'batch_size': options.get('batch_size')}
+
+        if only in (None, 'groups'):
+            for group, counts in DeletionService.reap_groups(**kwargs):
+                self.stdout.write(f'Group {group.pk} ({group.name}): {sum(counts.values())} rows')
+            self.stdout.write(self.style.SUCCESS('✓ Groups reaped'))
+
+        if only in (None, 'users'):
+            for user, counts in DeletionService.reap_users(**kwargs):
+                self.stdout.write(f'User {user.pk} ({user.username}): {sum(counts.values())} rows')
+            self.stdout.write(self.style.SUCCESS('✓ Accounts reaped'))
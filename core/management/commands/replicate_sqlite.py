@@ -0,0 +1,25 @@
+import time
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from core.replication import replicate
+from core.routers import READ_ALIAS
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database over the read replica file, once or on an interval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=DEFAULT_DB_ALIAS, help='Database alias to copy from')
+        parser.add_argument('--target', default=READ_ALIAS, help='Database alias to copy to')
+        parser.add_argument('--interval', type=float, help='Keep copying every N seconds until interrupted')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                replicate(options['source'], options['target'])
+            except (ImproperlyConfigured, KeyError) as exc:
+                raise CommandError(f'Cannot replicate: {exc}')
+            self.stdout.write(self.style.SUCCESS(f"✓ Copied {options['source']} to {options['target']}"))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,110 @@
+import json
+import logging
+import subprocess
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from core.benchmarks import DEFAULT_SPLIT_MIX, GroupShape, compare, run_suite
+
+class Command(BaseCommand):
+    help = 'Time the balance, simplification, dashboard and notification hot paths on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=10, help='Members per synthetic group')
+        parser.add_argument('--expenses', type=int, default=200, help='Expenses per synthetic group')
+        parser.add_argument('--settlements', type=int, default=20, help='Settlements per synthetic group')
+        parser.add_argument(
+            '--split-mix',
+            default=','.join(f'{k}={v}' for k, v in DEFAULT_SPLIT_MIX.items()),
+            help='Relative weights of split types, e.g. equal=0.6,unequal=0.2,percentage=0.2',
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed runs before timing')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+        parser.add_argument('--compare', help='Baseline JSON file to report median/query deltas against')
+
+    def handle(self, *args, **options):
+        if options['members'] < 2:
+            raise CommandError('--members must be at least 2')
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+
+        shape = GroupShape(
+            members=options['members'],
+            expenses=options['expenses'],
+            settlements=options['settlements'],
+            split_mix=self._parse_mix(options['split_mix']),
+            seed=options['seed'],
+        )
+        baseline = self._load(options['compare']) if options['compare'] else None
+
+        # Synthetic data never touches the real database
+        setup_test_environment()
+        # One log line per timed request would drown the report
+        request_logger = logging.getLogger('splitwise.requests')
+        previous_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = run_suite(shape, repeat=options['repeat'], warmup=options['warmup'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            request_logger.setLevel(previous_level)
+
+        report['meta']['commit'] = self._git_commit()
+        report['meta']['timestamp'] = timezone.now().isoformat()
+        if baseline is not None:
+            report['comparison'] = compare(report, baseline)
+
+        payload = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(payload + '\n')
+            for result in report['results']:
+                self.stdout.write(
+                    f"{result['name']:<30} median {result['median_ms']:>9.2f} ms  {result['queries']:>5} queries"
+                )
+            self.stdout.write(self.style.SUCCESS(f"✓ Wrote {len(report['results'])} results to {options['output']}"))
+        else:
+            self.stdout.write(payload)
+
+        for row in report.get('comparison', []):
+            self.stderr.write(
+                f"{row['name']:<30} {row['change_pct']:+7.1f}%  "
+                f"queries {row['baseline_queries']} -> {row['queries']}"
+            )
+
+    def _parse_mix(self, raw):
+        mix = {}
+        for part in raw.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if name not in DEFAULT_SPLIT_MIX:
+                raise CommandError(f'Unknown split type: {name}')
+            try:
+                mix[name] = float(weight)
+            except ValueError:
+                raise CommandError(f'Invalid weight for {name}: {weight}')
+        if not mix or sum(mix.values()) <= 0:
+            raise CommandError('--split-mix needs at least one positive weight')
+        return mix
+
+    def _load(self, path):
+        try:
+            return json.loads(Path(path).read_text())
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Could not read baseline {path}: {exc}')
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
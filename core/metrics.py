@@ -0,0 +1,85 @@
+import threading
+from bisect import bisect_left
+from collections import deque
+from django.conf import settings
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Routes beyond this many are folded into one bucket so the registry stays bounded
+MAX_TRACKED_ROUTES = 500
+OTHER_ROUTE = '<other>'
+
+
+class _RouteStats:
+    __slots__ = ('count', 'buckets', 'recent')
+
+    def __init__(self, ring_size):
+        self.count = 0
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.recent = deque(maxlen=ring_size)
+
+    def add(self, sample):
+        self.count += 1
+        self.buckets[bisect_left(HISTOGRAM_BUCKETS_MS, sample['total_ms'])] += 1
+        self.recent.append(sample)
+
+    def snapshot(self):
+        recent = list(self.recent)
+        summary = {'count': self.count, 'histogram_ms': self._histogram()}
+        if recent:
+            totals = sorted(s['total_ms'] for s in recent)
+            summary['recent'] = {
+                'samples': len(recent),
+                'p50_ms': _percentile(totals, 50),
+                'p95_ms': _percentile(totals, 95),
+                'max_ms': totals[-1],
+                'avg_queries': round(sum(s['queries'] for s in recent) / len(recent), 1),
+                'avg_db_ms': round(sum(s['db_ms'] for s in recent) / len(recent), 2),
+                'avg_template_ms': round(sum(s['template_ms'] for s in recent) / len(recent), 2),
+            }
+            summary['last'] = recent[-1]
+        return summary
+
+    def _histogram(self):
+        labels = [f'<={b}' for b in HISTOGRAM_BUCKETS_MS] + [f'>{HISTOGRAM_BUCKETS_MS[-1]}']
+        return dict(zip(labels, self.buckets))
+
+
+def _percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class RequestMetrics:
+    """
+    Process-local per-route request metrics: cumulative latency histograms
+    plus a ring buffer of the most recent samples for each route. Filled by
+    core.middleware.RequestMetricsMiddleware and read by the staff metrics view.
+    """
+
+    _lock = threading.Lock()
+    _routes = {}
+
+    @classmethod
+    def ring_size(cls):
+        return getattr(settings, 'REQUEST_METRICS_RING_SIZE', 200)
+
+    @classmethod
+    def record(cls, route, sample):
+        with cls._lock:
+            stats = cls._routes.get(route)
+            if stats is None:
+                if len(cls._routes) >= MAX_TRACKED_ROUTES:
+                    route = OTHER_ROUTE
+                stats = cls._routes.setdefault(route, _RouteStats(cls.ring_size()))
+            stats.add(sample)
+
+    @classmethod
+    def snapshot(cls):
+        with cls._lock:
+            return {route: stats.snapshot() for route, stats in sorted(cls._routes.items())}
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._routes.clear()
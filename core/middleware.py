@@ -0,0 +1,189 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from pathlib import Path
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template as DjangoBackendTemplate
+from .metrics import RequestMetrics
+from .profiling import SORT_KEYS, RequestProfile
+from .routers import is_pinned, pin, routing_scope
+
+logger = logging.getLogger('splitwise.requests')
+profile_logger = logging.getLogger('splitwise.profiling')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class _Collector:
+    __slots__ = ('queries', 'db_seconds', 'template_seconds', 'template_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+def _install_template_timer():
+    """Time top-level Django template renders (includes are counted in their parent)"""
+    original = DjangoBackendTemplate.render
+    if getattr(original, '_timed', False):
+        return
+
+    def render(self, context=None, request=None):
+        collector = _current.get()
+        if collector is None:
+            return original(self, context, request)
+        collector.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            collector.template_depth -= 1
+            if collector.template_depth == 0:
+                collector.template_seconds += time.perf_counter() - start
+
+    render._timed = True
+    DjangoBackendTemplate.render = render
+
+
+class RequestMetricsMiddleware:
+    """
+    Records query count, DB time, template render time and total time for
+    every request. Each request is logged as one JSON line on the
+    `splitwise.requests` logger and folded into core.metrics.RequestMetrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'REQUEST_METRICS_ENABLED', True)
+        self.slow_ms = getattr(settings, 'REQUEST_METRICS_SLOW_MS', 500)
+        if self.enabled:
+            _install_template_timer()
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        collector = _Collector()
+        token = _current.set(collector)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(collector))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total_ms = round((time.perf_counter() - start) * 1000, 2)
+        route = self._route(request)
+        sample = {
+            'method': request.method,
+            'route': route,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': total_ms,
+            'db_ms': round(collector.db_seconds * 1000, 2),
+            'template_ms': round(collector.template_seconds * 1000, 2),
+            'queries': collector.queries,
+        }
+        RequestMetrics.record(f'{request.method} {route}', sample)
+
+        level = logging.WARNING if total_ms >= self.slow_ms else logging.INFO
+        logger.log(level, json.dumps(sample), extra={'metrics': sample})
+        return response
+
+    @staticmethod
+    def _route(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return '<unresolved>'
+        if not match.route:
+            return match.view_name
+        # Router-generated routes are regexes; drop the anchors
+        return '/' + match.route.replace('^', '').replace('$', '')
+
+
+class ProfilingMiddleware:
+    """
+    Profiles one request on demand. A staff user sends `X-Profile: 1` (or a
+    pstats sort key such as `tottime`) and optionally `X-Profile-Top: N`;
+    the request then runs under a core.profiling.RequestProfile, the
+    per-section totals come back in a Server-Timing header and the top-N
+    cProfile stats are logged on `splitwise.profiling` (and written to
+    PROFILING_DUMP_DIR as a .prof file when that is set).
+
+    Only session-authenticated users are visible here, so JWT-only API
+    clients can't trigger it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PROFILING_ENABLED', True)
+        self.default_top = getattr(settings, 'PROFILING_TOP_N', 30)
+        self.dump_dir = getattr(settings, 'PROFILING_DUMP_DIR', None)
+
+    def __call__(self, request):
+        flag = request.headers.get('X-Profile', '').strip().lower()
+        user = getattr(request, 'user', None)
+        if not (self.enabled and flag and user is not None and user.is_staff):
+            return self.get_response(request)
+
+        sort = flag if flag in SORT_KEYS else 'cumulative'
+        try:
+            top = max(1, int(request.headers.get('X-Profile-Top', self.default_top)))
+        except ValueError:
+            top = self.default_top
+
+        profile = RequestProfile()
+        with profile.activate():
+            response = self.get_response(request)
+
+        timings = profile.section_timings()
+        if timings:
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={ms};desc="{calls} calls"' for name, calls, ms in timings
+            )
+        profile_logger.info(
+            'Profile for %s %s\n%s\n%s',
+            request.method,
+            request.get_full_path(),
+            '\n'.join(f'  {name}: {calls} calls, {ms} ms' for name, calls, ms in timings) or '  (no profiled sections)',
+            profile.stats_text(sort=sort, top=top),
+        )
+        if self.dump_dir and timings:
+            path = Path(self.dump_dir)
+            path.mkdir(parents=True, exist_ok=True)
+            profile.dump(path / f'{int(time.time() * 1000)}-{request.user.pk}.prof')
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Read-your-writes for core.routers.ReadWriteRouter. A request from a
+    client that wrote within REPLICA_STICKY_SECONDS reads only from the
+    primary. A request that writes starts (or extends) that window by
+    setting the signed pin cookie on its response.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routing_scope(pinned=is_pinned(request)) as state:
+            response = self.get_response(request)
+        if state.wrote:
+            pin(response)
+        return response
@@ -1,3 +1,29 @@
 from django.db import models
 
-# Create your models here.
+
+class FxRate(models.Model):
+    """Units of `currency` per one unit of settings.FX_BASE_CURRENCY, loaded by load_fx_rates"""
+    currency = models.CharField(max_length=3, unique=True)
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+    as_of = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"1 base = {self.rate} {self.currency}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client's Idempotency-Key and the response it produced. Keyed by a hash
+    of (user, scope, key) so the row stays small; purged after
+    IDEMPOTENCY_KEY_TTL_HOURS by purge_idempotency_keys.
+    """
+    key_hash = models.CharField(max_length=64, primary_key=True)
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key_hash[:12]} ({self.status_code or 'pending'})"
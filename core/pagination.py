@@ -0,0 +1,66 @@
+import base64
+import json
+from django.db.models import Q
+
+
+def encode_cursor(values):
+    """Pack the sort key of the last row on a page into an opaque token"""
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Return the list of key values in `token`, or None if it is malformed"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def seek_q(fields, values, descending=True):
+    """
+    Build the "strictly after this row" predicate for a sort on `fields`,
+    e.g. (date < d) OR (date = d AND id < i) when descending.
+    """
+    lookup = 'lt' if descending else 'gt'
+    condition = Q()
+    for i, field in enumerate(fields):
+        equal = {f: v for f, v in zip(fields[:i], values[:i])}
+        condition |= Q(**equal) & Q(**{f'{field}__{lookup}': values[i]})
+    return condition
+
+
+def _key(row, fields):
+    if isinstance(row, dict):
+        return [row[f] for f in fields]
+    return [getattr(row, f) for f in fields]
+
+
+def paginate_keyset(queryset, fields, cursor=None, page_size=25, descending=True):
+    """
+    Keyset (seek) pagination, newest-first unless `descending` is False.
+
+    `fields` must uniquely order the rows, with the tie-breaker last. Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    fields = list(fields)
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(*[f'{prefix}{f}' for f in fields])
+
+    values = decode_cursor(cursor, len(fields))
+    if values is not None:
+        queryset = queryset.filter(seek_q(fields, values, descending))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(_key(rows[-1], fields))
+
+    return rows, next_cursor
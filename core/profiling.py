@@ -0,0 +1,92 @@
+"""
+Opt-in profiling for hot paths.
+
+Code marks interesting regions with the `profiled(name)` decorator or the
+`section(name)` context manager. Both are no-ops unless a RequestProfile is
+active (ProfilingMiddleware starts one for staff requests carrying the
+X-Profile header); then every section's calls and wall time are tallied and
+cProfile runs for as long as any section is open, so the stats cover only
+the instrumented code.
+"""
+import cProfile
+import io
+import pstats
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+SORT_KEYS = ('cumulative', 'tottime', 'calls', 'ncalls')
+
+_active = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.sections = defaultdict(lambda: [0, 0.0])
+        self.depth = 0
+
+    @contextmanager
+    def activate(self):
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def section_timings(self):
+        """[(name, calls, ms)] slowest first"""
+        return sorted(
+            ((name, calls, round(seconds * 1000, 2)) for name, (calls, seconds) in self.sections.items()),
+            key=lambda row: row[2],
+            reverse=True,
+        )
+
+    def stats_text(self, sort='cumulative', top=30):
+        if not self.sections:
+            return ''
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).strip_dirs().sort_stats(sort).print_stats(top)
+        return out.getvalue()
+
+    def dump(self, path):
+        self.profiler.dump_stats(path)
+
+
+@contextmanager
+def section(name):
+    profile = _active.get()
+    if profile is None:
+        yield
+        return
+
+    if profile.depth == 0:
+        profile.profiler.enable()
+    profile.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        profile.depth -= 1
+        if profile.depth == 0:
+            profile.profiler.disable()
+        tally = profile.sections[name]
+        tally[0] += 1
+        tally[1] += elapsed
+
+
+def profiled(name):
+    """Decorator form of `section`"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active.get() is None:
+                return func(*args, **kwargs)
+            with section(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,32 @@
+"""
+A stand-in for database replication between two SQLite files.
+
+`replicate()` copies the primary file over the replica with SQLite's online
+backup API. The copy is consistent and readers of the replica are never
+blocked for long. Run `manage.py replicate_sqlite --interval N` next to the
+app to get a replica that lags by up to N seconds, which is enough to
+exercise core.routers' read-your-writes stickiness without a real database
+server.
+"""
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from .routers import READ_ALIAS
+
+
+def _sqlite_path(alias):
+    config = connections.settings[alias]
+    if 'sqlite3' not in config['ENGINE']:
+        raise ImproperlyConfigured(f"Database '{alias}' is not SQLite")
+    return Path(config['NAME'])
+
+
+def replicate(source_alias=DEFAULT_DB_ALIAS, target_alias=READ_ALIAS):
+    source, target = _sqlite_path(source_alias), _sqlite_path(target_alias)
+    if source.resolve() == target.resolve():
+        raise ImproperlyConfigured(f"'{source_alias}' and '{target_alias}' are the same file")
+
+    with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(target)) as dst:
+        src.backup(dst)
@@ -0,0 +1,109 @@
+"""
+Sends the queries of read-only views to the `read` database alias, which
+may be the same SQLite file opened query-only or a lagging replica.
+
+Views opt in with the `read_only` decorator. Everything else stays on
+`default`, including any query made inside a transaction on default and
+every read in a request after that request has written. A client that
+wrote recently is pinned to default for REPLICA_STICKY_SECONDS, so it reads
+its own writes even while the replica catches up. ReplicaStickinessMiddleware
+opens the per-request routing state and records the pin in a signed cookie,
+which every worker process can check without a shared cache.
+
+The routing is skipped entirely when no `read` alias is configured, as
+under `manage.py test`.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_ALIAS = 'read'
+# Signed, timestamped cookie marking a client that wrote recently
+PIN_COOKIE = 'db_pin'
+
+_reading = ContextVar('read_only_view', default=False)
+_request_state = ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    """Per-request routing flags; `wrote` is set by the router on the first write"""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+@contextmanager
+def reading():
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    state = RoutingState(pinned)
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+
+def read_only(view):
+    """Route the view's reads to the read alias"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reading():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def is_pinned(request):
+    """Whether `request` carries an unexpired pin cookie from a recent write"""
+    seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+    return seconds > 0 and request.get_signed_cookie(
+        PIN_COOKIE, default=None, salt=PIN_COOKIE, max_age=seconds
+    ) is not None
+
+
+def pin(response):
+    """Keep the client that gets `response` reading from the primary for REPLICA_STICKY_SECONDS"""
+    seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+    if seconds > 0:
+        response.set_signed_cookie(
+            PIN_COOKIE, '1', salt=PIN_COOKIE, max_age=seconds, httponly=True,
+            samesite='Lax', secure=settings.SESSION_COOKIE_SECURE,
+        )
+
+
+class ReadWriteRouter:
+    primary = DEFAULT_DB_ALIAS
+    replica = READ_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if not _reading.get() or self.replica not in connections.settings:
+            return self.primary
+        state = _request_state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return self.primary
+        if connections[self.primary].in_atomic_block:
+            return self.primary
+        return self.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        # Instances loaded through the replica still save to the primary
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != self.replica
@@ -0,0 +1,34 @@
+import re
+import unicodedata
+from django.db.models import Q
+
+MAX_TERM_LENGTH = 64
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Lowercase and strip accents so 'Café' and 'cafe' index the same way"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return text.casefold()
+
+
+def tokenize(text):
+    """Split text into a de-duplicated, ordered list of normalized terms"""
+    seen = []
+    for word in _WORD_RE.findall(normalize(text)):
+        word = word[:MAX_TERM_LENGTH]
+        if word not in seen:
+            seen.append(word)
+    return seen
+
+
+def prefix_q(field, prefix):
+    """
+    Index-friendly prefix match.
+
+    `__startswith` compiles to LIKE on SQLite, which can't use a plain B-tree
+    index, so express the prefix as a half-open range instead.
+    """
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
@@ -0,0 +1,35 @@
+import logging
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# App loggers that log a line per request or write; tests only need their warnings
+QUIET_LOGGERS = ('splitwise.requests', 'expenses', 'groups', 'balances', 'notifications')
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the suite against `default` alone. A TestCase's rows are uncommitted,
+    so a second connection (the `read` alias) can't see them; read routing is
+    switched off here and core.tests enables it explicitly where it is tested.
+
+    The cache is a DummyCache for the same reason: entries written during a
+    test would outlive its rolled-back rows. Tests of cached behaviour
+    override CACHES themselves.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._routing = override_settings(
+            DATABASE_ROUTERS=[],
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        )
+        self._routing.enable()
+        self._log_levels = {name: logging.getLogger(name).level for name in QUIET_LOGGERS}
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    def teardown_test_environment(self, **kwargs):
+        for name, level in self._log_levels.items():
+            logging.getLogger(name).setLevel(level)
+        self._routing.disable()
+        super().teardown_test_environment(**kwargs)
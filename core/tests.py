@@ -1,3 +1,453 @@
-from django.test import TestCase
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+from unittest import TestCase, mock
+from django.core.cache import cache
+from django.db import OperationalError, connections, transaction
+from django.http import HttpResponse
+from django.db.models import Q
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase as DatabaseTestCase
+from accounts.models import User
+from activity.models import Activity
+from balances.models import Balance, Settlement
+from balances.services import BalanceCalculator
+from expenses.models import Expense, ExpenseParticipant, ExpenseShare, RecurringExpense, RecurringExpenseShare
+from groups.models import Group
+from groups.services import Membership
+from notifications.models import Notification
+from notifications.services import NotificationService
+from .deletion import DeletionService
+from .metrics import RequestMetrics
+from .profiling import RequestProfile
+from .middleware import ReplicaStickinessMiddleware
+from .models import FxRate
+from .replication import replicate
+from .routers import PIN_COOKIE, ReadWriteRouter, read_only, reading, routing_scope
 
-# Create your tests here.
+WRITERS = 4
+WRITES_PER_WRITER = 10
+
+
+class TempSQLiteMixin:
+    """Registers database aliases backed by temporary SQLite files for one test"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def add_database(self, alias, options, engine='core.db.sqlite3', name=None):
+        path = Path(self.tmp.name) / f'{name or alias}.sqlite3'
+        configured = connections.configure_settings({
+            'default': {},
+            alias: {'ENGINE': engine, 'NAME': str(path), 'OPTIONS': options},
+        })
+        connections.settings[alias] = configured[alias]
+        self.addCleanup(self._drop_database, alias)
+        return path
+
+    @staticmethod
+    def _drop_database(alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+
+class SQLiteConcurrencyTests(TempSQLiteMixin, TestCase):
+    """
+    Parallel writers against a real SQLite file. Each transaction reads and
+    then writes, like a balance recompute. The stock backend runs these
+    DEFERRED, so overlapping writers fail with "database is locked". The
+    production options queue them instead.
+
+    These are plain unittest cases: the aliases point at private temporary
+    files, so Django's per-test database isolation doesn't apply.
+    """
+
+    def _configure(self, alias, engine, options):
+        path = self.add_database(alias, options, engine)
+        with closing(sqlite3.connect(path)) as conn:
+            conn.execute('CREATE TABLE ledger (id INTEGER PRIMARY KEY, writer INTEGER, seen INTEGER)')
+
+    def _run_writers(self, alias):
+        start = threading.Barrier(WRITERS)
+        errors = []
+
+        def writer(n):
+            start.wait()
+            try:
+                for _ in range(WRITES_PER_WRITER):
+                    try:
+                        with transaction.atomic(using=alias):
+                            with connections[alias].cursor() as cursor:
+                                cursor.execute('SELECT COUNT(*) FROM ledger')
+                                seen = cursor.fetchone()[0]
+                                time.sleep(0.005)
+                                cursor.execute('INSERT INTO ledger (writer, seen) VALUES (%s, %s)', [n, seen])
+                    except OperationalError as exc:
+                        errors.append(exc)
+            finally:
+                connections[alias].close()
+
+        began = time.perf_counter()
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(WRITERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM ledger')
+            committed = cursor.fetchone()[0]
+        connections[alias].close()
+        return committed, errors, committed / elapsed
+
+    def test_stock_backend_loses_writes(self):
+        self._configure('stock', 'django.db.backends.sqlite3', {})
+        committed, errors, _ = self._run_writers('stock')
+        self.assertTrue(errors)
+        self.assertIn('locked', str(errors[0]))
+        self.assertEqual(committed + len(errors), WRITERS * WRITES_PER_WRITER)
+
+    def test_production_backend_serializes_writers(self):
+        self._configure('tuned', 'core.db.sqlite3', {'transaction_mode': 'IMMEDIATE'})
+        committed, errors, throughput = self._run_writers('tuned')
+        self.assertEqual(errors, [])
+        self.assertEqual(committed, WRITERS * WRITES_PER_WRITER)
+        self.assertGreater(throughput, 0)
+
+        with connections['tuned'].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        connections['tuned'].close()
+
+    def test_read_only_connection_rejects_writes(self):
+        self._configure('replica', 'core.db.sqlite3', {'read_only': True})
+        with self.assertRaises(OperationalError):
+            with connections['replica'].cursor() as cursor:
+                cursor.execute('INSERT INTO ledger (writer, seen) VALUES (0, 0)')
+        connections['replica'].close()
+
+
+class BenchRouter(ReadWriteRouter):
+    primary = 'bench_primary'
+    replica = 'bench_replica'
+
+
+class ReplicaRoutingTests(TempSQLiteMixin, TestCase):
+    """Two SQLite files kept in step by core.replication, routed by ReadWriteRouter"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_database('bench_primary', {'transaction_mode': 'IMMEDIATE'}, name='primary')
+        self.add_database('bench_replica', {'read_only': True}, name='replica')
+        with connections['bench_primary'].schema_editor() as editor:
+            editor.create_model(FxRate)
+        replicate('bench_primary', 'bench_replica')
+
+        routers = override_settings(DATABASE_ROUTERS=[BenchRouter()], REPLICA_STICKY_SECONDS=10)
+        routers.enable()
+        self.addCleanup(routers.disable)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        self.alice = User(pk=1, username='alice')
+        self.bob = User(pk=2, username='bob')
+        self.cookies = {}
+
+    def call(self, view, user):
+        """Run `view` as `user`, keeping each user's cookies between calls like a browser"""
+        request = RequestFactory().get('/')
+        request.user = user
+        jar = self.cookies.setdefault(user.pk, {})
+        request.COOKIES.update(jar)
+        response = ReplicaStickinessMiddleware(view)(request)
+        jar.update({name: morsel.value for name, morsel in response.cookies.items()})
+        return response.content.decode()
+
+    @staticmethod
+    def add_rate(request):
+        FxRate.objects.create(currency='USD', rate=Decimal('0.012'))
+        return HttpResponse()
+
+    @staticmethod
+    @read_only
+    def list_rates(request):
+        return HttpResponse(','.join(FxRate.objects.order_by('currency').values_list('currency', flat=True)))
+
+    def test_reads_go_to_replica_until_it_catches_up(self):
+        self.call(self.add_rate, self.alice)
+        self.assertEqual(self.call(self.list_rates, self.bob), '')
+
+        replicate('bench_primary', 'bench_replica')
+        self.assertEqual(self.call(self.list_rates, self.bob), 'USD')
+
+    def test_writer_reads_own_writes_within_window(self):
+        self.call(self.add_rate, self.alice)
+        self.assertEqual(self.call(self.list_rates, self.alice), 'USD')
+
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 11):
+            self.assertEqual(self.call(self.list_rates, self.alice), '')
+
+    def test_pin_is_checked_without_a_shared_cache(self):
+        self.call(self.add_rate, self.alice)
+        cache.clear()  # another worker process has its own cache
+        self.assertEqual(self.call(self.list_rates, self.alice), 'USD')
+
+        self.cookies[self.alice.pk][PIN_COOKIE] += 'x'
+        self.assertEqual(self.call(self.list_rates, self.alice), '')
+
+    def test_reads_after_a_write_in_the_same_request_use_primary(self):
+        @read_only
+        def add_then_list(request):
+            self.add_rate(request)
+            return self.list_rates.__wrapped__(request)
+
+        self.assertEqual(self.call(add_then_list, self.bob), 'USD')
+
+    def test_objects_read_from_replica_save_to_primary(self):
+        self.call(self.add_rate, self.alice)
+        replicate('bench_primary', 'bench_replica')
+        cache.clear()
+
+        with routing_scope(), reading():
+            rate = FxRate.objects.get(currency='USD')
+        self.assertEqual(rate._state.db, 'bench_replica')
+        rate.rate = Decimal('0.02')
+        rate.save()
+        self.assertEqual(FxRate.objects.using('bench_primary').get(currency='USD').rate, Decimal('0.02'))
+
+
+class DeletionTests(DatabaseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        cls.carol = User.objects.create_user('carol')
+        cls.flat = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.flat.members.add(cls.alice, cls.bob)
+        cls.trip = Group.objects.create(name='Trip', created_by=cls.carol)
+        cls.trip.members.add(cls.alice, cls.bob, cls.carol)
+
+        rent = cls.add_expense(cls.flat, cls.alice, '100.00', {cls.alice: '50.00', cls.bob: '50.00'})
+        cls.add_expense(cls.trip, cls.alice, '30.00', {cls.alice: '10.00', cls.bob: '10.00', cls.carol: '10.00'})
+        fuel = cls.add_expense(cls.trip, cls.carol, '60.00', {cls.bob: '30.00', cls.carol: '30.00'})
+
+        for group, payer, receiver, expense in ((cls.flat, cls.bob, cls.alice, rent), (cls.trip, cls.carol, cls.alice, fuel)):
+            Settlement.objects.create(group=group, payer=payer, receiver=receiver, amount=Decimal('5.00'), created_by=payer)
+            Notification.objects.create(
+                recipient=receiver, sender=payer, notification_type='expense_added',
+                title='Added', message='m', group=group, expense=expense,
+            )
+            Activity.objects.create(user=payer, group=group, verb='expense_added')
+            recurring = RecurringExpense.objects.create(
+                group=group, paid_by=payer, description='Sub', amount=Decimal('10.00'),
+                start_date=date(2024, 1, 1), created_by=payer,
+            )
+            RecurringExpenseShare.objects.create(recurring=recurring, user=payer)
+            RecurringExpenseShare.objects.create(recurring=recurring, user=receiver)
+
+        for group in (cls.flat, cls.trip):
+            BalanceCalculator.recalculate_group_balances(group)
+
+    @staticmethod
+    def add_expense(group, payer, amount, shares):
+        expense = Expense.objects.create(
+            description='Expense', amount=Decimal(amount), paid_by=payer, group=group, date=date(2024, 1, 1),
+        )
+        for user, share in shares.items():
+            ExpenseShare.objects.create(expense=expense, user=user, amount=Decimal(share))
+        return expense
+
+    def ledger(self, group):
+        return sorted(
+            Balance.objects.filter(group=group).values_list('from_user__username', 'to_user__username', 'amount')
+        )
+
+    def test_reaping_a_group_removes_everything_under_it(self):
+        trip_ledger = self.ledger(self.trip)
+        DeletionService.soft_delete_group(self.flat)
+        [(group, counts)] = DeletionService.reap_groups()
+
+        self.assertEqual(group.pk, self.flat.pk)
+        self.assertFalse(Group.all_objects.filter(pk=self.flat.pk).exists())
+        for model in (Expense, ExpenseParticipant, Settlement, Balance, Notification, Activity, RecurringExpense):
+            self.assertFalse(model.objects.filter(group_id=self.flat.pk).exists(), model.__name__)
+        self.assertFalse(ExpenseShare.objects.filter(expense__group_id=self.flat.pk).exists())
+        self.assertFalse(RecurringExpenseShare.objects.filter(recurring__group_id=self.flat.pk).exists())
+        self.assertFalse(Membership.objects.filter(group_id=self.flat.pk).exists())
+
+        self.assertEqual(self.ledger(self.trip), trip_ledger)
+        BalanceCalculator.recalculate_group_balances(self.trip)
+        self.assertEqual(self.ledger(self.trip), trip_ledger)
+
+    def test_reaping_a_user_removes_their_rows_and_fixes_other_ledgers(self):
+        flat_ledger = self.ledger(self.flat)
+        DeletionService.soft_delete_user(self.carol)
+        DeletionService.reap_users()
+
+        carol = self.carol.pk
+        self.assertFalse(User.objects.filter(pk=carol).exists())
+        checks = (
+            (Expense, Q(paid_by_id=carol)),
+            (ExpenseShare, Q(user_id=carol)),
+            (ExpenseParticipant, Q(user_id=carol)),
+            (Settlement, Q(payer_id=carol) | Q(receiver_id=carol) | Q(created_by_id=carol)),
+            (Balance, Q(from_user_id=carol) | Q(to_user_id=carol)),
+            (Notification, Q(recipient_id=carol) | Q(sender_id=carol)),
+            (Activity, Q(user_id=carol)),
+            (RecurringExpense, Q(paid_by_id=carol) | Q(created_by_id=carol)),
+            (RecurringExpenseShare, Q(user_id=carol)),
+            (Membership, Q(user_id=carol)),
+        )
+        for model, condition in checks:
+            self.assertFalse(model.objects.filter(condition).exists(), model.__name__)
+
+        # Only alice's 30.00 expense is left in the trip, without carol's share
+        self.assertEqual(self.ledger(self.trip), [('bob', 'alice', Decimal('10.00'))])
+        self.assertEqual(self.ledger(self.flat), flat_ledger)
+
+
+class RequestMetricsTests(DatabaseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        cls.flat = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.flat.members.add(cls.alice)
+
+    def setUp(self):
+        RequestMetrics.reset()
+        self.addCleanup(RequestMetrics.reset)
+
+    def test_each_request_is_logged_and_recorded(self):
+        self.client.force_login(self.alice)
+        with self.assertLogs('splitwise.requests', 'INFO') as logs, \
+                CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(f'/groups/{self.flat.id}/')
+        self.assertEqual(response.status_code, 200)
+
+        [record] = logs.records
+        sample = json.loads(record.getMessage())
+        self.assertEqual(record.levelname, 'INFO')
+        self.assertEqual(
+            (sample['method'], sample['route'], sample['status'], sample['queries']),
+            ('GET', '/groups/<int:pk>/', 200, len(queries.captured_queries)),
+        )
+        self.assertGreater(sample['template_ms'], 0)
+        self.assertGreaterEqual(sample['total_ms'], sample['db_ms'])
+
+        stats = RequestMetrics.snapshot()['GET /groups/<int:pk>/']
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['last'], sample)
+
+    @override_settings(REQUEST_METRICS_SLOW_MS=0)
+    def test_slow_requests_are_logged_as_warnings(self):
+        with self.assertLogs('splitwise.requests', 'INFO') as logs:
+            self.client.get('/login/')
+        self.assertEqual([r.levelname for r in logs.records], ['WARNING'])
+
+    @override_settings(REQUEST_METRICS_ENABLED=False)
+    def test_disabled_middleware_records_nothing(self):
+        self.client.get('/login/')
+        self.assertEqual(RequestMetrics.snapshot(), {})
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get('/metrics/requests/').status_code, 302)
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get('/metrics/requests/').status_code, 403)
+        self.assertEqual(self.client.delete('/metrics/requests/').status_code, 403)
+        self.assertNotEqual(RequestMetrics.snapshot(), {})
+
+        self.client.force_login(self.admin)
+        # A request is recorded once it returns, so the snapshot shows the earlier two
+        routes = self.client.get('/metrics/requests/').json()['routes']
+        self.assertEqual(routes['GET /metrics/requests/']['count'], 2)
+        self.assertEqual(self.client.delete('/metrics/requests/').json(), {'success': True})
+        self.assertEqual(list(RequestMetrics.snapshot()), ['DELETE /metrics/requests/'])
+
+
+class ProfilingTests(DatabaseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        cls.flat = Group.objects.create(name='Flat', created_by=cls.admin)
+        cls.flat.members.add(cls.admin, cls.alice)
+        cls.expense = Expense.objects.create(
+            description='Rent', amount=Decimal('100.00'), paid_by=cls.admin, group=cls.flat, date=date(2024, 1, 1),
+        )
+        ExpenseShare.objects.create(expense=cls.expense, user=cls.admin, amount=Decimal('50.00'))
+        ExpenseShare.objects.create(expense=cls.expense, user=cls.alice, amount=Decimal('50.00'))
+
+    def setUp(self):
+        # The sections are what's under test; keep xhtml2pdf (and its stylesheet fetches) out of it
+        patcher = mock.patch('expenses.views.pisa.CreatePDF', return_value=mock.Mock(err=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pdf(self, user, **headers):
+        # Middleware reads its settings when the client first loads it
+        client = self.client_class()
+        client.force_login(user)
+        return client.get(f'/api/expenses/{self.expense.id}/pdf/', headers=headers)
+
+    def test_hooks_are_inert_without_an_active_profile(self):
+        profile = RequestProfile()
+        BalanceCalculator.recalculate_group_balances(self.flat)
+        NotificationService.create_notification(self.alice, 'expense_added', 'Added', 'm')
+        self.assertEqual(profile.section_timings(), [])
+        self.assertEqual(profile.stats_text(), '')
+
+        with self.assertNoLogs('splitwise.profiling'):
+            response = self.pdf(self.admin)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_only_staff_can_turn_profiling_on(self):
+        with self.assertNoLogs('splitwise.profiling'):
+            response = self.client.get('/login/', headers={'X-Profile': '1'})
+        self.assertNotIn('Server-Timing', response)
+
+        self.expense.paid_by = self.alice
+        self.expense.save(update_fields=['paid_by'])
+        with self.assertNoLogs('splitwise.profiling'):
+            self.assertNotIn('Server-Timing', self.pdf(self.alice, X_Profile='1'))
+        with override_settings(PROFILING_ENABLED=False), self.assertNoLogs('splitwise.profiling'):
+            self.assertNotIn('Server-Timing', self.pdf(self.admin, X_Profile='1'))
+
+    def test_active_profile_times_balance_and_notification_sections(self):
+        profile = RequestProfile()
+        with profile.activate():
+            BalanceCalculator.recalculate_group_balances(self.flat)
+            NotificationService.create_notification(self.alice, 'expense_added', 'Added', 'm')
+        names = {name: calls for name, calls, _ in profile.section_timings()}
+        self.assertEqual(names['balances.recalculate'], 1)
+        self.assertEqual(names['notifications.create'], 1)
+        self.assertIn('balances.recalculate.write', names)
+        self.assertIn('recalculate_group_balances', profile.stats_text(top=50))
+
+    def test_profiled_pdf_request_reports_its_sections(self):
+        with tempfile.TemporaryDirectory() as dump_dir, override_settings(PROFILING_DUMP_DIR=dump_dir):
+            with self.assertLogs('splitwise.profiling', 'INFO') as logs:
+                response = self.pdf(self.admin, X_Profile='tottime', X_Profile_Top='5')
+            dumps = list(Path(dump_dir).glob('*.prof'))
+
+        timing = response['Server-Timing']
+        for name in ('expenses.pdf;', 'expenses.pdf.render_html;', 'expenses.pdf.convert;'):
+            self.assertIn(name, timing)
+        [message] = logs.output
+        self.assertIn(f'Profile for GET /api/expenses/{self.expense.id}/pdf/', message)
+        self.assertIn('expenses.pdf.convert: 1 calls', message)
+        self.assertIn('Ordered by: internal time', message)
+        self.assertEqual(len(dumps), 1)
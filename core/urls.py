@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path('', views.dashboard, name='home'),
+    path('metrics/requests/', views.request_metrics, name='request_metrics'),
 ]
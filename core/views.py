@@ -1,5 +1,8 @@
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.views.decorators.http import require_http_methods
+from .metrics import RequestMetrics
 from groups.models import Group
 from balances.utils import group_net_balances, simplify_transactions
 
@@ -18,3 +21,15 @@ def dashboard(request):
         'total_expenses': total_expenses,
         'overall_balance': overall_balance,
     })
+
+
+@login_required
+@require_http_methods(['GET', 'DELETE'])
+def request_metrics(request):
+    """Staff-only view of the in-process per-route request metrics; DELETE resets them"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    if request.method == 'DELETE':
+        RequestMetrics.reset()
+        return JsonResponse({'success': True})
+    return JsonResponse({'routes': RequestMetrics.snapshot()})
@@ -1,11 +1,11 @@
 from django.contrib import admin
-from .models import Expense, ExpenseShare, ExpenseCategory
+from .models import Expense, ExpenseShare, ExpenseCategory, RecurringExpense, RecurringExpenseShare
 
 
 class ExpenseShareInline(admin.TabularInline):
     model = ExpenseShare
     extra = 1
-    readonly_fields = ['amount', 'percentage']
+    readonly_fields = ['amount', 'percentage', 'weight', 'adjustment']
 
 
 @admin.register(Expense)
@@ -42,4 +42,18 @@ class ExpenseShareAdmin(admin.ModelAdmin):
     list_display = ['expense', 'user', 'amount', 'percentage']
     list_filter = ['expense__date']
     search_fields = ['expense__description', 'user__username']
-    readonly_fields = ['amount', 'percentage']
\ No newline at end of file
+    readonly_fields = ['amount', 'percentage', 'weight', 'adjustment']
+
+
+class RecurringExpenseShareInline(admin.TabularInline):
+    model = RecurringExpenseShare
+    extra = 1
+
+
+@admin.register(RecurringExpense)
+class RecurringExpenseAdmin(admin.ModelAdmin):
+    list_display = ['description', 'amount', 'currency', 'group', 'frequency', 'interval', 'next_run_date', 'is_active']
+    list_filter = ['frequency', 'is_active', 'currency']
+    search_fields = ['description', 'group__name']
+    inlines = [RecurringExpenseShareInline]
+    readonly_fields = ['last_run_date', 'created_at']
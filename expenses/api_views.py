@@ -0,0 +1,89 @@
+from django.db.models import Prefetch
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from core.api import NewestFirstCursorPagination, SparseFieldsetsViewMixin, IdempotentCreateMixin
+from .models import Expense, ExpenseShare, RecurringExpense, RecurringExpenseShare
+from .serializers import ExpenseSerializer, ExpenseShareSerializer, RecurringExpenseSerializer
+
+
+class ExpenseCursorPagination(NewestFirstCursorPagination):
+    ordering = ('-date', '-id')
+
+
+class ExpenseViewSet(IdempotentCreateMixin, SparseFieldsetsViewMixin, mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """Expenses the user paid for or shares in; POST batch/ creates many at once."""
+    idempotency_scope = 'expenses.add'
+    serializer_class = ExpenseSerializer
+    pagination_class = ExpenseCursorPagination
+
+    def get_queryset(self):
+        expenses = Expense.objects.filter(
+            participants__user=self.request.user, group__deleted_at__isnull=True
+        ).select_related('paid_by', 'group', 'category')
+
+        group_id = self.request.query_params.get('group')
+        if group_id:
+            if not group_id.isdigit():
+                raise ValidationError({'group': 'Must be a group id.'})
+            expenses = expenses.filter(group_id=group_id)
+
+        if self.wants_field('shares'):
+            expenses = expenses.prefetch_related(
+                Prefetch('shares', queryset=ExpenseShare.objects.select_related('user'))
+            )
+        return expenses
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        def create():
+            serializer = self.get_serializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            expenses = serializer.save()
+            return Response(self.get_serializer(expenses, many=True).data, status=status.HTTP_201_CREATED)
+        return self.idempotent(request, create)
+
+
+class ExpenseShareViewSet(SparseFieldsetsViewMixin, viewsets.ReadOnlyModelViewSet):
+    """Shares of every expense visible to the user"""
+    serializer_class = ExpenseShareSerializer
+    pagination_class = NewestFirstCursorPagination
+
+    def get_queryset(self):
+        shares = ExpenseShare.objects.filter(
+            expense__participants__user=self.request.user, expense__group__deleted_at__isnull=True
+        ).select_related('user')
+
+        expense_id = self.request.query_params.get('expense')
+        if expense_id:
+            shares = shares.filter(expense_id=expense_id)
+        return shares
+
+
+class IsTemplateOwner(permissions.BasePermission):
+    """Any group member may read a template; only its creator or payer may change it"""
+    message = 'Only the creator or payer of a recurring expense can change it.'
+
+    def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        return request.user.pk in (obj.created_by_id, obj.paid_by_id)
+
+
+class RecurringExpenseViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
+    """Recurring expense templates in the user's groups; run_recurring_expenses materializes them"""
+    serializer_class = RecurringExpenseSerializer
+    permission_classes = [permissions.IsAuthenticated, IsTemplateOwner]
+    pagination_class = NewestFirstCursorPagination
+
+    def get_queryset(self):
+        recurring = RecurringExpense.objects.filter(group__members=self.request.user)
+        if self.wants_field('shares'):
+            recurring = recurring.prefetch_related(
+                Prefetch('shares', queryset=RecurringExpenseShare.objects.select_related('user'))
+            )
+        return recurring
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
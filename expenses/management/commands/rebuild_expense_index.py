@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from expenses.services import ExpenseIndex
+
+class Command(BaseCommand):
+    help = 'Rebuild the expense participant and search-term index tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of expenses to re-index per transaction',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding expense index...')
+        total = ExpenseIndex.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Indexed {total} expenses'))
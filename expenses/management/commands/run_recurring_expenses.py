@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from expenses.services import RecurringExpenseScheduler, RECURRING_MAX_CATCH_UP
+
+class Command(BaseCommand):
+    help = 'Create expenses for every recurring expense that has come due'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Treat this date (YYYY-MM-DD) as today',
+        )
+        parser.add_argument(
+            '--max-catch-up',
+            type=int,
+            default=RECURRING_MAX_CATCH_UP,
+            help='Most occurrences to create per template in one run',
+        )
+        parser.add_argument(
+            '--no-notify',
+            action='store_true',
+            help='Do not notify group members about the new expenses',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be created without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            today = parse_date(options['date'])
+            if today is None:
+                raise CommandError('--date must be YYYY-MM-DD')
+
+        occurrences, templates = RecurringExpenseScheduler.run(
+            today=today,
+            max_catch_up=options['max_catch_up'],
+            notify=not options['no_notify'],
+            dry_run=options['dry_run'],
+        )
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {verb} {occurrences} expenses from {templates} recurring templates'
+        ))
@@ -3,6 +3,7 @@ from django.conf import settings
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from groups.models import Group  
+from core.currency import format_money
 
 class ExpenseCategory(models.Model):
     """Categories for organizing expenses"""
@@ -36,6 +37,8 @@ class Expense(models.Model):
         ('equal', 'Equal Split'),
         ('unequal', 'Unequal Split'),
         ('percentage', 'Percentage Split'),
+        ('shares', 'Split by Shares'),
+        ('adjustment', 'Equal Split with Adjustments'),
     ]
     
     description = models.CharField(max_length=200)
@@ -76,12 +79,20 @@ class Expense(models.Model):
     
     date = models.DateField()
     notes = models.TextField(blank=True)
+
+    recurring = models.ForeignKey(
+        'RecurringExpense',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='occurrences'
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
-        return f"{self.description} - ₹{self.amount}"
+        return f"{self.description} - {format_money(self.amount, self.currency)}"
     
     class Meta:
         ordering = ['-date', '-created_at']
@@ -89,34 +100,37 @@ class Expense(models.Model):
             models.Index(fields=['-date', '-created_at']),
             models.Index(fields=['paid_by']),
             models.Index(fields=['group']),
+            models.Index(fields=['group', '-created_at', '-id']),
         ]
     
     def get_total_shares(self):
         """Calculate total of all shares"""
-        return sum(share.amount for share in self.shares.all())
-    
+        return sum(self.compute_splits().values(), Decimal('0.00'))
+
     def get_share_for_user(self, user):
         """Get the share amount for a specific user"""
-        try:
-            return self.shares.get(user=user).amount
-        except ExpenseShare.DoesNotExist:
-            return Decimal('0.00')
-    
+        return self.compute_splits().get(user.pk, Decimal('0.00'))
+
+    def compute_splits(self):
+        """{user id: amount owed}; reuses prefetched shares"""
+        from .splits import SplitEngine
+        return SplitEngine.owed([self])[self.pk]
+
     def calculate_balances(self):
         """
         Calculate who owes whom for this expense
         Returns: list of {debtor, creditor, amount} dicts
         """
         balances = []
-        
+
         for share in self.shares.all():
-            if share.user.id != self.paid_by.id:
+            if share.user_id != self.paid_by_id:
                 balances.append({
                     'debtor': share.user,
                     'creditor': self.paid_by,
                     'amount': share.amount
                 })
-        
+
         return balances
 
 
@@ -144,7 +158,21 @@ class ExpenseShare(models.Model):
         blank=True,
         validators=[MinValueValidator(Decimal('0.00'))]
     )
-    
+    # Inputs of the 'shares' and 'adjustment' split types; amount is what's owed
+    weight = models.DecimalField(
+        max_digits=10,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(Decimal('0'))]
+    )
+    adjustment = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True
+    )
+
     class Meta:
         unique_together = ('expense', 'user')
         ordering = ['user__username']
@@ -153,4 +181,176 @@ class ExpenseShare(models.Model):
         ]
     
     def __str__(self):
-        return f"{self.user.username} - ₹{self.amount}"
+        return f"{self.user.username} - {format_money(self.amount, self.expense.currency)}"
+
+
+class ExpenseParticipant(models.Model):
+    """
+    Denormalized (user, expense) index for the expense list.
+
+    One row for the payer and one per share holder, so "expenses I'm involved
+    in" is a single index range scan instead of an OR join with DISTINCT.
+    """
+    expense = models.ForeignKey(
+        Expense,
+        on_delete=models.CASCADE,
+        related_name='participants'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='expense_index'
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ('expense', 'user')
+        indexes = [
+            models.Index(fields=['user', '-date', '-expense']),
+            models.Index(fields=['user', 'group', '-date', '-expense']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} in expense {self.expense_id}"
+
+
+class ExpenseSearchTerm(models.Model):
+    """Inverted index of normalized words from an expense's description and notes"""
+    expense = models.ForeignKey(
+        Expense,
+        on_delete=models.CASCADE,
+        related_name='search_terms'
+    )
+    term = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('term', 'expense')
+
+    def __str__(self):
+        return f"{self.term} -> {self.expense_id}"
+
+
+
+class RecurringExpense(models.Model):
+    """Template that run_recurring_expenses turns into a new Expense on each due date"""
+    FREQUENCY_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('yearly', 'Yearly'),
+    ]
+
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        related_name='recurring_expenses'
+    )
+    paid_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='recurring_expenses_paid'
+    )
+    description = models.CharField(max_length=200)
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal('0.01'))]
+    )
+    currency = models.CharField(max_length=3, default='INR')
+    category = models.ForeignKey(
+        'ExpenseCategory',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    split_type = models.CharField(
+        max_length=20,
+        choices=Expense.SPLIT_TYPE_CHOICES,
+        default='equal'
+    )
+    notes = models.TextField(blank=True)
+
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='monthly')
+    interval = models.PositiveSmallIntegerField(default=1)
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    next_run_date = models.DateField(blank=True)
+    last_run_date = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'next_run_date']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.next_run_date is None:
+            self.next_run_date = self.start_date
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.description} ({self.get_frequency_display()}) - {format_money(self.amount, self.currency)}"
+
+
+class RecurringExpenseShare(models.Model):
+    """Split definition copied into an ExpenseShare for every occurrence"""
+    recurring = models.ForeignKey(
+        RecurringExpense,
+        on_delete=models.CASCADE,
+        related_name='shares'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(Decimal('0.00'))]
+    )
+    percentage = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(Decimal('0.00'))]
+    )
+    # Inputs of the 'shares' and 'adjustment' split types; amount is what's owed
+    weight = models.DecimalField(
+        max_digits=10,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(Decimal('0'))]
+    )
+    adjustment = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        unique_together = ('recurring', 'user')
+
+    def __str__(self):
+        return f"{self.user_id} in recurring {self.recurring_id}"
@@ -0,0 +1,183 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework import serializers
+from core.api import SparseFieldsetsSerializerMixin
+from core.currency import FxRates
+from groups.services import MembershipService
+from .models import Expense, ExpenseShare, ExpenseCategory, RecurringExpense, RecurringExpenseShare
+from .services import ExpenseWriter
+from .splits import SplitEngine, SplitError
+
+User = get_user_model()
+
+
+class ExpenseShareSerializer(SparseFieldsetsSerializerMixin, serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = ExpenseShare
+        fields = ['id', 'expense', 'user', 'username', 'amount', 'percentage', 'weight', 'adjustment']
+
+
+class SplitInputSerializer(serializers.Serializer):
+    """One participant of a new expense; which value is required depends on split_type"""
+    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    percentage = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    weight = serializers.DecimalField(max_digits=10, decimal_places=4, min_value=Decimal('0'), required=False)
+    adjustment = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+
+def validate_currency(value):
+    if not FxRates.supported(value):
+        raise serializers.ValidationError('Use a three-letter currency code that has an exchange rate.')
+    return value.upper()
+
+
+def validate_splits(attrs, requester):
+    """Shared split checks for one-off and recurring expenses created by `requester`"""
+    splits = attrs.get('splits') or []
+    if not splits:
+        raise serializers.ValidationError({'splits': 'At least one participant is required.'})
+
+    user_ids = [s['user'].id for s in splits]
+    if len(set(user_ids)) != len(user_ids):
+        raise serializers.ValidationError({'splits': 'Each participant may appear only once.'})
+
+    group = attrs.get('group')
+    if group is None:
+        raise serializers.ValidationError({'group': 'Expenses must belong to a group.'})
+    if not MembershipService.are_members(group, user_ids + [attrs['paid_by'].id, requester.id]):
+        raise serializers.ValidationError('You, the payer and all participants must be group members.')
+
+    try:
+        SplitEngine.split(attrs['amount'], attrs.get('split_type', 'equal'), splits)
+    except SplitError as exc:
+        raise serializers.ValidationError({'splits': str(exc)})
+
+    return attrs
+
+
+class ExpenseListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        """Create the whole batch with bulk inserts and one recalculation per group"""
+        return ExpenseWriter.create_expenses(
+            [ExpenseSerializer.to_spec(attrs) for attrs in validated_data],
+            actor=self.context['request'].user,
+        )
+
+
+class ExpenseSerializer(SparseFieldsetsSerializerMixin, serializers.ModelSerializer):
+    paid_by_username = serializers.CharField(source='paid_by.username', read_only=True)
+    category = serializers.SlugRelatedField(
+        slug_field='name', queryset=ExpenseCategory.objects.all(),
+        required=False, allow_null=True
+    )
+    shares = ExpenseShareSerializer(many=True, read_only=True)
+    splits = SplitInputSerializer(many=True, write_only=True)
+
+    class Meta:
+        model = Expense
+        list_serializer_class = ExpenseListSerializer
+        fields = [
+            'id', 'description', 'amount', 'currency', 'paid_by', 'paid_by_username',
+            'group', 'category', 'split_type', 'date', 'notes', 'created_at',
+            'shares', 'splits',
+        ]
+        read_only_fields = ['created_at']
+
+    def validate_currency(self, value):
+        return validate_currency(value)
+
+    def validate(self, attrs):
+        return validate_splits(attrs, self.context['request'].user)
+
+    @staticmethod
+    def to_spec(attrs):
+        spec = dict(attrs)
+        spec['shares'] = spec.pop('splits')
+        return spec
+
+    def create(self, validated_data):
+        return ExpenseWriter.create_expenses(
+            [self.to_spec(validated_data)], actor=self.context['request'].user
+        )[0]
+
+
+
+class RecurringExpenseShareSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = RecurringExpenseShare
+        fields = ['user', 'username', 'amount', 'percentage', 'weight', 'adjustment']
+
+
+class RecurringExpenseSerializer(SparseFieldsetsSerializerMixin, serializers.ModelSerializer):
+    category = serializers.SlugRelatedField(
+        slug_field='name', queryset=ExpenseCategory.objects.all(),
+        required=False, allow_null=True
+    )
+    shares = RecurringExpenseShareSerializer(many=True, read_only=True)
+    splits = SplitInputSerializer(many=True, write_only=True)
+
+    class Meta:
+        model = RecurringExpense
+        fields = [
+            'id', 'description', 'amount', 'currency', 'paid_by', 'group', 'category',
+            'split_type', 'notes', 'frequency', 'interval', 'start_date', 'end_date',
+            'next_run_date', 'last_run_date', 'is_active', 'created_at', 'shares', 'splits',
+        ]
+        read_only_fields = ['next_run_date', 'last_run_date', 'created_at']
+
+    def validate_currency(self, value):
+        return validate_currency(value)
+
+    def validate(self, attrs):
+        if self.instance is not None:
+            # Partial updates check against the stored template
+            for field in ('paid_by', 'group', 'amount', 'split_type', 'start_date', 'end_date'):
+                attrs.setdefault(field, getattr(self.instance, field))
+        if attrs.get('end_date') and attrs['end_date'] < attrs['start_date']:
+            raise serializers.ValidationError({'end_date': 'End date must not be before the start date.'})
+        if self.instance is not None and 'splits' not in attrs:
+            # The stored participants must still fit the (possibly changed) group and amount
+            stored = [
+                {'user': share.user, 'amount': share.amount, 'percentage': share.percentage,
+                 'weight': share.weight, 'adjustment': share.adjustment}
+                for share in self.instance.shares.select_related('user')
+            ]
+            validate_splits({**attrs, 'splits': stored}, self.context['request'].user)
+            return attrs
+        return validate_splits(attrs, self.context['request'].user)
+
+    @staticmethod
+    def _share_rows(recurring, splits):
+        return [
+            RecurringExpenseShare(
+                recurring=recurring,
+                user=split['user'],
+                amount=split.get('amount'),
+                percentage=split.get('percentage'),
+                weight=split.get('weight'),
+                adjustment=split.get('adjustment'),
+            )
+            for split in splits
+        ]
+
+    def create(self, validated_data):
+        splits = validated_data.pop('splits')
+        with transaction.atomic():
+            recurring = RecurringExpense.objects.create(**validated_data)
+            RecurringExpenseShare.objects.bulk_create(self._share_rows(recurring, splits))
+        return recurring
+
+    def update(self, instance, validated_data):
+        splits = validated_data.pop('splits', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if splits is not None:
+                instance.shares.all().delete()
+                RecurringExpenseShare.objects.bulk_create(self._share_rows(instance, splits))
+        return instance
@@ -0,0 +1,307 @@
+import calendar
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from core.search import tokenize, prefix_q
+from groups.services import GroupStatsService, Membership
+from .splits import SplitEngine
+from .models import (
+    Expense, ExpenseShare, ExpenseParticipant, ExpenseSearchTerm,
+    RecurringExpense, RecurringExpenseShare,
+)
+
+logger = logging.getLogger(__name__)
+
+# Occurrences materialized per template per run when a schedule has fallen behind
+RECURRING_MAX_CATCH_UP = 12
+
+
+class ExpenseIndex:
+    """Maintains and queries the participant and search-term index tables"""
+
+    @staticmethod
+    def sync_expenses(expenses):
+        """Rebuild index rows for the given expenses (call after their shares are written)"""
+        expenses = list(expenses)
+        if not expenses:
+            return
+
+        expense_ids = [e.id for e in expenses]
+        share_users = defaultdict(set)
+        for expense_id, user_id in ExpenseShare.objects.filter(
+            expense_id__in=expense_ids
+        ).order_by().values_list('expense_id', 'user_id'):
+            share_users[expense_id].add(user_id)
+
+        participants = []
+        terms = []
+        for expense in expenses:
+            user_ids = share_users[expense.id] | {expense.paid_by_id}
+            participants.extend(
+                ExpenseParticipant(
+                    expense_id=expense.id,
+                    user_id=user_id,
+                    group_id=expense.group_id,
+                    date=expense.date,
+                )
+                for user_id in user_ids
+            )
+            terms.extend(
+                ExpenseSearchTerm(expense_id=expense.id, term=term)
+                for term in tokenize(f"{expense.description} {expense.notes}")
+            )
+
+        with transaction.atomic():
+            ExpenseParticipant.objects.filter(expense_id__in=expense_ids).delete()
+            ExpenseSearchTerm.objects.filter(expense_id__in=expense_ids).delete()
+            ExpenseParticipant.objects.bulk_create(participants)
+            ExpenseSearchTerm.objects.bulk_create(terms)
+
+        from accounts.services import FriendSuggestionEngine
+        FriendSuggestionEngine.mark_stale(p.user_id for p in participants)
+
+    @staticmethod
+    def sync_expense(expense):
+        ExpenseIndex.sync_expenses([expense])
+
+    @staticmethod
+    def rebuild(batch_size=500):
+        """Re-index every expense in id order, `batch_size` at a time. Returns the count."""
+        total = 0
+        last_id = 0
+        while True:
+            batch = list(
+                Expense.objects.filter(id__gt=last_id).order_by('id')[:batch_size]
+            )
+            if not batch:
+                return total
+            ExpenseIndex.sync_expenses(batch)
+            total += len(batch)
+            last_id = batch[-1].id
+
+    @staticmethod
+    def participant_rows(user, group_id=None, category_id=None, query=''):
+        """
+        Index rows for expenses `user` paid for or shares in, optionally
+        narrowed by group, category and a free-text query. Every query word
+        must prefix-match a word in the description or notes.
+        """
+        # Soft-deleted groups keep their index rows until reap_deleted removes them
+        rows = ExpenseParticipant.objects.filter(user=user, group__deleted_at__isnull=True)
+        if group_id:
+            rows = rows.filter(group_id=group_id)
+        if category_id:
+            rows = rows.filter(expense__category_id=category_id)
+
+        for term in tokenize(query):
+            matching = ExpenseSearchTerm.objects.filter(prefix_q('term', term))
+            rows = rows.filter(expense_id__in=matching.values('expense_id'))
+
+        return rows
+
+
+class ExpenseWriter:
+    """Creates expenses and their shares in bulk, then settles derived state once"""
+
+    @staticmethod
+    def build_shares(expense, share_specs):
+        """
+        Turn [{'user' or 'user_id': ..., 'amount'/'percentage'/'weight'/'adjustment': ...}]
+        into ExpenseShare rows split by SplitEngine according to the expense's
+        split_type. Raises SplitError when the values don't fit the amount.
+        """
+        amounts = SplitEngine.split(expense.amount, expense.split_type, share_specs)
+        return [
+            ExpenseShare(
+                expense=expense,
+                amount=amount,
+                percentage=spec.get('percentage') if expense.split_type == 'percentage' else None,
+                weight=spec.get('weight') if expense.split_type == 'shares' else None,
+                adjustment=spec.get('adjustment') if expense.split_type == 'adjustment' else None,
+                **({'user': spec['user']} if 'user' in spec else {'user_id': spec['user_id']}),
+            )
+            for spec, amount in zip(share_specs, amounts)
+        ]
+
+    @staticmethod
+    def write_expenses(specs):
+        """
+        Insert one Expense per spec (a dict of Expense fields plus a 'shares'
+        list) with two bulk inserts, re-index them and update group stats.
+        Runs inside the caller's transaction and asks for one balance
+        recalculation per group, so it can join a deferred() block or a
+        GroupWriteCoordinator batch. Returns the created expenses.
+        """
+        from balances.services import BalanceCalculator
+
+        expenses = Expense.objects.bulk_create([
+            Expense(**{k: v for k, v in spec.items() if k != 'shares'})
+            for spec in specs
+        ])
+
+        shares = []
+        for expense, spec in zip(expenses, specs):
+            shares.extend(ExpenseWriter.build_shares(expense, spec['shares']))
+        ExpenseShare.objects.bulk_create(shares)
+
+        ExpenseIndex.sync_expenses(expenses)
+
+        groups = {e.group_id: e.group for e in expenses if e.group_id}
+        for group in groups.values():
+            BalanceCalculator.request_recalculation(group)
+
+        stats = {}
+        for expense in expenses:
+            if expense.group_id:
+                count, amount = stats.get(expense.group_id, (0, 0))
+                stats[expense.group_id] = (
+                    count + 1, amount + GroupStatsService.to_base(expense.amount, expense.currency)
+                )
+        GroupStatsService.record_expenses(stats)
+        return expenses
+
+    @staticmethod
+    def create_expenses(specs, actor, notify=True):
+        """
+        Create expenses with write_expenses and recalculate each affected
+        group once. A batch for a single group is group-committed through
+        GroupWriteCoordinator; a batch spanning groups commits on its own.
+        Activity is logged for `actor`, the user adding the expenses, or for
+        each payer when `actor` is None (scheduled occurrences); it and the
+        notifications follow the commit. Returns the expenses.
+        """
+        from activity.utils import log
+        from balances.services import BalanceCalculator, GroupWriteCoordinator
+        from notifications.services import NotificationService
+
+        specs = list(specs)
+        groups = {spec['group'].pk: spec['group'] for spec in specs if spec.get('group')}
+        if len(groups) == 1 and all(spec.get('group') for spec in specs):
+            [group] = groups.values()
+            expenses = GroupWriteCoordinator.submit(group, lambda: ExpenseWriter.write_expenses(specs))
+        else:
+            with transaction.atomic(), BalanceCalculator.deferred():
+                expenses = ExpenseWriter.write_expenses(specs)
+
+        for expense in expenses:
+            log(actor or expense.paid_by, 'expense_added', 'expense', expense.id,
+                {'description': expense.description, 'amount': str(expense.amount)},
+                group=expense.group)
+
+        if notify:
+            for expense in expenses:
+                if expense.group_id:
+                    NotificationService.notify_expense_added(expense)
+
+        return expenses
+
+
+class RecurringExpenseScheduler:
+    """Materializes due RecurringExpense occurrences through ExpenseWriter"""
+
+    @staticmethod
+    def next_date(recurring, current):
+        """The occurrence after `current`; monthly/yearly keep the start date's day where the month allows"""
+        step = recurring.interval or 1
+        if recurring.frequency == 'daily':
+            return current + timedelta(days=step)
+        if recurring.frequency == 'weekly':
+            return current + timedelta(weeks=step)
+
+        months = step * (12 if recurring.frequency == 'yearly' else 1)
+        month_index = current.month - 1 + months
+        year = current.year + month_index // 12
+        month = month_index % 12 + 1
+        day = min(recurring.start_date.day, calendar.monthrange(year, month)[1])
+        return current.replace(year=year, month=month, day=day)
+
+    @staticmethod
+    def occurrence_spec(recurring, on_date):
+        return {
+            'group': recurring.group,
+            'paid_by': recurring.paid_by,
+            'description': recurring.description,
+            'amount': recurring.amount,
+            'currency': recurring.currency,
+            'category_id': recurring.category_id,
+            'split_type': recurring.split_type,
+            'notes': recurring.notes,
+            'date': on_date,
+            'recurring': recurring,
+            'shares': [
+                {'user': share.user, 'amount': share.amount, 'percentage': share.percentage,
+                 'weight': share.weight, 'adjustment': share.adjustment}
+                for share in recurring.shares.all()
+            ],
+        }
+
+    @staticmethod
+    def run(today=None, max_catch_up=RECURRING_MAX_CATCH_UP, notify=True, dry_run=False):
+        """
+        Create every occurrence due on or before `today` in one batch: two
+        bulk inserts via ExpenseWriter, one balance recalculation per group,
+        and a single bulk update advancing the schedules.
+        Returns (occurrences, templates).
+        """
+        from balances.services import BalanceCalculator
+
+        today = today or timezone.localdate()
+
+        with transaction.atomic(), BalanceCalculator.deferred():
+            due = list(
+                RecurringExpense.objects.filter(is_active=True, next_run_date__lte=today)
+                .select_related('group', 'paid_by')
+                .prefetch_related(
+                    Prefetch('shares', queryset=RecurringExpenseShare.objects.select_related('user'))
+                )
+                .order_by('next_run_date', 'id')
+            )
+
+            members = defaultdict(set)
+            for group_id, user_id in Membership.objects.filter(
+                group_id__in={r.group_id for r in due}
+            ).values_list('group_id', 'user_id'):
+                members[group_id].add(user_id)
+
+            specs = []
+            advanced = []
+            for recurring in due:
+                if not recurring.shares.all():
+                    continue
+                involved = {recurring.paid_by_id} | {share.user_id for share in recurring.shares.all()}
+                if not involved <= members[recurring.group_id]:
+                    # The payer or a participant has left the group: stop rather than bill them
+                    logger.warning("Disabling recurring expense %s: payer or participant left group %s",
+                                   recurring.id, recurring.group_id)
+                    recurring.is_active = False
+                    advanced.append(recurring)
+                    continue
+                on_date = recurring.next_run_date
+                created = 0
+                while on_date <= today and created < max_catch_up:
+                    if recurring.end_date and on_date > recurring.end_date:
+                        break
+                    specs.append(RecurringExpenseScheduler.occurrence_spec(recurring, on_date))
+                    recurring.last_run_date = on_date
+                    on_date = RecurringExpenseScheduler.next_date(recurring, on_date)
+                    created += 1
+
+                recurring.next_run_date = on_date
+                if recurring.end_date and on_date > recurring.end_date:
+                    recurring.is_active = False
+                advanced.append(recurring)
+
+            if dry_run:
+                transaction.set_rollback(True)
+                return len(specs), len(advanced)
+
+            RecurringExpense.objects.bulk_update(
+                advanced, ['next_run_date', 'last_run_date', 'is_active']
+            )
+            if specs:
+                ExpenseWriter.create_expenses(specs, actor=None, notify=notify)
+
+        return len(specs), len(advanced)
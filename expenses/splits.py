@@ -0,0 +1,149 @@
+"""
+Turns an expense amount and its participants into per-person shares.
+
+Every split type reduces to one allocation: the amount in cents is divided
+in proportion to a weight per participant, each part is rounded down, and
+the cents left over go to the largest remainders (the earlier participant
+wins a tie). Shares therefore always add up to the expense amount exactly.
+
+Once written, ExpenseShare.amount is the record. Balance code reads the
+stored amounts back for a whole batch of expenses with `owed`/`net` instead
+of re-deriving the split from split_type.
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_FLOOR
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+# Expense ids per query when shares aren't prefetched; stays under SQLite's variable limit
+OWED_QUERY_BATCH = 900
+
+
+class SplitError(ValueError):
+    """The split values don't describe the expense amount"""
+
+
+class SplitEngine:
+    TYPES = ('equal', 'unequal', 'percentage', 'shares', 'adjustment')
+
+    @staticmethod
+    def allocate(amount, weights):
+        """Split `amount` in proportion to `weights`; the parts sum to `amount` to the cent"""
+        weights = [Decimal(w) for w in weights]
+        total = sum(weights)
+        if any(w < 0 for w in weights) or total <= 0:
+            raise SplitError('Shares must be positive.')
+
+        cents = int((Decimal(amount) / CENT).to_integral_value())
+        exact = [cents * w / total for w in weights]
+        parts = [int(x.to_integral_value(rounding=ROUND_FLOOR)) for x in exact]
+        leftover = cents - sum(parts)
+        by_remainder = sorted(range(len(parts)), key=lambda i: (parts[i] - exact[i], i))
+        for i in by_remainder[:leftover]:
+            parts[i] += 1
+        return [part * CENT for part in parts]
+
+    @staticmethod
+    def split(amount, split_type, specs):
+        """
+        Amounts owed by each participant, in the order of `specs`. Each spec
+        carries the value its split type needs: 'amount' (unequal),
+        'percentage', 'weight' (shares) or an optional 'adjustment'.
+        """
+        amount = Decimal(amount)
+        if not specs:
+            raise SplitError('At least one participant is required.')
+
+        def values(field, message):
+            if any(spec.get(field) is None for spec in specs):
+                raise SplitError(message)
+            return [Decimal(spec[field]) for spec in specs]
+
+        if split_type == 'equal':
+            return SplitEngine.allocate(amount, [1] * len(specs))
+
+        if split_type == 'unequal':
+            amounts = [a.quantize(CENT) for a in values('amount', 'Every participant needs an amount.')]
+            if any(a < 0 for a in amounts):
+                raise SplitError('Amounts must not be negative.')
+            if sum(amounts) != amount:
+                raise SplitError("Shares don't match expense amount.")
+            return amounts
+
+        if split_type == 'percentage':
+            percentages = values('percentage', 'Every participant needs a percentage.')
+            if sum(percentages) != HUNDRED:
+                raise SplitError('Percentages must sum to 100%.')
+            return SplitEngine.allocate(amount, percentages)
+
+        if split_type == 'shares':
+            return SplitEngine.allocate(amount, values('weight', 'Every participant needs a number of shares.'))
+
+        if split_type == 'adjustment':
+            # Adjustments are added on top of an equal split of whatever they leave
+            adjustments = [Decimal(spec.get('adjustment') or 0).quantize(CENT) for spec in specs]
+            rest = amount - sum(adjustments)
+            if rest < 0:
+                raise SplitError('Adjustments exceed the expense amount.')
+            amounts = [
+                part + adjustment
+                for part, adjustment in zip(SplitEngine.allocate(rest, [1] * len(specs)), adjustments)
+            ]
+            if any(a < 0 for a in amounts):
+                raise SplitError('An adjustment leaves a participant owing less than nothing.')
+            return amounts
+
+        raise SplitError(f'Unknown split type {split_type!r}.')
+
+    @staticmethod
+    def owed(expenses, shares=None):
+        """
+        {expense id: {user id: amount}} from the stored shares of `expenses`.
+        Uses prefetched shares where present; the rest are read in one query
+        per OWED_QUERY_BATCH expenses, or from the `shares` queryset if given.
+        """
+        from .models import ExpenseShare
+
+        owed = {}
+        missing = []
+        for expense in expenses:
+            prefetched = getattr(expense, '_prefetched_objects_cache', {}).get('shares')
+            if prefetched is not None:
+                owed[expense.pk] = {share.user_id: share.amount for share in prefetched}
+            else:
+                owed[expense.pk] = {}
+                missing.append(expense.pk)
+        if not missing:
+            return owed
+
+        rows = ('expense_id', 'user_id', 'amount')
+        if shares is not None:
+            batches = [shares.values_list(*rows).order_by()]
+        else:
+            batches = (
+                ExpenseShare.objects.filter(expense_id__in=missing[i:i + OWED_QUERY_BATCH])
+                .values_list(*rows).order_by()
+                for i in range(0, len(missing), OWED_QUERY_BATCH)
+            )
+        for batch in batches:
+            for expense_id, user_id, amount in batch:
+                if expense_id in owed:
+                    owed[expense_id][user_id] = amount
+        return owed
+
+    @staticmethod
+    def net(expenses, owed=None):
+        """
+        {currency: {user id: net}} over `expenses`; positive means the user is
+        owed. The payer's own share cancels out.
+        """
+        owed = SplitEngine.owed(expenses) if owed is None else owed
+        net = defaultdict(lambda: defaultdict(Decimal))
+        for expense in expenses:
+            balances = net[expense.currency]
+            for user_id, amount in owed[expense.pk].items():
+                if user_id != expense.paid_by_id:
+                    balances[user_id] -= amount
+                    balances[expense.paid_by_id] += amount
+        return net
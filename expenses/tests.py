@@ -1,3 +1,403 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 from django.test import TestCase
+from rest_framework.test import APIClient
+from accounts.models import User
+from core.currency import FxRates
+from core.deletion import DeletionService
+from core.models import FxRate
+from groups.models import Group
+from .models import Expense, ExpenseShare, RecurringExpense, RecurringExpenseShare
+from .services import ExpenseIndex, RecurringExpenseScheduler
+from .splits import SplitEngine, SplitError
 
-# Create your tests here.
+
+class ExpenseAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        cls.group = Group.objects.create(name='Trip', created_by=cls.alice)
+        cls.group.members.add(cls.alice, cls.bob)
+
+        for i in range(5):
+            expense = Expense.objects.create(
+                description=f'Dinner {i}', amount=Decimal('30.00'),
+                paid_by=cls.alice, group=cls.group, date=date(2024, 1, i + 1),
+            )
+            ExpenseShare.objects.create(expense=expense, user=cls.alice, amount=Decimal('15.00'))
+            ExpenseShare.objects.create(expense=expense, user=cls.bob, amount=Decimal('15.00'))
+        ExpenseIndex.rebuild()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+
+    def test_expense_list_query_count(self):
+        # page of expenses (with paid_by/group/category joined) + one shares prefetch
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/expenses/records/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(len(response.data['results'][0]['shares']), 2)
+
+    def test_sparse_fields_skip_shares_prefetch(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/expenses/records/?fields=id,amount')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'amount'})
+
+    def test_share_list_query_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/expenses/shares/')
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_cursor_pagination(self):
+        response = self.client.get('/api/expenses/records/?page_size=3&fields=id')
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+    def test_batch_create(self):
+        payload = [
+            {
+                'description': f'Taxi {i}', 'amount': '10.00', 'paid_by': self.bob.id,
+                'group': self.group.id, 'split_type': 'equal', 'date': '2024-02-01',
+                'splits': [{'user': self.alice.id}, {'user': self.bob.id}],
+            }
+            for i in range(3)
+        ]
+        response = self.client.post('/api/expenses/records/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(ExpenseShare.objects.filter(expense__description__startswith='Taxi').count(), 6)
+        # new expenses are indexed straight away
+        response = self.client.get('/api/expenses/records/?fields=id')
+        self.assertEqual(len(response.data['results']), 8)
+
+    def test_batch_create_rejects_non_members(self):
+        outsider = User.objects.create_user('carol', password='pw')
+        payload = [{
+            'description': 'Taxi', 'amount': '10.00', 'paid_by': self.bob.id,
+            'group': self.group.id, 'split_type': 'equal', 'date': '2024-02-01',
+            'splits': [{'user': outsider.id}],
+        }]
+        response = self.client.post('/api/expenses/records/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_currency_without_rate_is_rejected(self):
+        payload = {
+            'description': 'Taxi', 'amount': '10.00', 'paid_by': self.bob.id, 'currency': 'XYZ',
+            'group': self.group.id, 'split_type': 'equal', 'date': '2024-02-01',
+            'splits': [{'user': self.alice.id}],
+        }
+        response = self.client.post('/api/expenses/records/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('currency', response.data)
+
+        self.client.force_login(self.bob)
+        self.client.post('/api/expenses/add/', {
+            'title': 'Taxi', 'amount': '10', 'group': self.group.id, 'paid_by': self.bob.id,
+            'currency': 'XYZ', 'split_type': 'equal', 'user_ids[]': [self.alice.id], 'date': '2024-02-01',
+        })
+        self.assertFalse(Expense.objects.filter(description='Taxi').exists())
+
+    def test_soft_deleted_group_expenses_are_hidden(self):
+        DeletionService.soft_delete_group(self.group)
+        self.assertEqual(self.client.get('/api/expenses/records/').data['results'], [])
+        self.assertEqual(self.client.get('/api/expenses/shares/').data['results'], [])
+
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get('/api/expenses/').context['expenses'], [])
+        expense = Expense.objects.filter(group=self.group).first()
+        self.assertEqual(self.client.get(f'/api/expenses/{expense.id}/').status_code, 404)
+
+    def test_outsider_cannot_add_expenses_to_a_group(self):
+        outsider = User.objects.create_user('mallory', password='pw')
+        self.client.force_authenticate(outsider)
+        payload = {
+            'description': 'Taxi', 'amount': '10.00', 'paid_by': self.bob.id,
+            'group': self.group.id, 'split_type': 'equal', 'date': '2024-02-01',
+            'splits': [{'user': self.alice.id}],
+        }
+        response = self.client.post('/api/expenses/records/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/expenses/records/batch/', [payload], format='json')
+        self.assertEqual(response.status_code, 400)
+
+        del payload['group']
+        self.client.force_authenticate(self.bob)
+        response = self.client.post('/api/expenses/records/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Expense.objects.filter(description='Taxi').exists())
+
+
+    def test_edit_rejects_non_member_participants_and_bad_splits(self):
+        expense = Expense.objects.filter(group=self.group).first()
+        outsider = User.objects.create_user('mallory')
+        self.client.force_login(self.alice)
+        url = f'/api/expenses/{expense.id}/edit/'
+        form = {
+            'description': 'Dinner', 'amount': '40.00', 'date': '2024-01-01',
+            'split_type': 'equal', 'user_ids[]': [self.alice.id, outsider.id],
+        }
+        response = self.client.post(url, form)
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+
+        form.update({'split_type': 'unequal', 'user_ids[]': [self.alice.id, self.bob.id], 'amounts[]': ['10', '10']})
+        response = self.client.post(url, form)
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+
+        expense.refresh_from_db()
+        self.assertEqual(expense.amount, Decimal('30.00'))
+        self.assertEqual(
+            sorted(expense.shares.values_list('user__username', 'amount')),
+            [('alice', Decimal('15.00')), ('bob', Decimal('15.00'))],
+        )
+
+        form.update({'amounts[]': ['25', '15'], 'currency': 'XYZ'})
+        response = self.client.post(url, form)
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        expense.refresh_from_db()
+        self.assertEqual(expense.currency, 'INR')
+
+        form['currency'] = 'INR'
+        self.client.post(url, form)
+        expense.refresh_from_db()
+        self.assertEqual(expense.amount, Decimal('40.00'))
+
+
+class ExpenseIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        cls.carol = User.objects.create_user('carol')
+        cls.flat = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.flat.members.add(cls.alice, cls.bob, cls.carol)
+        cls.trip = Group.objects.create(name='Trip', created_by=cls.alice)
+        cls.trip.members.add(cls.alice, cls.bob)
+
+        cls.expenses = []
+        for i, (group, description) in enumerate([
+            (cls.flat, 'Rent January'), (cls.flat, 'Groceries'), (cls.trip, 'Train tickets'),
+            (cls.trip, 'Hotel'), (cls.flat, 'Rent February'),
+        ]):
+            expense = Expense.objects.create(
+                description=description, amount=Decimal('20.00'),
+                paid_by=cls.alice, group=group, date=date(2024, 1, i + 1),
+            )
+            ExpenseShare.objects.create(expense=expense, user=cls.bob, amount=Decimal('20.00'))
+            cls.expenses.append(expense)
+        ExpenseIndex.sync_expenses(cls.expenses)
+
+    def ids(self, user, **filters):
+        return [
+            self.expenses.index(e) for e in Expense.objects.filter(
+                id__in=ExpenseIndex.participant_rows(user, **filters).values('expense_id')
+            ).order_by('date')
+        ]
+
+    def test_participants_are_payer_and_sharers(self):
+        self.assertEqual(self.ids(self.alice), [0, 1, 2, 3, 4])
+        self.assertEqual(self.ids(self.bob, group_id=self.trip.id), [2, 3])
+        self.assertEqual(self.ids(self.carol), [])
+
+        # Re-syncing after the shares change moves the expense to its new participants
+        expense = self.expenses[1]
+        expense.shares.update(user=self.carol)
+        ExpenseIndex.sync_expenses([expense])
+        self.assertEqual(self.ids(self.carol), [1])
+        self.assertNotIn(1, self.ids(self.bob))
+
+    def test_every_query_word_must_prefix_match(self):
+        self.assertEqual(self.ids(self.bob, query='rent'), [0, 4])
+        self.assertEqual(self.ids(self.bob, query='ren feb'), [4])
+        self.assertEqual(self.ids(self.bob, query='rent hotel'), [])
+
+    def test_list_view_pages_with_a_cursor(self):
+        self.client.force_login(self.bob)
+        seen, params = [], {}
+        with mock.patch('expenses.views.EXPENSE_PAGE_SIZE', 2):
+            while True:
+                response = self.client.get('/api/expenses/', params)
+                seen.extend(e.description for e in response.context['expenses'])
+                if not response.context['next_cursor']:
+                    break
+                params = {'cursor': response.context['next_cursor']}
+        self.assertEqual(seen, ['Rent February', 'Hotel', 'Train tickets', 'Groceries', 'Rent January'])
+
+    def test_non_numeric_group_filters_are_handled(self):
+        self.client.force_login(self.bob)
+        response = self.client.get('/api/expenses/', {'group': 'abc'})
+        self.assertEqual(len(response.context['expenses']), 5)
+
+        api = APIClient()
+        api.force_authenticate(self.bob)
+        self.assertEqual(api.get('/api/expenses/records/', {'group': 'abc'}).status_code, 400)
+        response = api.get('/api/expenses/records/', {'group': self.trip.id})
+        self.assertEqual(len(response.data['results']), 2)
+
+class SplitEngineTests(TestCase):
+    def test_every_split_adds_up_to_the_cent(self):
+        three = [{}, {}, {}]
+        self.assertEqual(SplitEngine.split(Decimal('10.00'), 'equal', three),
+                         [Decimal('3.34'), Decimal('3.33'), Decimal('3.33')])
+        self.assertEqual(SplitEngine.split(Decimal('10.00'), 'percentage', [{'percentage': 50}] * 2),
+                         [Decimal('5.00'), Decimal('5.00')])
+        self.assertEqual(SplitEngine.split(Decimal('10.00'), 'shares', [{'weight': 1}, {'weight': 2}]),
+                         [Decimal('3.33'), Decimal('6.67')])
+        self.assertEqual(SplitEngine.split(Decimal('10.00'), 'adjustment', [{'adjustment': Decimal('4.00')}, {}]),
+                         [Decimal('7.00'), Decimal('3.00')])
+
+    def test_inconsistent_values_are_rejected(self):
+        with self.assertRaises(SplitError):
+            SplitEngine.split(Decimal('10.00'), 'unequal', [{'amount': 4}, {'amount': 5}])
+        with self.assertRaises(SplitError):
+            SplitEngine.split(Decimal('10.00'), 'percentage', [{'percentage': 60}, {'percentage': 60}])
+        with self.assertRaises(SplitError):
+            SplitEngine.split(Decimal('10.00'), 'adjustment', [{'adjustment': 11}, {}])
+
+    def test_net_reads_stored_shares_in_one_query(self):
+        alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+        for amount in ('10.00', '20.00'):
+            expense = Expense.objects.create(description='Cab', amount=Decimal(amount), paid_by=alice,
+                                             split_type='shares', date=date(2024, 1, 1))
+            ExpenseShare.objects.create(expense=expense, user=alice, amount=Decimal(amount) / 4, weight=1)
+            ExpenseShare.objects.create(expense=expense, user=bob, amount=Decimal(amount) * 3 / 4, weight=3)
+
+        expenses = list(Expense.objects.all())
+        with self.assertNumQueries(1):
+            net = SplitEngine.net(expenses)
+        self.assertEqual(net['INR'], {alice.id: Decimal('22.50'), bob.id: Decimal('-22.50')})
+
+
+class RecurringExpenseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        cls.group = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.group.members.add(cls.alice, cls.bob)
+
+    def template(self, start, frequency='monthly', **fields):
+        recurring = RecurringExpense.objects.create(
+            group=self.group, paid_by=self.alice, description='Rent', amount=Decimal('100.00'),
+            frequency=frequency, start_date=start, **fields,
+        )
+        RecurringExpenseShare.objects.create(recurring=recurring, user=self.alice)
+        RecurringExpenseShare.objects.create(recurring=recurring, user=self.bob)
+        return recurring
+
+    def test_next_date_steps_and_clamps_to_month_end(self):
+        step = RecurringExpenseScheduler.next_date
+        monthly = RecurringExpense(frequency='monthly', interval=1, start_date=date(2024, 1, 31))
+        self.assertEqual(step(monthly, date(2024, 1, 31)), date(2024, 2, 29))
+        # the start date's day comes back once the month is long enough
+        self.assertEqual(step(monthly, date(2024, 2, 29)), date(2024, 3, 31))
+        self.assertEqual(step(monthly, date(2024, 12, 31)), date(2025, 1, 31))
+
+        quarterly = RecurringExpense(frequency='monthly', interval=3, start_date=date(2024, 11, 30))
+        self.assertEqual(step(quarterly, date(2024, 11, 30)), date(2025, 2, 28))
+        yearly = RecurringExpense(frequency='yearly', interval=1, start_date=date(2024, 2, 29))
+        self.assertEqual(step(yearly, date(2024, 2, 29)), date(2025, 2, 28))
+        weekly = RecurringExpense(frequency='weekly', interval=2, start_date=date(2024, 1, 1))
+        self.assertEqual(step(weekly, date(2024, 1, 1)), date(2024, 1, 15))
+        daily = RecurringExpense(frequency='daily', interval=1, start_date=date(2024, 2, 28))
+        self.assertEqual(step(daily, date(2024, 2, 28)), date(2024, 2, 29))
+
+    def test_run_catches_up_in_bounded_steps(self):
+        recurring = self.template(date(2024, 1, 31))
+
+        self.assertEqual(RecurringExpenseScheduler.run(date(2024, 5, 15), max_catch_up=3, notify=False), (3, 1))
+        recurring.refresh_from_db()
+        self.assertEqual((recurring.last_run_date, recurring.next_run_date), (date(2024, 3, 31), date(2024, 4, 30)))
+
+        self.assertEqual(RecurringExpenseScheduler.run(date(2024, 5, 15), notify=False), (1, 1))
+        dates = list(recurring.occurrences.order_by('date').values_list('date', flat=True))
+        self.assertEqual(dates, [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)])
+        self.assertEqual(self.group.balances.get().amount, Decimal('200.00'))
+
+        # nothing due until the next run date
+        self.assertEqual(RecurringExpenseScheduler.run(date(2024, 5, 15), notify=False), (0, 0))
+
+    def test_run_stops_at_end_date(self):
+        recurring = self.template(date(2024, 1, 1), frequency='weekly', end_date=date(2024, 1, 20))
+        self.assertEqual(RecurringExpenseScheduler.run(date(2024, 3, 1), notify=False), (3, 1))
+        recurring.refresh_from_db()
+        self.assertFalse(recurring.is_active)
+
+    def test_run_disables_templates_whose_participants_left(self):
+        recurring = self.template(date(2024, 1, 1))
+        self.group.members.remove(self.bob)
+
+        self.assertEqual(RecurringExpenseScheduler.run(date(2024, 3, 1), notify=False), (0, 1))
+        recurring.refresh_from_db()
+        self.assertFalse(recurring.is_active)
+        self.assertFalse(recurring.occurrences.exists())
+
+    def test_api_rejects_groups_the_requester_is_not_in(self):
+        other = Group.objects.create(name='Other', created_by=self.bob)
+        other.members.add(self.bob)
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        payload = {
+            'description': 'Gym', 'amount': '30.00', 'paid_by': self.bob.id, 'group': other.id,
+            'frequency': 'monthly', 'start_date': '2024-01-01', 'splits': [{'user': self.bob.id}],
+        }
+        self.assertEqual(client.post('/api/expenses/recurring/', payload, format='json').status_code, 400)
+
+        recurring = self.template(date(2024, 1, 1))
+        response = client.patch(f'/api/expenses/recurring/{recurring.id}/', {'group': other.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        recurring.refresh_from_db()
+        self.assertEqual(recurring.group_id, self.group.id)
+
+
+    def test_only_the_creator_or_payer_can_change_a_template(self):
+        recurring = self.template(date(2024, 1, 1), created_by=self.alice)
+        carol = User.objects.create_user('carol')
+        self.group.members.add(carol)
+        url = f'/api/expenses/recurring/{recurring.id}/'
+
+        client = APIClient()
+        client.force_authenticate(carol)
+        self.assertEqual(client.get(url).status_code, 200)
+        self.assertEqual(client.patch(url, {'description': 'Mine'}, format='json').status_code, 403)
+        self.assertEqual(client.delete(url).status_code, 403)
+        recurring.refresh_from_db()
+        self.assertEqual(recurring.description, 'Rent')
+
+        client.force_authenticate(self.bob)
+        self.assertEqual(client.patch(url, {'description': 'Mine'}, format='json').status_code, 403)
+        client.force_authenticate(self.alice)
+        self.assertEqual(client.patch(url, {'description': 'Flat rent'}, format='json').status_code, 200)
+
+class AnalyticsConditionalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        FxRates.clear()
+        self.addCleanup(FxRates.clear)
+
+    def revalidate(self, etag, period='6m'):
+        return self.client.get(f'/dashboard/analytics/?period={period}', HTTP_IF_NONE_MATCH=etag).status_code
+
+    def test_etag_follows_currency_rates_and_window(self):
+        etag = self.client.get('/dashboard/analytics/?period=6m')['ETag']
+        self.assertEqual(self.revalidate(etag), 304)
+
+        self.user.default_currency = 'USD'
+        self.user.save(update_fields=['default_currency'])
+        self.assertEqual(self.revalidate(etag), 200)
+        etag = self.client.get('/dashboard/analytics/?period=6m')['ETag']
+
+        FxRate.objects.create(currency='USD', rate=Decimal('0.012'))
+        FxRates.clear()
+        self.assertEqual(self.revalidate(etag), 200)
+        etag = self.client.get('/dashboard/analytics/?period=6m')['ETag']
+
+        with mock.patch('expenses.views_dashboard.timezone.localdate', return_value=date.today() + timedelta(days=1)):
+            self.assertEqual(self.revalidate(etag), 200)
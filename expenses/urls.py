@@ -1,8 +1,15 @@
-from django.urls import path
+from django.urls import path, include
+from rest_framework.routers import SimpleRouter
 from . import views
+from .api_views import ExpenseViewSet, ExpenseShareViewSet, RecurringExpenseViewSet
 
 app_name = 'expenses'
 
+router = SimpleRouter()
+router.register(r'records', ExpenseViewSet, basename='expense')
+router.register(r'shares', ExpenseShareViewSet, basename='expense-share')
+router.register(r'recurring', RecurringExpenseViewSet, basename='recurring-expense')
+
 urlpatterns = [
     path('', views.expense_list, name='expense_list'),
     path('add/', views.add_expense, name='add_expense'),
@@ -12,4 +19,5 @@ urlpatterns = [
     path('balances/', views.my_balances, name='my_balances'),
     path('<int:expense_id>/pdf/', views.expense_pdf, name='expense_pdf'),
     path('api/group/<int:group_id>/members/', views.get_group_members, name='get_group_members'),
+    path('', include(router.urls)),
 ]
\ No newline at end of file
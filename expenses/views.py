@@ -1,6 +1,8 @@
+import logging
+import uuid
 from xhtml2pdf import pisa
 from datetime import datetime, timedelta, date
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
@@ -9,37 +11,72 @@ from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
 from .models import Expense, ExpenseShare, ExpenseCategory
+from .services import ExpenseIndex, ExpenseWriter
+from .splits import SplitEngine, SplitError
 from groups.models import Group
+from groups.services import MembershipService
 from accounts.models import User
-from balances.services import BalanceCalculator
+from core.currency import CURRENCY_SYMBOLS, FxRates
+from core.http import conditional_on, idempotent
+from core.pagination import paginate_keyset
+from core.profiling import profiled, section
+from core.routers import read_only
+from groups.views import group_members_marker
+from activity.utils import log
+from balances.services import BalanceCalculator, GroupWriteCoordinator
 from notifications.services import NotificationService
 
+logger = logging.getLogger(__name__)
+
+
+EXPENSE_PAGE_SIZE = 25
+
+# The per-participant value each split type reads from the form
+SPLIT_VALUE_FIELDS = {'unequal': 'amount', 'percentage': 'percentage', 'shares': 'weight', 'adjustment': 'adjustment'}
+
 
 @login_required
+@read_only
 def expense_list(request):
-    """List all expenses for the user"""
+    """List the user's expenses, newest first, one keyset page at a time"""
     user = request.user
 
-    expenses = Expense.objects.filter(
-        Q(paid_by=user) | Q(shares__user=user)
-    ).distinct().select_related(
-        'paid_by', 'group', 'category'
-    ).prefetch_related('shares__user')
-
-    group_id = request.GET.get('group')
-    if group_id:
-        expenses = expenses.filter(group_id=group_id)
-
+    # Anything but a group id (e.g. a hand-edited URL) shows every group
+    group_id = request.GET.get('group', '')
+    group_id = int(group_id) if group_id.isdigit() else None
     category = request.GET.get('category')
+    query = request.GET.get('q', '').strip()
+
+    category_id = None
     if category:
-        expenses = expenses.filter(category__name=category)
+        category_id = ExpenseCategory.objects.filter(name=category).values_list('id', flat=True).first()
+
+    rows = ExpenseIndex.participant_rows(
+        user,
+        group_id=group_id,
+        category_id=category_id,
+        query=query,
+    ).values('date', 'expense_id')
+    if category and category_id is None:
+        rows = rows.none()
+
+    page, next_cursor = paginate_keyset(
+        rows, ('date', 'expense_id'), request.GET.get('cursor'), EXPENSE_PAGE_SIZE
+    )
+
+    page_ids = [row['expense_id'] for row in page]
+    by_id = Expense.objects.select_related('paid_by', 'group', 'category').in_bulk(page_ids)
+    expenses = [by_id[eid] for eid in page_ids if eid in by_id]
 
     context = {
         'expenses': expenses,
         'categories': ExpenseCategory.objects.all(),
         'groups': Group.objects.filter(members=user),
-        'selected_group': group_id,
+        'selected_group': str(group_id) if group_id else '',
         'selected_category': category,
+        'query': query,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     }
 
     return render(request, 'expenses/expense_list.html', context)
@@ -51,7 +88,7 @@ def expense_detail(request, expense_id):
     expense = get_object_or_404(
         Expense.objects.select_related('paid_by', 'group', 'category')
                        .prefetch_related('shares__user'),
-        id=expense_id
+        id=expense_id, group__deleted_at__isnull=True
     )
 
     if not (expense.paid_by == request.user or expense.shares.filter(user=request.user).exists()):
@@ -96,13 +133,11 @@ def expense_detail(request, expense_id):
 
 
 @login_required
+@idempotent('expenses.add')
 def add_expense(request):
     from datetime import date 
 
     if request.method == 'POST':
-        print("=== ADD EXPENSE DEBUG START ===")
-        print("POST DATA:", request.POST)
-
         title = request.POST.get('title', '').strip()
         amount = Decimal(request.POST.get('amount', '0') or '0')
         group_id = request.POST.get('group')
@@ -110,146 +145,166 @@ def add_expense(request):
         split_type = request.POST.get('split_type', 'equal')
         description = request.POST.get('description', '').strip()
         date_value = request.POST.get('date', date.today())
+        currency = (request.POST.get('currency') or request.user.default_currency).upper()
 
         user_ids = request.POST.getlist('user_ids[]')
-        print("DEBUG user_ids:", user_ids)
+        logger.debug("add_expense group=%s participants=%s", group_id, user_ids)
 
         if not user_ids:
             messages.error(request, "Please select at least one member.")
-            return redirect('add_expense')
+            return redirect('expenses:add_expense')
+        if not FxRates.supported(currency):
+            messages.error(request, f"{currency} isn't a currency we have an exchange rate for.")
+            return redirect('expenses:add_expense')
+
+        group = Group.objects.filter(id=group_id, members=request.user).first()
+        if group is None:
+            messages.error(request, "Please choose one of your groups.")
+            return redirect('expenses:add_expense')
+        try:
+            paid_by_id = int(paid_by_id)
+            user_ids = list(dict.fromkeys(int(uid) for uid in user_ids))
+        except (TypeError, ValueError):
+            messages.error(request, "Please choose the payer and participants from the list.")
+            return redirect('expenses:add_expense')
+        # Payer and participants must all belong to the chosen group
+        if not MembershipService.are_members(group, [paid_by_id, *user_ids]):
+            messages.error(request, "The payer and participants must be members of the group.")
+            return redirect('expenses:add_expense')
+
+        # The form posts one split_value_<user id> whose meaning depends on split_type
+        value_field = SPLIT_VALUE_FIELDS.get(split_type)
+        specs = []
+        try:
+            for uid in user_ids:
+                spec = {'user_id': uid}
+                raw = request.POST.get(f'split_value_{uid}', '').strip()
+                if value_field and raw:
+                    spec[value_field] = Decimal(raw)
+                specs.append(spec)
+            SplitEngine.split(amount, split_type, specs)
+        except InvalidOperation:
+            messages.error(request, "Please enter valid split values.")
+            return redirect('expenses:add_expense')
+        except SplitError as e:
+            messages.error(request, str(e))
+            return redirect('expenses:add_expense')
 
         try:
-            group = Group.objects.get(id=group_id)
             paid_by = User.objects.get(id=paid_by_id)
 
-            with transaction.atomic():
+            def create():
                 expense = Expense.objects.create(
                     description=title or f"Expense on {date_value}",
                     amount=amount,
+                    currency=currency,
                     date=date_value,
                     group=group,
                     paid_by=paid_by,
                     split_type=split_type,
                     notes=description
                 )
-                print("STEP 1: Created Expense:", expense)
 
-                shares = []
-                if split_type == 'equal':
-                    per_person = (amount / Decimal(len(user_ids))).quantize(Decimal('0.01'))
-                    for uid in user_ids:
-                        user = User.objects.get(id=uid)
-                        shares.append(ExpenseShare(expense=expense, user=user, amount=per_person))
-                else:
-                    for uid in user_ids:
-                        user = User.objects.get(id=uid)
-                        shares.append(ExpenseShare(expense=expense, user=user, amount=Decimal('0.00')))
+                ExpenseShare.objects.bulk_create(ExpenseWriter.build_shares(expense, specs))
+                ExpenseIndex.sync_expense(expense)
+                return expense
 
-                ExpenseShare.objects.bulk_create(shares)
-                print(f"STEP 2: Created {len(shares)} shares")
+            # Committed together with any concurrent writes to this group, with one recalculation
+            expense = GroupWriteCoordinator.submit(group, create)
 
-                BalanceCalculator.recalculate_group_balances(group)
-                print("STEP 3: Balances recalculated successfully ✅")
+            NotificationService.notify_expense_added(expense)
 
-                NotificationService.notify_expense_added(expense)
+            logger.info("Expense %s added to group %s", expense.id, group.id)
+            log(request.user, 'expense_added', 'expense', expense.id,
+                {'description': expense.description, 'amount': str(expense.amount)}, group=group)
 
-                messages.success(request, "Expense added successfully!")
-                return redirect('dashboard')
+            messages.success(request, "Expense added successfully!")
+            return redirect('dashboard')
 
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error adding expense")
             messages.error(request, f"Error adding expense: {e}")
-            return redirect('add_expense')
+            return redirect('expenses:add_expense')
 
-    groups = Group.objects.filter(members=request.user)
-    users = User.objects.exclude(id=request.user.id)
+    groups = Group.objects.filter(members=request.user).only('id', 'name')
     return render(request, 'expenses/add_expense.html', {
         'groups': groups,
-        'users': users,
-        'today': timezone.now().date() 
+        'today': timezone.now().date(),
+        'currencies': list(CURRENCY_SYMBOLS),
+        'default_currency': request.user.default_currency,
+        # Sent back with the form so a resubmitted POST replays instead of adding twice
+        'idempotency_key': uuid.uuid4().hex,
     })
 
 
 @login_required
 def edit_expense(request, expense_id):
     """Edit an existing expense"""
-    expense = get_object_or_404(Expense, id=expense_id, paid_by=request.user)
+    expense = get_object_or_404(Expense, id=expense_id, paid_by=request.user, group__deleted_at__isnull=True)
 
     if request.method == 'POST':
+        user_ids = request.POST.getlist('user_ids[]')
+        logger.debug("edit_expense %s participants=%s", expense.id, user_ids)
+
+        # Validate everything before writing, the same way add_expense does
+        try:
+            amount = Decimal(request.POST['amount'])
+            split_type = request.POST['split_type']
+            user_ids = list(dict.fromkeys(int(uid) for uid in user_ids))
+
+            # One list per value, aligned with user_ids: amounts[], percentages[], weights[], adjustments[]
+            value_field = SPLIT_VALUE_FIELDS.get(split_type)
+            specs = [{'user_id': user_id} for user_id in user_ids]
+            if value_field:
+                for spec, value in zip(specs, request.POST.getlist(f'{value_field}s[]')):
+                    if value.strip():
+                        spec[value_field] = Decimal(value)
+            SplitEngine.split(amount, split_type, specs)
+        except SplitError as e:
+            messages.error(request, str(e))
+            return redirect('expenses:edit_expense', expense_id=expense.id)
+        except (KeyError, ValueError, InvalidOperation):
+            messages.error(request, "Please enter a valid amount, participants and split values.")
+            return redirect('expenses:edit_expense', expense_id=expense.id)
+
+        currency = request.POST.get('currency', expense.currency).upper()
+        if not FxRates.supported(currency):
+            messages.error(request, f"{currency} isn't a currency we have an exchange rate for.")
+            return redirect('expenses:edit_expense', expense_id=expense.id)
+
+        # Payer and participants must all belong to the expense's group
+        if expense.group_id and not MembershipService.are_members(expense.group, [expense.paid_by_id, *user_ids]):
+            messages.error(request, "The payer and participants must be members of the group.")
+            return redirect('expenses:edit_expense', expense_id=expense.id)
+
         try:
-            with transaction.atomic():
+            with transaction.atomic(), BalanceCalculator.deferred():
                 expense.description = request.POST['description']
-                expense.amount = Decimal(request.POST['amount'])
-                expense.currency = request.POST.get('currency', 'INR')
+                expense.amount = amount
+                expense.currency = currency
                 expense.date = request.POST['date']
                 expense.notes = request.POST.get('notes', '')
                 expense.category_id = request.POST.get('category') if request.POST.get('category') else None
-                expense.split_type = request.POST['split_type']
+                expense.split_type = split_type
                 expense.save()
 
                 expense.shares.all().delete()
+                ExpenseShare.objects.bulk_create(ExpenseWriter.build_shares(expense, specs))
 
-                split_type = request.POST['split_type']
-                user_ids = request.POST.getlist('user_ids[]')
-                print("DEBUG user_ids:", user_ids)
-
-                if split_type == 'equal':
-                    num_people = len(user_ids)
-                    if num_people <= 0:
-                        messages.error(request, "No participants selected for this expense.")
-                        expense.delete()
-                        return redirect('expenses:add_expense')
-
-                    share_amount = (expense.amount / num_people).quantize(Decimal('0.01'))
-                    for user_id in user_ids:
-                        ExpenseShare.objects.create(
-                            expense=expense,
-                            user_id=user_id,
-                            amount=share_amount
-                        )
-
-                elif split_type == 'unequal':
-                    amounts = request.POST.getlist('amounts[]')
-                    total = sum(Decimal(amt) for amt in amounts)
-
-                    if total != expense.amount:
-                        raise ValueError(f"Shares don't match expense amount")
-
-                    for user_id, amount in zip(user_ids, amounts):
-                        ExpenseShare.objects.create(
-                            expense=expense,
-                            user_id=user_id,
-                            amount=Decimal(amount)
-                        )
-
-                elif split_type == 'percentage':
-                    percentages = request.POST.getlist('percentages[]')
-                    total_pct = sum(Decimal(pct) for pct in percentages)
-
-                    if total_pct != 100:
-                        raise ValueError(f"Percentages must sum to 100%")
-
-                    for user_id, percentage in zip(user_ids, percentages):
-                        pct = Decimal(percentage)
-                        amount = (expense.amount * pct / 100).quantize(Decimal('0.01'))
-
-                        ExpenseShare.objects.create(
-                            expense=expense,
-                            user_id=user_id,
-                            amount=amount,
-                            percentage=pct
-                        )
+                ExpenseIndex.sync_expense(expense)
 
                 NotificationService.notify_expense_edited(expense, request.user)
 
-                messages.success(request, "Expense updated successfully!")
-                return redirect('expenses:expense_detail', expense_id=expense.id)
-
-        except ValueError as e:
-            messages.error(request, str(e))
+                log(request.user, 'expense_edited', 'expense', expense.id,
+                    {'description': expense.description, 'amount': str(expense.amount)}, group=expense.group)
         except Exception as e:
-            messages.error(request, f"Error updating expense: {str(e)}")
+            logger.exception("Error updating expense %s", expense.id)
+            messages.error(request, f"Error updating expense: {e}")
+            # The instance holds the rolled-back values; show the stored ones again
+            return redirect('expenses:edit_expense', expense_id=expense.id)
+
+        messages.success(request, "Expense updated successfully!")
+        return redirect('expenses:expense_detail', expense_id=expense.id)
 
     context = {
         'expense': expense,
@@ -264,7 +319,7 @@ def edit_expense(request, expense_id):
 @login_required
 def delete_expense(request, expense_id):
     try:
-        expense = Expense.objects.get(id=expense_id)
+        expense = Expense.objects.get(id=expense_id, group__deleted_at__isnull=True)
     except Expense.DoesNotExist:
         messages.error(request, "Expense not found.")
         return redirect('expenses:expense_list')
@@ -284,9 +339,12 @@ def delete_expense(request, expense_id):
         }
         expense_data['affected_users'] = User.objects.filter(id__in=expense_data['affected_users'])
 
+        expense_id = expense.id
+        # post_delete requests the recalculation
         expense.delete()
 
-        BalanceCalculator.recalculate_group_balances(group)
+        log(request.user, 'expense_deleted', 'expense', expense_id,
+            {'description': expense_desc}, group=group)
 
         NotificationService.notify_expense_deleted(expense_data, request.user)
 
@@ -298,61 +356,12 @@ def delete_expense(request, expense_id):
 
 @login_required
 def my_balances(request):
-    user = request.user
-
-    balances = calculate_user_balances(user)
-
-    context = {
-        'total_owed_to_me': balances['owed_to_me'],
-        'total_i_owe': balances['i_owe'],
-        'net_balance': balances['net_balance'],
-        'details': balances['details'],
-    }
-
-    return render(request, 'expenses/my_balances.html', context)
-
+    """Per-person balances across groups live on the balances page"""
+    return redirect('balances:user_balances')
 
-def calculate_user_balances(user):
-    from collections import defaultdict
-
-    balances = defaultdict(Decimal)
-
-    paid_expenses = Expense.objects.filter(paid_by=user).prefetch_related('shares__user')
-
-    for expense in paid_expenses:
-        for share in expense.shares.all():
-            if share.user != user:
-                balances[share.user] += share.amount
-
-    shared_expenses = Expense.objects.filter(shares__user=user).select_related('paid_by')
-
-    for expense in shared_expenses:
-        if expense.paid_by != user:
-            user_share = expense.get_share_for_user(user)
-            balances[expense.paid_by] -= user_share
-
-    owed_to_me = sum(amt for amt in balances.values() if amt > 0)
-    i_owe = sum(abs(amt) for amt in balances.values() if amt < 0)
-
-    details = []
-    for other_user, amount in balances.items():
-        if amount != 0:
-            details.append({
-                'user': other_user,
-                'amount': abs(amount),
-                'status': 'owes_me' if amount > 0 else 'i_owe'
-            })
-
-    details.sort(key=lambda x: x['amount'], reverse=True)
-
-    return {
-        'owed_to_me': owed_to_me,
-        'i_owe': i_owe,
-        'net_balance': owed_to_me - i_owe,
-        'details': details
-    }
 
 @login_required
+@conditional_on(group_members_marker)
 def get_group_members(request, group_id):
     group = get_object_or_404(Group, id=group_id, members=request.user)
 
@@ -360,7 +369,7 @@ def get_group_members(request, group_id):
         {
             'id': member.id,
             'username': member.username,
-            'name': getattr(member, 'profile', None).display_name if hasattr(member, 'profile') else member.username,
+            'name': member.get_full_name() or member.username,
         }
         for member in group.members.all()
     ]
@@ -373,12 +382,13 @@ from django.http import HttpResponse
 import io
 
 @login_required
+@profiled('expenses.pdf')
 def expense_pdf(request, expense_id):
     """Generate a downloadable PDF directly from expense_detail.html."""
     expense = get_object_or_404(
         Expense.objects.select_related('paid_by', 'group', 'category')
                        .prefetch_related('shares__user'),
-        id=expense_id
+        id=expense_id, group__deleted_at__isnull=True
     )
 
     # ✅ same access check as expense_detail
@@ -422,15 +432,17 @@ def expense_pdf(request, expense_id):
     }
 
     # ✅ render same template as on-screen
-    template = get_template('expenses/expense_detail.html')
-    html = template.render(context)
+    with section('expenses.pdf.render_html'):
+        template = get_template('expenses/expense_detail.html')
+        html = template.render(context)
 
     # ✅ convert HTML to PDF
     response = HttpResponse(content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="expense_{expense.id}.pdf"'
 
     pdf_buffer = io.BytesIO()
-    pisa_status = pisa.CreatePDF(html, dest=pdf_buffer)
+    with section('expenses.pdf.convert'):
+        pisa_status = pisa.CreatePDF(html, dest=pdf_buffer)
 
     if pisa_status.err:
         return HttpResponse("Error generating PDF.<pre>" + html + "</pre>")
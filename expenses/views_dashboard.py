@@ -4,6 +4,7 @@
 # ============================================================================
 
 from django.shortcuts import render
+from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.db.models import Sum, Count, Q
 from django.db.models.functions import TruncMonth, TruncWeek
@@ -17,16 +18,22 @@ from balances.services import BalanceCalculator
 from activity.models import Activity
 from balances.models import Balance
 from balances.services import BalanceCalculator
+from core.currency import FxRates, base_currency
+from core.routers import read_only
 
 
-@login_required
-def dashboard_view(request):
-    groups = Group.objects.filter(members=request.user).distinct()
+def _converted_total(queryset, currency):
+    """
+    Sum `amount` per currency in SQL, then convert each subtotal once.
+    Returns (total, unconverted) like FxRates.convert_totals.
+    """
+    rows = queryset.order_by().values('currency').annotate(total=Sum('amount'))
+    return FxRates.convert_totals({row['currency']: row['total'] for row in rows}, currency)
 
-    for group in Group.objects.all():
-        if not Balance.objects.filter(group=group).exists():
-            BalanceCalculator.recalculate_group_balances(group)
 
+@login_required
+@read_only
+def dashboard_view(request):
     groups = Group.objects.filter(members=request.user).distinct()
     total_groups = groups.count()
     
@@ -37,6 +44,7 @@ def dashboard_view(request):
     total_expenses = expenses.count()
 
     user_balances = BalanceCalculator.get_user_balances(request.user)
+    currency = user_balances['currency']
     overall_balance = user_balances.get('net_balance', Decimal('0'))
     total_owes = user_balances.get('total_owes', Decimal('0'))
     total_owed = user_balances.get('total_owed', Decimal('0'))
@@ -45,41 +53,45 @@ def dashboard_view(request):
     recent_expenses = expenses[:10]
     
     six_months_ago = datetime.now() - timedelta(days=180)
-    monthly_expenses = expenses.filter(
+    monthly_expenses = list(expenses.filter(
         date__gte=six_months_ago
     ).annotate(
         month=TruncMonth('date')
-    ).values('month').annotate(
+    ).order_by().values('month', 'currency').annotate(
         total=Sum('amount'),
         count=Count('id')
-    ).order_by('month')
+    ))
+    monthly_totals = FxRates.fold(monthly_expenses, currency, key=lambda row: row['month'])
+    monthly_counts = defaultdict(int)
+    for item in monthly_expenses:
+        monthly_counts[item['month']] += item['count']
     
     monthly_data = {
         'labels': [],
         'amounts': [],
         'counts': []
     }
-    for item in monthly_expenses:
-        monthly_data['labels'].append(item['month'].strftime('%b %Y'))
-        monthly_data['amounts'].append(float(item['total']))
-        monthly_data['counts'].append(item['count'])
-    
-    category_breakdown = defaultdict(Decimal)
-    for expense in expenses[:100]:  
-        category_breakdown[expense.group.name] += expense.amount
+    for month in sorted(monthly_totals):
+        monthly_data['labels'].append(month.strftime('%b %Y'))
+        monthly_data['amounts'].append(float(monthly_totals[month]))
+        monthly_data['counts'].append(monthly_counts[month])
+    
+    category_breakdown = FxRates.fold(
+        expenses.order_by().values('group__name', 'currency').annotate(total=Sum('amount')),
+        currency,
+        key=lambda row: row['group__name'],
+    )
+    top_categories = sorted(category_breakdown.items(), key=lambda item: item[1], reverse=True)[:5]
     
     category_data = {
-        'labels': list(category_breakdown.keys())[:5],  
-        'amounts': [float(v) for v in list(category_breakdown.values())[:5]]
+        'labels': [name for name, _ in top_categories],
+        'amounts': [float(v) for _, v in top_categories]
     }
     
-    total_paid_by_user = expenses.filter(paid_by=request.user).aggregate(
-        total=Sum('amount')
-    )['total'] or Decimal('0')
+    total_paid_by_user, _ = _converted_total(expenses.filter(paid_by=request.user), currency)
     
-    total_all_expenses = expenses.aggregate(
-        total=Sum('amount')
-    )['total'] or Decimal('1')  
+    # Every chart is cut from these expenses, so this lists everything left out for lack of a rate
+    total_all_expenses, unconverted = _converted_total(expenses, currency)
     
     contribution_percentage = (total_paid_by_user / total_all_expenses * 100) if total_all_expenses else 0
     
@@ -87,12 +99,27 @@ def dashboard_view(request):
         Q(user=request.user) | Q(group__in=groups)
     ).select_related('user', 'group').order_by('-created_at')[:10]
     
-    top_spenders = expenses.values(
-        'paid_by__username', 'paid_by__id'
+    spender_rows = list(expenses.order_by().values(
+        'paid_by__username', 'paid_by__id', 'currency'
     ).annotate(
-        total_paid=Sum('amount'),
+        total=Sum('amount'),
         expense_count=Count('id')
-    ).order_by('-total_paid')[:5]
+    ))
+    spender_totals = FxRates.fold(
+        spender_rows, currency, key=lambda row: (row['paid_by__id'], row['paid_by__username'])
+    )
+    spender_counts = defaultdict(int)
+    for row in spender_rows:
+        spender_counts[row['paid_by__id']] += row['expense_count']
+    top_spenders = sorted(
+        (
+            {'paid_by__id': uid, 'paid_by__username': name,
+             'total_paid': total, 'expense_count': spender_counts[uid]}
+            for (uid, name), total in spender_totals.items()
+        ),
+        key=lambda row: row['total_paid'],
+        reverse=True,
+    )[:5]
 
     settlements_this_month = Activity.objects.filter(
         user=request.user,
@@ -101,12 +128,14 @@ def dashboard_view(request):
     ).count()
 
 
+    # GroupStats keeps totals in the base currency; convert once for display
+    base = base_currency()
     group_stats = []
-    for group in groups[:5]:  
-        group_expenses = expenses.filter(group=group)
-        total_spent = group_expenses.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        expense_count = group_expenses.count()
-        
+    for group in groups.select_related('stats').order_by('-stats__expense_count')[:5]:
+        stats = getattr(group, 'stats', None)
+        expense_count = stats.expense_count if stats else 0
+        total_spent, _ = FxRates.convert_totals({base: stats.total_spent if stats else Decimal('0')}, currency)
+
         group_stats.append({
             'group': group,
             'total_spent': total_spent,
@@ -114,9 +143,8 @@ def dashboard_view(request):
             'average': total_spent / expense_count if expense_count > 0 else Decimal('0')
         })
     
-    group_stats.sort(key=lambda x: x['expense_count'], reverse=True)
-    
     context = {
+        "currency": currency,
         "groups": groups,
         "total_groups": total_groups,
         "total_expenses": total_expenses,
@@ -135,6 +163,8 @@ def dashboard_view(request):
         "top_spenders": top_spenders,
         "settlements_this_month": settlements_this_month,
         "group_stats": group_stats,
+        "unconverted": unconverted,
+        "unconverted_balances": user_balances['unconverted'],
         "avg_expense": (total_all_expenses / total_expenses) if total_expenses > 0 else Decimal('0'),
         "expenses_this_month": expenses.filter(
             date__gte=datetime.now().replace(day=1)
@@ -159,41 +189,65 @@ def activity_feed_view(request):
     return render(request, 'expenses/activity_feed.html', context)
 
 from django.http import JsonResponse
+from core.http import conditional_on
+from groups.services import GroupVersion
+
+
+ANALYTICS_PERIOD_DAYS = {'6m': 180, '1y': 365}
+
+
+def _analytics_window(request):
+    """(period, first date included or None for all time)"""
+    period = request.GET.get('period', '6m')
+    days = ANALYTICS_PERIOD_DAYS.get(period)
+    return period, timezone.localdate() - timedelta(days=days) if days else None
+
+
+def _analytics_marker(request):
+    # Expense writes always recalculate the group, bumping its ledger_version;
+    # the totals also move with the viewer's currency, the FX rates and the window
+    period, start_date = _analytics_window(request)
+    return (
+        GroupVersion.for_user(request.user), request.user.default_currency,
+        FxRates.version(), period, start_date,
+    ), None
+
 
 @login_required
+@read_only
+@conditional_on(_analytics_marker)
 def analytics_api(request):
     """API endpoint for fetching analytics data"""
     
-    period = request.GET.get('period', '6m')  
+    _, start_date = _analytics_window(request)
     
     groups = Group.objects.filter(members=request.user)
     expenses = Expense.objects.filter(group__in=groups)
     
-    if period == '6m':
-        start_date = datetime.now() - timedelta(days=180)
-    elif period == '1y':
-        start_date = datetime.now() - timedelta(days=365)
-    else:
-        start_date = None
-    
     if start_date:
         expenses = expenses.filter(date__gte=start_date)
     
-    monthly_trend = expenses.annotate(
-        month=TruncMonth('date')
-    ).values('month').annotate(
-        total=Sum('amount')
-    ).order_by('month')
+    currency = request.user.default_currency
+    monthly_trend = FxRates.fold(
+        expenses.annotate(month=TruncMonth('date'))
+        .order_by().values('month', 'currency').annotate(total=Sum('amount')),
+        currency,
+        key=lambda row: row['month'],
+    )
     
+    total_spent, unconverted = _converted_total(expenses, currency)
     data = {
+        'currency': currency,
         'monthly_trend': [
             {
-                'month': item['month'].strftime('%Y-%m'),
-                'total': float(item['total'])
+                'month': month.strftime('%Y-%m'),
+                'total': float(monthly_trend[month])
             }
-            for item in monthly_trend
+            for month in sorted(monthly_trend)
         ],
-        'total_spent': float(expenses.aggregate(total=Sum('amount'))['total'] or 0),
+        'total_spent': float(total_spent),
+        # Spending in currencies without an FX rate, which the totals above leave out
+        'unconverted': {code: float(amount) for code, amount in unconverted.items()},
         'expense_count': expenses.count(),
     }
     
@@ -1,6 +1,11 @@
 from django.contrib import admin
-from .models import Group
+from .models import Group, GroupStats
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('name','type','created_at')
     filter_horizontal = ('members',)
+
+
+@admin.register(GroupStats)
+class GroupStatsAdmin(admin.ModelAdmin):
+    list_display = ('group', 'member_count', 'expense_count', 'total_spent', 'last_activity_at')
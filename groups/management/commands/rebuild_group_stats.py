@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from groups.services import GroupStatsService
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized group counters from expenses, memberships and activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--group-id',
+            type=int,
+            action='append',
+            help='Rebuild for this group only (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = GroupStatsService.rebuild(options.get('group_id'))
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt stats for {rebuilt} groups'))
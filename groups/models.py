@@ -1,6 +1,13 @@
 from django.db import models
 from django.conf import settings
 
+class ActiveGroupManager(models.Manager):
+    """Hides soft-deleted groups; they wait for `manage.py reap_deleted`"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Group(models.Model):
     GROUP_TYPES = [
         ('trip','Trip'),
@@ -17,6 +24,29 @@ class Group(models.Model):
     end_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='groups_created')
+    # Bumped on every balance recalculation / membership change; cheap cache validators
+    ledger_version = models.PositiveIntegerField(default=0, editable=False)
+    membership_version = models.PositiveIntegerField(default=0, editable=False)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+
+    objects = ActiveGroupManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.name
+
+
+class GroupStats(models.Model):
+    """
+    Denormalized per-group summary, kept current by GroupStatsService with
+    F() updates so group lists can sort and render without per-row queries.
+    total_spent is in the FX base currency, converted at write time.
+    """
+    group = models.OneToOneField(Group, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    expense_count = models.PositiveIntegerField(default=0)
+    member_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"Stats for group {self.group_id}"
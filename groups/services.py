@@ -0,0 +1,311 @@
+import logging
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from core.currency import FxRates, base_currency
+from .models import Group, GroupStats
+
+logger = logging.getLogger(__name__)
+
+MEMBER_IDS_CACHE_TIMEOUT = 300
+# Member-id sets larger than this are never cached; lookups fall back to exists()
+MEMBER_IDS_CACHE_LIMIT = 1000
+# Cached in place of the set for groups over the limit, so they aren't loaded on every miss
+LARGE_GROUP = 'large'
+
+Membership = Group.members.through
+
+
+class MembershipService:
+    """
+    Membership checks that never load member rows.
+
+    Answers are memoized on the Group instance (so repeated checks within a
+    request are free) and backed by a cached member-id set per group, loaded
+    on the first miss and dropped by groups.signals whenever the membership
+    changes. Groups over MEMBER_IDS_CACHE_LIMIT are checked with exists().
+    """
+
+    @staticmethod
+    def _cache_key(group_id):
+        return f'group:{group_id}:member_ids'
+
+    @staticmethod
+    def _memo(group):
+        return group.__dict__.setdefault('_membership_memo', {})
+
+    @staticmethod
+    def is_member(group, user):
+        """True if `user` (instance or id) belongs to `group`"""
+        user_id = getattr(user, 'pk', user)
+        if user_id is None:
+            return False
+
+        memo = MembershipService._memo(group)
+        if user_id in memo:
+            return memo[user_id]
+
+        cached = MembershipService._cached_ids(group)
+        if cached is not None:
+            result = user_id in cached
+        else:
+            result = Membership.objects.filter(group_id=group.pk, user_id=user_id).exists()
+
+        memo[user_id] = result
+        return result
+
+    @staticmethod
+    def are_members(group, users):
+        """True if every user (instances or ids) belongs to `group`, in at most one query"""
+        user_ids = {getattr(u, 'pk', u) for u in users}
+        memo = MembershipService._memo(group)
+        unknown = {uid for uid in user_ids if uid not in memo}
+
+        if unknown:
+            cached = MembershipService._cached_ids(group)
+            if cached is not None:
+                found = unknown & cached
+            else:
+                found = set(
+                    Membership.objects.filter(group_id=group.pk, user_id__in=unknown)
+                    .values_list('user_id', flat=True)
+                )
+            for uid in unknown:
+                memo[uid] = uid in found
+
+        return all(memo[uid] for uid in user_ids)
+
+    @staticmethod
+    def _cached_ids(group):
+        """The cached member-id set, loaded on a miss; None for groups over MEMBER_IDS_CACHE_LIMIT"""
+        cached = cache.get(MembershipService._cache_key(group.pk))
+        if cached is None:
+            ids = MembershipService.member_ids(group)
+            return ids if len(ids) <= MEMBER_IDS_CACHE_LIMIT else None
+        return None if cached == LARGE_GROUP else cached
+
+    @staticmethod
+    def member_ids(group):
+        """Return the frozenset of member ids, from cache when possible"""
+        key = MembershipService._cache_key(group.pk)
+        ids = cache.get(key)
+        if ids is None or ids == LARGE_GROUP:
+            ids = frozenset(
+                Membership.objects.filter(group_id=group.pk).values_list('user_id', flat=True)
+            )
+            cache.set(key, ids if len(ids) <= MEMBER_IDS_CACHE_LIMIT else LARGE_GROUP, MEMBER_IDS_CACHE_TIMEOUT)
+
+        memo = MembershipService._memo(group)
+        for uid in ids:
+            memo[uid] = True
+        return ids
+
+    @staticmethod
+    def invalidate(group_ids):
+        cache.delete_many([MembershipService._cache_key(gid) for gid in group_ids])
+
+    @staticmethod
+    def add_members(group, user_ids, within=None):
+        """
+        Add users to `group` with one validating query and one through-table
+        insert, then send a single members_changed event. `within` is an
+        optional Q limiting which users may be added. Unknown ids, users
+        outside `within` and existing members are skipped. Returns
+        {user_id: username} of the users actually added.
+        """
+        from .signals import members_changed
+
+        ids = {int(i) for i in user_ids if str(i).isdigit()}
+        if not ids:
+            return {}
+
+        candidates = get_user_model().objects.filter(id__in=ids)
+        if within is not None:
+            candidates = candidates.filter(within)
+        rows = candidates.annotate(
+            is_member=Exists(Membership.objects.filter(group_id=group.pk, user_id=OuterRef('pk')))
+        ).values_list('id', 'username', 'is_member')
+        added = {uid: username for uid, username, is_member in rows if not is_member}
+        if not added:
+            return {}
+
+        with transaction.atomic():
+            Membership.objects.bulk_create(
+                [Membership(group_id=group.pk, user_id=uid) for uid in sorted(added)],
+                ignore_conflicts=True,
+            )
+            group.__dict__.pop('_membership_memo', None)
+            members_changed.send(sender=Group, group=group, added=sorted(added), removed=[])
+        return added
+
+    @staticmethod
+    def outstanding_balance_ids(group, user_ids):
+        """Ids among `user_ids` who still owe or are owed money in `group`"""
+        from balances.models import Balance
+
+        user_ids = list(user_ids)
+        rows = Balance.objects.filter(group_id=group.pk).filter(
+            Q(from_user_id__in=user_ids) | Q(to_user_id__in=user_ids)
+        ).values_list('from_user_id', 'to_user_id')
+        return {uid for pair in rows for uid in pair} & set(user_ids)
+
+    @staticmethod
+    def remove_members(group, user_ids, check_balances=True):
+        """
+        Remove users from `group` in one statement and send a single
+        members_changed event. With `check_balances`, anyone with an
+        outstanding balance in the group's ledger is kept. Returns
+        (removed_ids, blocked_ids).
+        """
+        from .signals import members_changed
+
+        ids = {int(i) for i in user_ids if str(i).isdigit()}
+        current = set(
+            Membership.objects.filter(group_id=group.pk, user_id__in=ids).values_list('user_id', flat=True)
+        )
+        blocked = MembershipService.outstanding_balance_ids(group, current) if check_balances and current else set()
+        removable = sorted(current - blocked)
+
+        if removable:
+            with transaction.atomic():
+                Membership.objects.filter(group_id=group.pk, user_id__in=removable).delete()
+                group.__dict__.pop('_membership_memo', None)
+                members_changed.send(sender=Group, group=group, added=[], removed=removable)
+        return removable, sorted(blocked)
+
+
+class GroupVersion:
+    """Monotonic per-group counters used to build ETags for polled endpoints"""
+
+    @staticmethod
+    def bump_ledger(group_ids):
+        Group.objects.filter(pk__in=group_ids).update(ledger_version=F('ledger_version') + 1)
+
+    @staticmethod
+    def bump_membership(group_ids):
+        Group.objects.filter(pk__in=group_ids).update(membership_version=F('membership_version') + 1)
+
+    @staticmethod
+    def for_user(user):
+        """(group_id, ledger_version, membership_version) for every group `user` is in"""
+        return tuple(
+            Group.objects.filter(members=user)
+            .order_by('id')
+            .values_list('id', 'ledger_version', 'membership_version')
+        )
+
+
+class GroupStatsService:
+    """
+    Keeps GroupStats in step with writes. Expense and settlement writes apply
+    atomic F() deltas, so concurrent writers never lose updates. Membership
+    changes recount from the through table in the same UPDATE.
+    """
+
+    @staticmethod
+    def ensure(group_ids):
+        GroupStats.objects.bulk_create(
+            [GroupStats(group_id=gid) for gid in set(group_ids)], ignore_conflicts=True
+        )
+
+    @staticmethod
+    def to_base(amount, currency):
+        total, unconverted = FxRates.convert_totals({currency: amount}, base_currency())
+        if unconverted:
+            logger.warning("No FX rate for %s: %s left out of group stats totals", currency, amount)
+        return total
+
+    @staticmethod
+    def record_expenses(deltas):
+        """Apply {group_id: (count_delta, amount_delta_in_base)} and mark the groups active"""
+        deltas = {gid: d for gid, d in deltas.items() if gid}
+        if not deltas:
+            return
+        GroupStatsService.ensure(deltas)
+        now = timezone.now()
+        for group_id, (count, amount) in deltas.items():
+            GroupStats.objects.filter(group_id=group_id).update(
+                expense_count=F('expense_count') + count,
+                total_spent=F('total_spent') + amount,
+                last_activity_at=now,
+            )
+
+    @staticmethod
+    def touch(group_ids):
+        """Record activity that doesn't change the counters (e.g. a settlement)"""
+        group_ids = [gid for gid in set(group_ids) if gid]
+        if not group_ids:
+            return
+        GroupStatsService.ensure(group_ids)
+        GroupStats.objects.filter(group_id__in=group_ids).update(last_activity_at=timezone.now())
+
+    @staticmethod
+    def recount_members(group_ids):
+        group_ids = [gid for gid in set(group_ids) if gid]
+        if not group_ids:
+            return
+        GroupStatsService.ensure(group_ids)
+        member_count = (
+            Membership.objects.filter(group_id=OuterRef('group_id'))
+            .order_by().values('group_id').annotate(n=Count('*')).values('n')
+        )
+        GroupStats.objects.filter(group_id__in=group_ids).update(
+            member_count=Coalesce(Subquery(member_count), 0),
+            last_activity_at=timezone.now(),
+        )
+
+    @staticmethod
+    def rebuild(group_ids=None):
+        """Recompute stats from the source tables; returns the number of groups rebuilt"""
+        from activity.models import Activity
+        from expenses.models import Expense
+
+        groups = Group.objects.all()
+        if group_ids is not None:
+            groups = groups.filter(id__in=list(group_ids))
+        ids = list(groups.values_list('id', flat=True))
+        if not ids:
+            return 0
+
+        unconverted = {}
+        totals = FxRates.fold(
+            Expense.objects.filter(group_id__in=ids).order_by()
+            .values('group_id', 'currency').annotate(total=Sum('amount')),
+            base_currency(),
+            key=lambda row: row['group_id'],
+            unconverted=unconverted,
+        )
+        if unconverted:
+            logger.warning("No FX rate for %s: left out of group stats totals", ', '.join(sorted(unconverted)))
+        counts = dict(
+            Expense.objects.filter(group_id__in=ids).order_by()
+            .values('group_id').annotate(n=Count('id')).values_list('group_id', 'n')
+        )
+        members = dict(
+            Membership.objects.filter(group_id__in=ids).order_by()
+            .values('group_id').annotate(n=Count('id')).values_list('group_id', 'n')
+        )
+        latest = dict(groups.values_list('id', 'created_at'))
+        latest.update(
+            Activity.objects.filter(group_id__in=ids).order_by()
+            .values('group_id').annotate(at=Max('created_at')).values_list('group_id', 'at')
+        )
+
+        GroupStatsService.ensure(ids)
+        rows = [
+            GroupStats(
+                group_id=gid,
+                total_spent=totals.get(gid, 0),
+                expense_count=counts.get(gid, 0),
+                member_count=members.get(gid, 0),
+                last_activity_at=latest.get(gid),
+            )
+            for gid in ids
+        ]
+        GroupStats.objects.bulk_update(
+            rows, ['total_spent', 'expense_count', 'member_count', 'last_activity_at'], batch_size=500
+        )
+        return len(rows)
@@ -0,0 +1,90 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+from balances.models import Settlement
+from expenses.models import Expense
+from .models import Group, GroupStats
+from .services import MembershipService, GroupVersion, GroupStatsService
+
+# Sent once per MembershipService.add_members/remove_members call with
+# `group`, `added` and `removed` (lists of user ids). Bulk through-table
+# writes don't fire m2m_changed, so listeners of both stay in step.
+members_changed = Signal()
+
+
+def _membership_changed(group_ids):
+    MembershipService.invalidate(group_ids)
+    GroupVersion.bump_membership(group_ids)
+    GroupStatsService.recount_members(group_ids)
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def invalidate_membership_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop cached member-id sets whenever group membership changes"""
+    if reverse and action == 'pre_clear':
+        # user.member_groups.clear(): remember the groups before the rows go away
+        instance._cleared_group_ids = list(instance.member_groups.values_list('id', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # user.member_groups.add(...): instance is the user, pk_set holds group ids
+        group_ids = pk_set if pk_set is not None else instance.__dict__.pop('_cleared_group_ids', [])
+    else:
+        group_ids = [instance.pk]
+        instance.__dict__.pop('_membership_memo', None)
+
+    _membership_changed(group_ids)
+
+
+@receiver(members_changed, sender=Group)
+def invalidate_after_bulk_change(sender, group, **kwargs):
+    _membership_changed([group.pk])
+
+
+@receiver(post_save, sender=Group)
+def create_group_stats(sender, instance, created, **kwargs):
+    if created:
+        GroupStats.objects.bulk_create(
+            [GroupStats(group_id=instance.pk, last_activity_at=instance.created_at)], ignore_conflicts=True
+        )
+
+
+@receiver(pre_save, sender=Expense)
+def remember_expense_totals(sender, instance, **kwargs):
+    """Stash what the row held before an update so post_save can apply the difference"""
+    if instance.pk and not instance._state.adding:
+        instance._stats_before = Expense.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'amount', 'currency'
+        ).first()
+
+
+@receiver(post_save, sender=Expense)
+def expense_saved_stats(sender, instance, created, **kwargs):
+    deltas = {}
+
+    def add(group_id, count, amount, currency):
+        if group_id:
+            c, a = deltas.get(group_id, (0, 0))
+            deltas[group_id] = (c + count, a + GroupStatsService.to_base(amount, currency))
+
+    before = None if created else instance.__dict__.pop('_stats_before', None)
+    if before:
+        add(before[0], -1, -before[1], before[2])
+    add(instance.group_id, 1, instance.amount, instance.currency)
+    GroupStatsService.record_expenses(deltas)
+
+
+@receiver(post_delete, sender=Expense)
+def expense_deleted_stats(sender, instance, **kwargs):
+    if instance.group_id:
+        GroupStatsService.record_expenses({
+            instance.group_id: (-1, -GroupStatsService.to_base(instance.amount, instance.currency))
+        })
+
+
+@receiver(post_save, sender=Settlement)
+def settlement_saved_stats(sender, instance, created, **kwargs):
+    if created:
+        GroupStatsService.touch([instance.group_id])
@@ -1,3 +1,269 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from unittest import mock
+from django.test import TestCase, override_settings
+from accounts.models import Friendship, FriendSuggestion, SuggestionRefresh, User
+from accounts.services import FriendSuggestionEngine
+from balances.models import Balance
+from core.currency import FxRates
+from core.models import FxRate
+from balances.services import BalanceCalculator
+from expenses.models import Expense, ExpenseShare
+from expenses.services import ExpenseWriter
+from .models import Group, GroupStats
+from .services import LARGE_GROUP, Membership, MembershipService
 
-# Create your tests here.
+
+class GroupStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        cls.carol = User.objects.create_user('carol')
+        cls.flat = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.flat.members.add(cls.alice, cls.bob)
+        cls.trip = Group.objects.create(name='Trip', created_by=cls.alice)
+        cls.trip.members.add(cls.alice)
+        FxRate.objects.create(currency='USD', rate=Decimal('0.0125'))
+
+    def setUp(self):
+        FxRates.clear()
+        self.addCleanup(FxRates.clear)
+
+    def stats(self, group):
+        row = GroupStats.objects.get(group=group)
+        return row.expense_count, row.total_spent, row.member_count
+
+    def add_expense(self, group, amount, currency='INR'):
+        return Expense.objects.create(
+            description='Expense', amount=Decimal(amount), currency=currency,
+            paid_by=self.alice, group=group, date=date(2024, 1, 1),
+        )
+
+    def assertRebuildAgrees(self):
+        incremental = {g.pk: self.stats(g) for g in (self.flat, self.trip)}
+        GroupStats.objects.update(expense_count=0, total_spent=0, member_count=0)
+        call_command('rebuild_group_stats', stdout=StringIO())
+        self.assertEqual({g.pk: self.stats(g) for g in (self.flat, self.trip)}, incremental)
+
+    def test_create_edit_and_delete(self):
+        expense = self.add_expense(self.flat, '100.00')
+        self.add_expense(self.flat, '2.50', 'USD')
+        self.assertEqual(self.stats(self.flat), (2, Decimal('300.00'), 2))
+
+        expense.amount = Decimal('150.00')
+        expense.save()
+        self.assertEqual(self.stats(self.flat), (2, Decimal('350.00'), 2))
+
+        expense.group = self.trip
+        expense.save()
+        self.assertEqual(self.stats(self.flat), (1, Decimal('200.00'), 2))
+        self.assertEqual(self.stats(self.trip), (1, Decimal('150.00'), 1))
+        self.assertRebuildAgrees()
+
+        expense.delete()
+        self.assertEqual(self.stats(self.trip), (0, Decimal('0.00'), 1))
+        self.assertRebuildAgrees()
+
+    def test_bulk_create(self):
+        ExpenseWriter.create_expenses([
+            {
+                'description': f'Taxi {i}', 'amount': Decimal('10.00'), 'paid_by': self.alice,
+                'group': self.flat, 'date': date(2024, 1, 1),
+                'shares': [{'user': self.alice}, {'user': self.bob}],
+            }
+            for i in range(3)
+        ], actor=self.alice, notify=False)
+        self.assertEqual(self.stats(self.flat), (3, Decimal('30.00'), 2))
+        self.assertRebuildAgrees()
+
+    def test_membership_changes(self):
+        MembershipService.add_members(self.trip, [self.bob.id, self.carol.id])
+        self.assertEqual(self.stats(self.trip)[2], 3)
+        MembershipService.remove_members(self.trip, [self.carol.id])
+        self.assertEqual(self.stats(self.trip)[2], 2)
+        self.flat.members.remove(self.bob)
+        self.assertEqual(self.stats(self.flat)[2], 1)
+        self.assertRebuildAgrees()
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'groups-tests'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MembershipTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        cls.carol = User.objects.create_user('carol')
+        cls.dave = User.objects.create_user('dave')
+        cls.group = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.group.members.add(cls.alice, cls.bob)
+        Friendship.objects.create(requester=cls.bob, receiver=cls.carol, status='accepted')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        FriendSuggestionEngine.refresh_stale()
+
+    def membership_version(self):
+        return Group.objects.values_list('membership_version', flat=True).get(pk=self.group.pk)
+
+    def suggested(self, user):
+        return set(FriendSuggestion.objects.filter(user=user).values_list('candidate__username', flat=True))
+
+    def test_add_and_remove_keep_derived_state_in_step(self):
+        version = self.membership_version()
+        self.assertEqual(MembershipService.member_ids(self.group), {self.alice.id, self.bob.id})
+
+        added = MembershipService.add_members(self.group, [self.carol.id, self.dave.id, self.bob.id, 'x'])
+        self.assertEqual(added, {self.carol.id: 'carol', self.dave.id: 'dave'})
+        self.assertEqual(
+            MembershipService.member_ids(Group.objects.get(pk=self.group.pk)),
+            {self.alice.id, self.bob.id, self.carol.id, self.dave.id},
+        )
+        self.assertEqual(self.membership_version(), version + 1)
+        self.assertEqual(GroupStats.objects.get(group=self.group).member_count, 4)
+        self.assertEqual(
+            set(SuggestionRefresh.objects.values_list('user_id', flat=True)),
+            {self.alice.id, self.bob.id, self.carol.id, self.dave.id},
+        )
+        FriendSuggestionEngine.refresh_stale()
+        self.assertEqual(self.suggested(self.dave), {'alice', 'bob', 'carol'})
+
+        removed = MembershipService.remove_members(self.group, [self.dave.id, self.carol.id])
+        self.assertEqual(removed, ([self.carol.id, self.dave.id], []))
+        self.assertEqual(MembershipService.member_ids(Group.objects.get(pk=self.group.pk)), {self.alice.id, self.bob.id})
+        self.assertEqual(self.membership_version(), version + 2)
+        self.assertEqual(GroupStats.objects.get(group=self.group).member_count, 2)
+        FriendSuggestionEngine.refresh_stale()
+        self.assertEqual(self.suggested(self.dave), set())
+        self.assertNotIn('dave', self.suggested(self.alice))
+
+    def test_members_with_outstanding_balances_are_kept(self):
+        Balance.objects.create(group=self.group, from_user=self.bob, to_user=self.alice, amount=Decimal('5.00'))
+        self.assertEqual(MembershipService.remove_members(self.group, [self.bob.id]), ([], [self.bob.id]))
+        self.assertTrue(Membership.objects.filter(group_id=self.group.pk, user_id=self.bob.id).exists())
+
+        removed = MembershipService.remove_members(self.group, [self.bob.id], check_balances=False)
+        self.assertEqual(removed, ([self.bob.id], []))
+
+    def test_bulk_members_view(self):
+        url = f'/groups/{self.group.id}/members/bulk/'
+        self.client.force_login(self.bob)
+        # Only friends and co-members can be added
+        response = self.client.post(url, {'add': [self.carol.id, self.dave.id]}, content_type='application/json')
+        self.assertEqual(response.json()['added'], [self.carol.id])
+
+        response = self.client.post(url, {'remove': [self.carol.id]}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Membership.objects.filter(group_id=self.group.pk, user_id=self.carol.id).exists())
+
+        Balance.objects.create(group=self.group, from_user=self.bob, to_user=self.alice, amount=Decimal('5.00'))
+        self.client.force_login(self.alice)
+        response = self.client.post(url, {'remove': [self.carol.id, self.bob.id]}, content_type='application/json')
+        self.assertEqual(response.json(), {
+            'success': True, 'added': [], 'removed': [self.carol.id], 'blocked': [self.bob.id],
+        })
+
+        self.client.force_login(self.dave)
+        self.assertEqual(self.client.post(url, {'add': [self.dave.id]}, content_type='application/json').status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MembershipCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        cls.carol = User.objects.create_user('carol')
+        cls.group = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.group.members.add(cls.alice, cls.bob)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.key = f'group:{self.group.pk}:member_ids'
+
+    def fresh(self):
+        return Group.objects.get(pk=self.group.pk)
+
+    def test_first_miss_fills_the_cache(self):
+        group = self.fresh()
+        with self.assertNumQueries(1):
+            self.assertTrue(MembershipService.is_member(group, self.alice))
+            self.assertFalse(MembershipService.is_member(group, self.carol))
+        self.assertEqual(cache.get(self.key), {self.alice.id, self.bob.id})
+        group = self.fresh()
+        with self.assertNumQueries(0):
+            self.assertTrue(MembershipService.are_members(group, [self.alice, self.bob]))
+
+    def test_m2m_changes_clear_the_cache(self):
+        MembershipService.is_member(self.fresh(), self.alice)
+        self.group.members.add(self.carol)
+        self.assertIsNone(cache.get(self.key))
+        self.assertTrue(MembershipService.is_member(self.fresh(), self.carol))
+
+        self.carol.member_groups.remove(self.group)
+        self.assertIsNone(cache.get(self.key))
+        self.assertFalse(MembershipService.is_member(self.fresh(), self.carol))
+
+    def test_members_changed_clears_the_cache(self):
+        MembershipService.is_member(self.fresh(), self.alice)
+        MembershipService.add_members(self.group, [self.carol.id])
+        self.assertIsNone(cache.get(self.key))
+        self.assertTrue(MembershipService.is_member(self.fresh(), self.carol))
+
+        MembershipService.is_member(self.fresh(), self.alice)
+        MembershipService.remove_members(self.group, [self.carol.id])
+        self.assertIsNone(cache.get(self.key))
+        self.assertFalse(MembershipService.is_member(self.fresh(), self.carol))
+
+    def test_groups_over_the_limit_use_exists(self):
+        with mock.patch('groups.services.MEMBER_IDS_CACHE_LIMIT', 1):
+            self.assertTrue(MembershipService.is_member(self.fresh(), self.alice))
+            self.assertEqual(cache.get(self.key), LARGE_GROUP)
+            group = self.fresh()
+            with self.assertNumQueries(1):
+                self.assertTrue(MembershipService.is_member(group, self.bob))
+
+
+class GroupDetailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        cls.mallory = User.objects.create_user('mallory')
+        cls.group = Group.objects.create(name='Flat', created_by=cls.alice)
+        cls.group.members.add(cls.alice, cls.bob)
+        for i in range(3):
+            expense = Expense.objects.create(
+                description=f'Dinner {i}', amount=Decimal('30.00'),
+                paid_by=cls.alice, group=cls.group, date=date(2024, 1, i + 1),
+            )
+            ExpenseShare.objects.create(expense=expense, user=cls.alice, amount=Decimal('10.00'))
+            ExpenseShare.objects.create(expense=expense, user=cls.bob, amount=Decimal('20.00'))
+        BalanceCalculator.recalculate_group_balances(cls.group)
+
+    def test_outsiders_get_404(self):
+        self.client.force_login(self.mallory)
+        self.assertEqual(self.client.get(f'/groups/{self.group.id}/').status_code, 404)
+
+    def test_position_comes_from_the_ledger_and_expenses_page(self):
+        self.client.force_login(self.bob)
+        with mock.patch('groups.views.GROUP_EXPENSE_PAGE_SIZE', 2):
+            first = self.client.get(f'/groups/{self.group.id}/')
+            second = self.client.get(f'/groups/{self.group.id}/', {'cursor': first.context['next_cursor']})
+
+        self.assertEqual(first.context['total_you_owe'], Decimal('60.00'))
+        self.assertEqual(first.context['net_balance'], Decimal('-60.00'))
+        self.assertEqual(first.context['total_spent'], Decimal('90.00'))
+        self.assertEqual(first.context['total_expenses'], 3)
+        pages = [[e['expense'].description for e in r.context['expenses']] for r in (first, second)]
+        self.assertEqual(pages, [['Dinner 2', 'Dinner 1'], ['Dinner 0']])
+        self.assertIsNone(second.context['next_cursor'])
+        self.assertEqual(first.context['expenses'][0]['shares'][1]['status'], 'You owe ₹20.00')
@@ -3,7 +3,9 @@ from . import views  # ensure this import is correct
 
 urlpatterns = [
     path('<int:group_id>/members/', views.get_group_members, name='get_group_members'),
+    path('<int:group_id>/members/bulk/', views.bulk_members, name='bulk_members'),
     path('', views.group_list, name='group_list'),
+    path('member-picker/', views.member_picker, name='member_picker'),
     path('create/', views.create_group, name='create_group'),
     path('<int:pk>/', views.group_detail, name='group_detail'),
     path('<int:pk>/edit/', views.edit_group, name='edit_group'),
@@ -2,78 +2,85 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import F, Q
 from .models import Group
+from .services import MembershipService
+from activity.utils import log
 from expenses.models import Expense, ExpenseShare
+from core.routers import read_only
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
 @login_required
+@read_only
 def group_list(request):
     """Show all groups that the current user is part of."""
-    groups = Group.objects.filter(Q(members=request.user) | Q(created_by=request.user)).distinct()
+    # Counters come from the denormalized GroupStats row, most recently active first
+    groups = (
+        Group.objects.filter(Q(members=request.user) | Q(created_by=request.user)).distinct()
+        .select_related('stats')
+        .order_by(F('stats__last_activity_at').desc(nulls_last=True), '-created_at')
+    )
     return render(request, 'groups/group_list.html', {'groups': groups})
 
 
-from django.db.models import Sum
+from django.db.models import Sum, Count, Prefetch, prefetch_related_objects
+from decimal import Decimal
+from balances.services import BalanceCalculator
+from core.currency import FxRates, format_money
+from core.deletion import DeletionService
+from core.pagination import paginate_keyset
+from accounts.services import MemberPicker, MEMBER_PICKER_PAGE_SIZE, MAX_MEMBER_PICKER_PAGE_SIZE
 
-from django.shortcuts import render, get_object_or_404
-from .models import Group
-from expenses.models import Expense, ExpenseShare
-from django.db.models import Sum
+GROUP_EXPENSE_PAGE_SIZE = 20
 
-# groups/views.py
-from django.shortcuts import render, get_object_or_404
-from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
-from expenses.models import Expense, ExpenseShare
-from .models import Group
 
 @login_required
+@read_only
 def group_detail(request, pk):
-    group = get_object_or_404(Group, id=pk)
-
-    # Get all expenses for this group
-    expenses = (
-        Expense.objects.filter(group=group)
-        .select_related('paid_by')
-        .prefetch_related('shares__user')
-        .order_by('-created_at')
+    group = get_object_or_404(Group, id=pk, members=request.user)
+    user = request.user
+
+    # The user's position comes straight from the maintained balance ledger
+    position = BalanceCalculator.get_user_balances(user, group)
+    you_owe = position['total_owes']
+    you_are_owed = position['total_owed']
+
+    # One aggregate row per currency, converted once each into the viewer's currency
+    per_currency = list(
+        Expense.objects.filter(group=group).order_by()
+        .values('currency').annotate(total=Sum('amount'), count=Count('id'))
+    )
+    total_spent, unconverted_spent = FxRates.convert_totals(
+        {row['currency']: row['total'] for row in per_currency}, position['currency']
     )
+    members = list(group.members.all())
 
-    # Compute per-user owes/owed
-    you_owe = 0
-    you_are_owed = 0
+    expenses, next_cursor = paginate_keyset(
+        Expense.objects.filter(group=group).select_related('paid_by'),
+        ('created_at', 'id'),
+        request.GET.get('cursor'),
+        GROUP_EXPENSE_PAGE_SIZE,
+    )
+    prefetch_related_objects(
+        expenses,
+        Prefetch('shares', queryset=ExpenseShare.objects.select_related('user')),
+    )
 
-    for expense in expenses:
-        for share in expense.shares.all():
-            # if current user owes money
-            if share.user == request.user and expense.paid_by != request.user:
-                you_owe += float(share.amount)
-            # if someone else owes current user
-            elif expense.paid_by == request.user and share.user != request.user:
-                you_are_owed += float(share.amount)
-
-    net_balance = you_are_owed - you_owe
-
-    # Total group stats
-    total_spent = expenses.aggregate(total=Sum('amount'))['total'] or 0
-    total_expenses = expenses.count()
-    total_members = group.members.count()
-
-    # Prepare expense-share context for HTML loop
+    # Build the per-share status strings for the visible page in one pass
     expense_data = []
     for expense in expenses:
+        payer_is_me = expense.paid_by_id == user.id
         shares_info = []
         for s in expense.shares.all():
-            if s.user == request.user and expense.paid_by != request.user:
-                status = "You owe ₹{:.2f}".format(s.amount)
-            elif expense.paid_by == request.user and s.user != request.user:
-                status = "{} owes you ₹{:.2f}".format(s.user.username, s.amount)
-            elif s.user == expense.paid_by:
-                status = "You paid"
+            if s.user_id == expense.paid_by_id:
+                status = "You paid" if payer_is_me else f"{s.user.username} paid"
+            elif s.user_id == user.id:
+                status = f"You owe {format_money(s.amount, expense.currency)}"
+            elif payer_is_me:
+                status = f"{s.user.username} owes you {format_money(s.amount, expense.currency)}"
             else:
                 status = f"{s.user.username} paid their part"
             shares_info.append({
@@ -88,13 +95,18 @@ def group_detail(request, pk):
 
     context = {
         "group": group,
+        "members": members,
         "expenses": expense_data,
+        "next_cursor": next_cursor,
+        "is_first_page": not request.GET.get('cursor'),
+        "currency": position['currency'],
         "total_spent": total_spent,
-        "total_expenses": total_expenses,
-        "total_members": total_members,
+        "unconverted_spent": unconverted_spent,
+        "total_expenses": sum(row['count'] for row in per_currency),
+        "total_members": len(members),
         "total_you_owe": you_owe,
         "total_you_are_owed": you_are_owed,
-        "net_balance": net_balance,
+        "net_balance": you_are_owed - you_owe,
     }
 
     return render(request, "groups/group_detail.html", context)
@@ -124,23 +136,19 @@ def create_group(request):
             end_date=end,
         )
 
-        # Add creator and selected members
-        group.members.add(request.user)
-        member_ids = request.POST.getlist('members')
+        # Add creator and selected members; only friends and co-members can be picked
+        MembershipService.add_members(
+            group,
+            [request.user.pk, *request.POST.getlist('members')],
+            within=MemberPicker.scope_q(request.user) | Q(pk=request.user.pk),
+        )
 
-        for mid in member_ids:
-            try:
-                user = User.objects.get(id=mid)
-                group.members.add(user)
-            except User.DoesNotExist:
-                continue
+        log(request.user, 'group_created', 'group', group.id, {'name': group.name}, group=group)
 
         messages.success(request, 'Group created successfully!')
         return redirect('group_detail', pk=group.pk)
 
-    # Load all other users for selection
-    users = User.objects.exclude(id=request.user.id)
-    return render(request, 'groups/create_group.html', {'users': users})
+    return render(request, 'groups/create_group.html')
 
 
 @login_required
@@ -166,7 +174,7 @@ def delete_group(request, pk):
     group = get_object_or_404(Group, pk=pk, created_by=request.user)
 
     if request.method == 'POST':
-        group.delete()
+        DeletionService.soft_delete_group(group)
         messages.success(request, "Group deleted successfully!")
         return redirect('group_list')
 
@@ -175,21 +183,18 @@ def delete_group(request, pk):
 
 @login_required
 def add_member(request, pk):
-    group = get_object_or_404(Group, pk=pk)
-    users = User.objects.exclude(id__in=group.members.all())
+    group = get_object_or_404(Group, pk=pk, members=request.user)
 
     if request.method == 'POST':
-        selected_ids = request.POST.getlist('members')
-        for uid in selected_ids:
-            try:
-                user = User.objects.get(id=uid)
-                group.members.add(user)
-            except User.DoesNotExist:
-                continue
+        added = MembershipService.add_members(
+            group, request.POST.getlist('members'), within=MemberPicker.scope_q(request.user)
+        )
+        for user_id, username in added.items():
+            log(request.user, 'member_added', 'user', user_id, {'username': username}, group=group)
         messages.success(request, "Members added successfully!")
         return redirect('group_detail', pk=group.pk)
 
-    return render(request, 'groups/add_member.html', {'group': group, 'users': users})
+    return render(request, 'groups/add_member.html', {'group': group})
 
 
 @login_required
@@ -199,35 +204,133 @@ def remove_member(request, group_id, user_id):
     user_to_remove = get_object_or_404(User, id=user_id)
 
     if request.user == group.created_by or request.user.is_superuser:
-        if user_to_remove in group.members.all():
-            group.members.remove(user_to_remove)
-            messages.success(request, f"{user_to_remove.username} was removed from {group.name}.")
-        else:
+        if not MembershipService.is_member(group, user_to_remove):
             messages.warning(request, "That user is not a member of this group.")
+            return redirect('group_detail', group_id)
+
+        removed, blocked = MembershipService.remove_members(group, [user_to_remove.pk])
+        if removed:
+            log(request.user, 'member_removed', 'user', user_to_remove.id,
+                {'username': user_to_remove.username}, group=group)
+            messages.success(request, f"{user_to_remove.username} was removed from {group.name}.")
+        elif blocked:
+            messages.error(request, f"{user_to_remove.username} still has unsettled balances in this group. Settle up first.")
     else:
         messages.error(request, "You don’t have permission to remove members from this group.")
 
     return redirect('group_detail', group_id)
 
 
+import json
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+from core.http import conditional_on
 from .models import Group
 
+
+def group_members_marker(request, group_id):
+    """Membership version of a group the user belongs to, or None (view then 404s)"""
+    version = Group.objects.filter(id=group_id, members=request.user).values_list(
+        'membership_version', flat=True
+    ).first()
+    return None if version is None else ((group_id, version), None)
+
+
 @login_required
+@conditional_on(group_members_marker)
 def get_group_members(request, group_id):
-    print(f"🔍 DEBUG: get_group_members called for group_id={group_id}")
     try:
         group = Group.objects.get(id=group_id, members=request.user)
     except Group.DoesNotExist:
-        print("❌ Group not found or access denied")
         return JsonResponse({"success": False, "error": "Group not found or access denied"}, status=404)
 
     members = group.members.all()
-    print(f"✅ Found members: {[m.username for m in members]}")
-
     data = [
         {"id": m.id, "username": m.username, "name": m.get_full_name() or m.username}
         for m in members
     ]
     return JsonResponse({"success": True, "members": data})
+
+
+@login_required
+def member_picker(request):
+    """
+    One page of people the user can add to a group (friends and co-members),
+    filtered by `q` and paged with `cursor`. With `group`, existing members
+    of that group are left out.
+    """
+    exclude_group = None
+    if request.GET.get('group'):
+        try:
+            group_id = int(request.GET['group'])
+        except ValueError:
+            return JsonResponse({"success": False, "error": "`group` must be a group id"}, status=400)
+        exclude_group = Group.objects.filter(id=group_id, members=request.user).first()
+        if exclude_group is None:
+            return JsonResponse({"success": False, "error": "Group not found or access denied"}, status=404)
+
+    try:
+        page_size = min(int(request.GET.get('page_size', MEMBER_PICKER_PAGE_SIZE)), MAX_MEMBER_PICKER_PAGE_SIZE)
+    except ValueError:
+        page_size = MEMBER_PICKER_PAGE_SIZE
+
+    users, next_cursor = MemberPicker.page(
+        request.user,
+        query=request.GET.get('q', ''),
+        cursor=request.GET.get('cursor'),
+        page_size=max(page_size, 1),
+        exclude_group=exclude_group,
+    )
+    return JsonResponse({
+        "success": True,
+        "results": [
+            {"id": u.id, "username": u.username, "name": u.get_full_name() or u.username}
+            for u in users
+        ],
+        "next_cursor": next_cursor,
+    })
+
+
+@login_required
+@require_POST
+def bulk_members(request, group_id):
+    """
+    Add and/or remove many members at once. Takes `add` and `remove` id lists
+    as JSON or form fields. Adds are open to any member and limited to their
+    friends and co-members. Removals need the group creator and skip anyone
+    with an outstanding balance.
+    """
+    group = Group.objects.filter(id=group_id, members=request.user).first()
+    if group is None:
+        return JsonResponse({"success": False, "error": "Group not found or access denied"}, status=404)
+
+    if request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"success": False, "error": "Invalid JSON"}, status=400)
+        to_add, to_remove = payload.get('add') or [], payload.get('remove') or []
+    else:
+        to_add, to_remove = request.POST.getlist('add'), request.POST.getlist('remove')
+    if not isinstance(to_add, list) or not isinstance(to_remove, list):
+        return JsonResponse({"success": False, "error": "`add` and `remove` must be lists of user ids"}, status=400)
+
+    if to_remove and not (request.user == group.created_by or request.user.is_superuser):
+        return JsonResponse({"success": False, "error": "Only the group creator can remove members"}, status=403)
+
+    added = MembershipService.add_members(group, to_add, within=MemberPicker.scope_q(request.user))
+    removed, blocked = MembershipService.remove_members(group, to_remove) if to_remove else ([], [])
+
+    for user_id, username in added.items():
+        log(request.user, 'member_added', 'user', user_id, {'username': username}, group=group)
+    if removed:
+        for user_id, username in User.objects.filter(id__in=removed).values_list('id', 'username'):
+            log(request.user, 'member_removed', 'user', user_id, {'username': username}, group=group)
+
+    return JsonResponse({
+        "success": True,
+        "added": sorted(added),
+        "removed": removed,
+        "blocked": blocked,
+    })
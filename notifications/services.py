@@ -1,21 +1,28 @@
 # ============================================
 # notifications/services.py
 # ============================================
+import logging
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.urls import reverse
 from .models import Notification, NotificationPreference
 from django.db import models
-from django.contrib.auth.models import User
+from accounts.models import User
 from django.utils import timezone
 from expenses.models import Expense, Group
+from activity.archive import HistoryArchiver
+from core.currency import format_money
+from core.profiling import profiled
+
+logger = logging.getLogger(__name__)
 
 
 class NotificationService:
     """Service for creating and sending notifications"""
     
     @staticmethod
+    @profiled('notifications.create')
     def create_notification(recipient, notification_type, title, message, 
                           sender=None, expense=None, group=None, action_url=''):
         """Create a new notification"""
@@ -52,6 +59,7 @@ class NotificationService:
         return notification
     
     @staticmethod
+    @profiled('notifications.expense_added')
     def notify_expense_added(expense, recipients=None):
         """Notify users when an expense is added"""
         if recipients is None:
@@ -59,7 +67,7 @@ class NotificationService:
             recipients = expense.group.members.exclude(id=expense.paid_by.id)
         
         title = f"New expense in {expense.group.name}"
-        message = f"{expense.paid_by.username} added '{expense.description}' (₹{expense.amount})"
+        message = f"{expense.paid_by.username} added '{expense.description}' ({format_money(expense.amount, expense.currency)})"
         action_url = reverse('expenses:expense_detail', kwargs={'expense_id': expense.id})
         
         for recipient in recipients:
@@ -75,6 +83,7 @@ class NotificationService:
             )
     
     @staticmethod
+    @profiled('notifications.expense_edited')
     def notify_expense_edited(expense, editor):
         """Notify users when an expense is edited"""
         recipients = expense.shares.exclude(user=editor).values_list('user', flat=True)
@@ -97,6 +106,7 @@ class NotificationService:
             )
     
     @staticmethod
+    @profiled('notifications.expense_deleted')
     def notify_expense_deleted(expense_data, deleter):
         """Notify users when an expense is deleted"""
         # expense_data should contain: description, group, affected_users
@@ -117,10 +127,10 @@ class NotificationService:
                 )
     
     @staticmethod
-    def notify_payment_received(payer, payee, amount, group):
+    def notify_payment_received(payer, payee, amount, group, currency=None):
         """Notify when a payment is received"""
         title = "Payment received"
-        message = f"{payer.username} paid you ₹{amount}"
+        message = f"{payer.username} paid you {format_money(amount, currency)}"
         action_url = reverse('balances:user_balances')
         
         NotificationService.create_notification(
@@ -151,6 +161,7 @@ class NotificationService:
         )
     
     @staticmethod
+    @profiled('notifications.email')
     def send_email_notification(notification):
         """Send email notification"""
         try:
@@ -177,7 +188,7 @@ class NotificationService:
             )
         except Exception as e:
             # Log error but don't break the flow
-            print(f"Error sending email notification: {e}")
+            logger.warning("Error sending email notification %s: %s", notification.id, e)
     
     @staticmethod
     def get_unread_count(user):
@@ -191,3 +202,10 @@ class NotificationService:
             is_read=True,
             read_at=timezone.now()
         )
+
+    @staticmethod
+    def archived_page(user, cursor=None, page_size=30):
+        """Read-through to archive_history segments for notifications older than the live table keeps"""
+        return HistoryArchiver.page(
+            'notifications.Notification', lambda row: row['recipient_id'] == user.id, cursor, page_size
+        )
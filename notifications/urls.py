@@ -12,6 +12,7 @@ urlpatterns = [
     path('mark-all-read/', views.mark_all_as_read, name='mark_all_as_read'),
     path('preferences/', views.notification_preferences, name='notification_preferences'),
     path('api/unread/', views.get_unread_notifications, name='get_unread'),
+    path('api/archived/', views.archived_notifications, name='archived'),
     path('', views.notification_list, name='notification_list'),
     path('get_unread/', views.get_unread_notifications, name='get_unread'),
     path('mark-all-read/', views.mark_all_read, name='mark_all_read'),
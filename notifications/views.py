@@ -6,11 +6,18 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
+from django.db.models import Count, Max
+from django.utils import timezone
+from core.http import conditional_on
+from core.routers import read_only
 from .models import Notification, NotificationPreference
 from .services import NotificationService
 
+ARCHIVE_PAGE_SIZE = 30
+
 
 @login_required
+@read_only
 def notification_list(request):
     """List all notifications for the user"""
     notifications = Notification.objects.filter(recipient=request.user)
@@ -98,7 +105,16 @@ def notification_preferences(request):
     return render(request, 'notifications/preferences.html', context)
 
 
+def _unread_marker(request):
+    """(unread count, newest unread id) plus the newest unread timestamp, in one aggregate"""
+    marker = Notification.objects.filter(recipient=request.user, is_read=False).aggregate(
+        count=Count('id'), newest_id=Max('id'), newest=Max('created_at')
+    )
+    return (marker['count'], marker['newest_id']), marker['newest']
+
+
 @login_required
+@conditional_on(_unread_marker)
 def get_unread_notifications(request):
     """API endpoint to get unread notifications count"""
     unread_count = NotificationService.get_unread_count(request.user)
@@ -124,20 +140,32 @@ def get_unread_notifications(request):
         'notifications': notifications_data
     })
 
-from django.http import JsonResponse
-from django.contrib.auth.decorators import login_required
-from django.shortcuts import redirect
-from .models import Notification
-
-@login_required
-def get_unread_notifications(request):
-    """Return unread notification count as JSON (for 🔔 badge)"""
-    count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-    return JsonResponse({'unread_count': count})
-
-
 @login_required
 def mark_all_read(request):
     """Mark all notifications as read for the current user"""
-    Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+    Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True, read_at=timezone.now())
     return redirect('notifications:notification_list')
+
+
+@login_required
+def archived_notifications(request):
+    """Notifications moved out by archive_history, newest first; ?cursor= pages on (created_at, id)"""
+    rows, next_cursor = NotificationService.archived_page(
+        request.user, request.GET.get('cursor'), ARCHIVE_PAGE_SIZE
+    )
+    return JsonResponse({
+        'results': [
+            {
+                'id': row['id'],
+                'notification_type': row['notification_type'],
+                'title': row['title'],
+                'message': row['message'],
+                'action_url': row['action_url'],
+                'is_read': row['is_read'],
+                'created_at': row['created_at'].isoformat(),
+                'archived': True,
+            }
+            for row in rows
+        ],
+        'next_cursor': next_cursor,
+    })
@@ -48,13 +48,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'activity.middleware.ActivityBufferMiddleware',
 ]
 
 ROOT_URLCONF = 'splitwise_clone.urls'
@@ -78,12 +82,38 @@ WSGI_APPLICATION = 'splitwise_clone.wsgi.application'
 ASGI_APPLICATION = 'splitwise_clone.asgi.application'
 
 
+# core.db.sqlite3 applies WAL, busy_timeout and cache pragmas to every connection.
+# Connections persist for CONN_MAX_AGE seconds instead of reopening per request.
+SQLITE_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    'pragmas': {'busy_timeout': 5000},
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Views marked core.routers.read_only read from here. By default it is the same file
+    # opened query-only. Point NAME at a copy kept fresh by `manage.py replicate_sqlite`
+    # (or at a real replica) to move those reads off the primary.
+    'read': {
+        'ENGINE': 'core.db.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {'read_only': True},
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
 }
+DATABASE_ROUTERS = ['core.routers.ReadWriteRouter']
+# After a write, that client's reads stay on the primary this long (signed pin cookie)
+REPLICA_STICKY_SECONDS = 10
+
+# Tests run on `default` only; see core.testing.TestRunner
+TEST_RUNNER = 'core.testing.TestRunner'
 
 AUTH_USER_MODEL = 'accounts.User'  
 
@@ -167,6 +197,61 @@ LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'index'
 
 
+# History retention (see `manage.py archive_history`)
+ARCHIVE_ROOT = BASE_DIR / 'archive'
+ACTIVITY_RETENTION_DAYS = 365
+NOTIFICATION_RETENTION_DAYS = 180
+
+# Rows per DELETE when reap_deleted removes soft-deleted groups and accounts
+DELETION_BATCH_SIZE = 1000
+
+# Currency conversion; rates are loaded from a local file by load_fx_rates
+FX_BASE_CURRENCY = 'INR'
+FX_RATES_FILE = BASE_DIR / 'fx_rates.json'
+FX_RATE_CACHE_SECONDS = 300
+
+# Per-request instrumentation (core.middleware.RequestMetricsMiddleware)
+REQUEST_METRICS_ENABLED = True
+REQUEST_METRICS_RING_SIZE = 200
+REQUEST_METRICS_SLOW_MS = 500
+
+# Staff-only per-request cProfile capture via the X-Profile header (core.middleware.ProfilingMiddleware)
+PROFILING_ENABLED = True
+PROFILING_TOP_N = 30
+PROFILING_DUMP_DIR = None
+
+# Group commit for concurrent writes to one group (balances.services.GroupWriteCoordinator)
+GROUP_COMMIT_MAX_BATCH = 50
+GROUP_COMMIT_WINDOW_MS = 0
+
+# Retries carrying the same Idempotency-Key replay the first response (core.idempotency)
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+IDEMPOTENCY_LOCK_SECONDS = 60
+
+# Per-request lines in development only (core.testing.TestRunner quiets them under tests)
+APP_LOG_LEVEL = 'INFO' if DEBUG else 'WARNING'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '{asctime} {levelname} {name} {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+    'loggers': {
+        'splitwise.requests': {'handlers': ['console'], 'level': APP_LOG_LEVEL, 'propagate': False},
+        'splitwise.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'expenses': {'level': APP_LOG_LEVEL},
+        'groups': {'level': APP_LOG_LEVEL},
+        'balances': {'level': APP_LOG_LEVEL},
+        'notifications': {'level': APP_LOG_LEVEL},
+    },
+}
+
+
 # Email backend for development (prints reset link in console)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'Splitwise <noreply@splitwise.local>'
@@ -4,7 +4,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from accounts import views_frontend as account_views
-from expenses.views_dashboard import dashboard_view
+from expenses.views_dashboard import dashboard_view, analytics_api
 from accounts.views_frontend import index
 
 urlpatterns = [
@@ -16,6 +16,7 @@ urlpatterns = [
 
     # === Dashboard ===
     path('dashboard/', dashboard_view, name='dashboard'),
+    path('dashboard/analytics/', analytics_api, name='analytics_api'),
 
     # === Frontend (User-facing HTML) ===
     path('', include(('accounts.urls_frontend', 'accounts'), namespace='accounts')),  # ✅ your register/login/friends pages
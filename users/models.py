@@ -3,8 +3,20 @@ from django.conf import settings
 
 
 class Friendship(models.Model):
+    """
+    Symmetric lookup index over accepted accounts.Friendship rows: one row per
+    direction, so "friends of X" is a single scan of the (user, friend) index.
+    Written only by accounts.services.FriendshipService.
+    """
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='friendships')
     friend = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='friends_of')
+    link = models.ForeignKey(
+        'accounts.Friendship',
+        on_delete=models.CASCADE,
+        related_name='edges',
+        null=True,
+        blank=True
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -5,13 +5,15 @@ from django.contrib.auth import get_user_model
 from django.db.models import Q
 from . import models
 from .models import Friendship
+from accounts.services import UserSearchIndex, FriendshipService
 
 User = get_user_model()
 
+SEARCH_RESULTS_LIMIT = 50
+
 @login_required
 def friends_list(request):
-    # get all friendships where current user is involved
-    friends = Friendship.objects.filter(user=request.user) | Friendship.objects.filter(friend=request.user)
+    friends = FriendshipService.friends(request.user)
     return render(request, 'users/friends_list.html', {'friends': friends})
 
 @login_required
@@ -20,17 +22,14 @@ def add_friend(request, user_id):
     if friend_user == request.user:
         messages.error(request, "You can’t add yourself.")
     else:
-        # create symmetrical friendship (both ways)
-        Friendship.objects.get_or_create(user=request.user, friend=friend_user)
-        Friendship.objects.get_or_create(user=friend_user, friend=request.user)
+        FriendshipService.befriend(request.user, friend_user)
         messages.success(request, f"{friend_user.username} added as a friend!")
     return redirect('friends_list')
 
 @login_required
 def remove_friend(request, user_id):
     friend_user = get_object_or_404(User, id=user_id)
-    Friendship.objects.filter(user=request.user, friend=friend_user).delete()
-    Friendship.objects.filter(user=friend_user, friend=request.user).delete()
+    FriendshipService.unfriend(request.user, friend_user)
     messages.info(request, f"Removed {friend_user.username} from your friends.")
     return redirect('friends_list')
 
@@ -40,10 +39,7 @@ def find_friends(request):
     results = []
 
     if query:
-        results = User.objects.filter(
-            Q(username__icontains=query) |
-            Q(email__icontains=query)
-        ).exclude(id=request.user.id)
+        results = UserSearchIndex.search(query, limit=SEARCH_RESULTS_LIMIT, exclude_ids=[request.user.id])
 
     return render(request, 'users/find_friends.html', {'results': results, 'query': query})
 
@@ -57,7 +53,5 @@ User = get_user_model()
 
 @login_required
 def friends_list(request):
-    friends = User.objects.filter(
-        Q(friends_of__user=request.user) | Q(friendships__friend=request.user)
-    ).distinct()
+    friends = FriendshipService.friends(request.user)
     return render(request, "users/friends_list.html", {"friends": friends})